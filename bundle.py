@@ -0,0 +1,162 @@
+import copy
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, Iterator, List, Tuple
+
+import streamlit as st
+
+from output_formatter import OutputFormatter, PdfRenderJob, get_pdf_executor
+
+# 1回にまとめて作成できる人数の上限
+MAX_BUNDLE_STUDENTS = 100
+
+# まとめて作成するときの出力形式
+BUNDLE_PDF = 1  # 全員分を1つのPDFに（解答は最後にまとめる）
+BUNDLE_ZIP = 2  # 1人ずつのPDFと、全員分の解答のPDFをZIPに
+
+# ZIPの各PDFを描画するプロセス数（環境変数で変更可能、1ならプロセスを使わずに描画）
+BUNDLE_WORKER_COUNT = int(os.environ.get('MATH_CREATOR_BUNDLE_WORKERS', os.cpu_count() or 1))
+
+ANSWER_KEY_FILE_NAME = "解答.pdf"
+
+
+def variant_seed(base_seed: int, student: int) -> str:
+    """生徒ごとの乱数の種（同じ設定・種・番号からは同じ問題ができる）"""
+    return f"{base_seed}:{student}"
+
+
+def bundle_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """まとめて作成・採点するときの設定（網羅モードは全組み合わせを出せるよう問題数を上限にする）
+
+    問題バンクは問題が増えると抽出結果が変わり、採点時に同じ問題を作り直せないため、
+    問題の出どころの設定にかかわらず、その場で生成する。
+    """
+    from main import COVERAGE_QUESTION_LIMIT
+
+    settings = copy.deepcopy(settings)
+    settings['problem_source'] = 1
+    if settings['generation_mode'] == 2:
+        settings['question_count'] = COVERAGE_QUESTION_LIMIT
+    return settings
+
+
+def student_title(settings: Dict[str, Any], student: int) -> str:
+    return f"{settings['header_text']}（{student}番）"
+
+
+def generate_variant(settings: Dict[str, Any], base_seed: int, student: int) -> List[Dict[str, Any]]:
+    """1人分の問題の行を作る"""
+    from main import MathProblemGenerator
+
+    generator = MathProblemGenerator(copy.deepcopy(settings))
+    return generator.generate_problem_rows(seed=variant_seed(base_seed, student))
+
+
+def iter_variants(settings: Dict[str, Any], base_seed: int, student_count: int,
+                  rows_callback=None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """(タイトル, 問題の行) を1人分ずつ作る（描画が進んだ分だけ生成する）
+
+    rows_callback には1人目の問題数を渡す（進捗の総ページ数の見積もり直し用）。
+    """
+    for student in range(1, student_count + 1):
+        rows = generate_variant(settings, base_seed, student)
+        if student == 1 and rows_callback is not None:
+            rows_callback(len(rows))
+        yield student_title(settings, student), rows
+
+
+def answer_pairs(rows: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    return [(str(row['ばんごう']), str(row['せいかい'])) for row in rows]
+
+
+def _render_student(renderer: OutputFormatter, settings: Dict[str, Any], base_seed: int,
+                    student: int) -> Tuple[bytes, List[Tuple[str, str]]]:
+    """1人分のPDF（解答シートなし）と解答を作る（ワーカープロセスで実行）"""
+    renderer.register_fonts()
+    rows = generate_variant(settings, base_seed, student)
+    buffer = io.BytesIO()
+    renderer.create_pdf_stream([(student_title(settings, student), rows)], settings, buffer, answer_sheet=False)
+    return buffer.getvalue(), answer_pairs(rows)
+
+
+@st.cache_resource
+def get_bundle_executor() -> ProcessPoolExecutor:
+    """ZIPの各PDFを描画するプロセスプール（プロセス全体で共有）
+
+    ReportLabの描画はGILを手放さないため、複数コアを使うにはプロセスに分ける。
+    Streamlitのスレッドを抱えたプロセスをforkしないよう、spawnで起動する。
+    """
+    return ProcessPoolExecutor(max_workers=BUNDLE_WORKER_COUNT, mp_context=multiprocessing.get_context('spawn'))
+
+
+def render_bundle_pdf(renderer: OutputFormatter, settings: Dict[str, Any], student_count: int, base_seed: int,
+                      progress_callback=None, rows_callback=None) -> io.BytesIO:
+    """全員分を1つのPDFにする（生成と描画を1人分ずつ進める）"""
+    buffer = io.BytesIO()
+    renderer.create_pdf_stream(
+        iter_variants(settings, base_seed, student_count, rows_callback), settings, buffer,
+        progress_callback=progress_callback, answer_key_at_end=True
+    )
+    buffer.seek(0)
+    return buffer
+
+
+def render_bundle_zip(renderer: OutputFormatter, settings: Dict[str, Any], student_count: int, base_seed: int,
+                      progress_callback=None) -> io.BytesIO:
+    """1人ずつのPDFと全員分の解答をZIPにする（各PDFはプロセスプールで並列に描画）"""
+    students = range(1, student_count + 1)
+    if BUNDLE_WORKER_COUNT > 1:
+        results = get_bundle_executor().map(
+            _render_student, repeat(renderer), repeat(settings), repeat(base_seed), students
+        )
+    else:
+        results = (_render_student(renderer, settings, base_seed, student) for student in students)
+
+    buffer = io.BytesIO()
+    answer_keys = []
+    # PDFは圧縮済みなので、ZIPでは圧縮せずに格納する
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for student, (pdf_data, pairs) in zip(students, results):
+            title = student_title(settings, student)
+            archive.writestr(f"{student:03d}_{title}.pdf", pdf_data)
+            answer_keys.append((f"解答（{title}）", pairs))
+            if progress_callback is not None:
+                progress_callback(student)
+
+        answer_key = io.BytesIO()
+        renderer.create_answer_key_pdf(answer_keys, answer_key)
+        archive.writestr(ANSWER_KEY_FILE_NAME, answer_key.getvalue())
+    buffer.seek(0)
+    return buffer
+
+
+def submit_bundle_job(formatter: OutputFormatter, settings: Dict[str, Any], student_count: int, base_seed: int,
+                      bundle_format: int) -> PdfRenderJob:
+    """クラス分のプリントの作成をワーカープールに投入し、進捗を追跡できるジョブを返す"""
+    # フォントの設定と警告の表示はメインスレッドで済ませておく（各ワーカーは同じフォントを使う）
+    formatter.prepare_fonts()
+    renderer = formatter.snapshot()
+    settings = bundle_settings(settings)
+
+    if bundle_format == BUNDLE_ZIP:
+        job = PdfRenderJob(f"{settings['header_text']}_{student_count}人分_{base_seed}.zip", student_count, unit="人分")
+        job.future = get_pdf_executor().submit(
+            render_bundle_zip, renderer, settings, student_count, base_seed, job.update_progress
+        )
+        return job
+
+    def estimate_total(row_count):
+        # 網羅モードの問題数は組み合わせの数で決まる（question_count は上限）ので、
+        # 1人目の問題ができた時点で総ページ数を見積もり直す（描画はその後に始まる）
+        job.update_total(renderer.estimate_pages(row_count, True, settings) * student_count)
+
+    pages = renderer.estimate_pages(settings['question_count'], True, settings) * student_count
+    job = PdfRenderJob(f"{settings['header_text']}_{student_count}人分_{base_seed}.pdf", pages)
+    job.future = get_pdf_executor().submit(
+        render_bundle_pdf, renderer, settings, student_count, base_seed, job.update_progress, estimate_total
+    )
+    return job
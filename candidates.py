@@ -0,0 +1,277 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from difficulty import carry_mask, difficulty_features, difficulty_scores
+from rules import RuleSet, compile_rules, operand_variables, rule_lines, settings_rules
+
+# 演算子ごとの設定項目の接頭辞
+OPERATOR_PREFIX = {"+": 'add', "-": 'sub', "*": 'mul', "/": 'div'}
+
+# 網羅モードで列挙する組み合わせの上限
+ENUMERATION_LIMIT = 1000000
+
+
+class CandidateBlock:
+    """同じ演算子の問題候補をまとめて扱うブロック
+
+    オペランドは行列（行が1問）で持ち、答えの計算・条件の判定・難しさの特徴量を
+    すべてNumPyの配列演算で行う。条件を満たす行だけをPythonの値に変換して使う。
+    """
+
+    def __init__(self, settings: Dict[str, Any], operator: str, operands: np.ndarray,
+                 rng: Optional[np.random.Generator] = None, adjust_division: bool = True):
+        self.settings = settings
+        self.operator = operator
+        self.operands = np.asarray(operands, dtype=np.int64)
+        if operator == "/" and adjust_division:
+            self._adjust_division(rng or np.random.default_rng())
+        self._calculate_answers()
+        self._features = None
+        self.valid = self._valid_mask()
+
+    def _adjust_division(self, rng: np.random.Generator) -> None:
+        """わり算の除数の0を1にし、余りなしの場合は被除数を除数の積の倍数にする"""
+        self.operands[:, 1:] = np.where(self.operands[:, 1:] == 0, 1, self.operands[:, 1:])
+        if self.settings['div_limit'] != 1:
+            return
+        product = self.operands[:, 1:].prod(axis=1)
+        low = np.maximum(1, self.settings['value_min'] // product)
+        high = self.settings['value_max'] // product
+        multiplier = rng.integers(np.minimum(low, high), np.maximum(low, high), endpoint=True)
+        dividend = product * multiplier
+        self.operands[:, 0] = np.where(dividend == 0, product, dividend)
+
+    def _calculate_answers(self) -> None:
+        """答え（数値）と余りを計算（余りなしのわり算は小数、左から順に計算）"""
+        operands = self.operands
+        self.remainders = np.zeros(len(operands), dtype=np.int64)
+        self.computable = np.ones(len(operands), dtype=bool)
+        if self.operator == "+":
+            self.values = operands.sum(axis=1)
+        elif self.operator == "-":
+            self.values = operands[:, 0] - operands[:, 1:].sum(axis=1)
+        elif self.operator == "*":
+            self.values = operands.prod(axis=1)
+        elif self.settings['div_limit'] == 1:
+            self.values = operands[:, 0] / operands[:, 1:].prod(axis=1)
+        else:
+            # 余りありのわり算は最後の割り算でだけ余りを出せる
+            quotient = operands[:, 0].copy()
+            for column in range(1, operands.shape[1]):
+                if column < operands.shape[1] - 1:
+                    self.computable &= quotient % operands[:, column] == 0
+                self.remainders = quotient % operands[:, column]
+                quotient //= operands[:, column]
+            self.values = quotient
+
+    def _valid_mask(self) -> np.ndarray:
+        """設定画面の制限と自由入力のルール、難しさの指定をすべて満たす行"""
+        settings = self.settings
+        mask = self.computable.copy()
+        rule_set = compile_rules(settings_rules(settings, self.operator) + rule_lines(settings.get('custom_rules', '')))
+        if rule_set:
+            mask &= rule_set.mask(self.operator, self.rule_variables(rule_set), len(mask))
+
+        carry_mode = settings.get('carry_mode', 1)
+        if carry_mode != 1:
+            mask &= carry_mask(self.features, self.operator, carry_mode)
+        return mask
+
+    def rule_variables(self, rule_set: RuleSet) -> Dict[str, np.ndarray]:
+        """ルールが使う値の配列（難しさの特徴量は使うときだけ計算）"""
+        variables = operand_variables(self.operands, rule_set.names)
+        variables['answer'] = self.values
+        variables['remainder'] = self.remainders
+        if rule_set.names & {'carries', 'borrows', 'regroups', 'steps'}:
+            features = self.features
+            variables['carries'] = features['carries']
+            variables['borrows'] = features['borrows']
+            variables['regroups'] = features['carries'] + features['borrows']
+            variables['steps'] = features['mul_steps']
+        return variables
+
+    @property
+    def features(self) -> Dict[str, np.ndarray]:
+        """難しさの特徴量（必要になったときに計算）"""
+        if self._features is None:
+            self._features = difficulty_features(self.operands, self.operator)
+        return self._features
+
+    @property
+    def scores(self) -> np.ndarray:
+        return difficulty_scores(self.features)
+
+    def answer(self, index: int) -> Any:
+        """1行分の答え（余りなしのわり算は小数、余りありは「商 余り 余り」の文字列）"""
+        if self.operator == "/" and self.settings['div_limit'] == 1:
+            return float(self.values[index])
+        if self.remainders[index] != 0:
+            return f"{int(self.values[index])} 余り {int(self.remainders[index])}"
+        return int(self.values[index])
+
+
+def operand_ranges(settings: Dict[str, Any], operator: str) -> List[Tuple[int, int]]:
+    """項ごとのオペランドの範囲（add_min1, add_max1, add_min2, ... の設定、項数分）"""
+    prefix = OPERATOR_PREFIX[operator]
+    ranges = []
+    for i in range(1, settings['term_count'] + 1):
+        # 項ごとの設定がない古い設定では2項目の範囲を使う
+        low = settings.get(f'{prefix}_min{i}', settings[f'{prefix}_min2'])
+        high = settings.get(f'{prefix}_max{i}', settings[f'{prefix}_max2'])
+        ranges.append((min(low, high), max(low, high)))
+    return ranges
+
+
+def answer_bounds(settings: Dict[str, Any], operator: str) -> Tuple[float, float]:
+    """設定画面の制限（rules.settings_rulesと同じもの）から決まる答えの範囲"""
+    low, high = -np.inf, np.inf
+    if operator == "+":
+        if settings['add_limit'] == 1:
+            high = 10
+        elif settings['add_limit'] == 2:
+            low, high = 11, 20
+    elif operator == "-":
+        if settings['sub_limit'] == 1:
+            low = 1
+    elif operator == "*":
+        if settings['mul_limit'] == 1:
+            high = 100
+    if settings['value_limit_enabled'] == 2 and operator != "/":
+        low, high = max(low, settings['value_min']), min(high, settings['value_max'])
+    return low, high
+
+
+def _reachable(operator: str, ranges: List[Tuple[int, int]]) -> Optional[Tuple[float, float]]:
+    """範囲内のオペランドで作れる答えの範囲（区間演算、求められない演算はNone）"""
+    lows = [low for low, _ in ranges]
+    highs = [high for _, high in ranges]
+    if operator == "+":
+        return sum(lows), sum(highs)
+    if operator == "-":
+        return lows[0] - sum(highs[1:]), highs[0] - sum(lows[1:])
+    if operator == "*" and min(lows) >= 0:
+        return float(np.prod(lows, dtype=np.float64)), float(np.prod(highs, dtype=np.float64))
+    return None
+
+
+def tighten_ranges(settings: Dict[str, Any], operator: str) -> Optional[List[Tuple[int, int]]]:
+    """答えの範囲に届かない値を各項の範囲から除く（どの組み合わせも条件を満たせなければNone）
+
+    ほかの項の範囲から区間演算で各項の上限・下限を求め、変化がなくなるまで繰り返す。
+    範囲の中は一様なままなので、出題の確率は変わらず、棄却される候補だけが減る。
+    """
+    ranges = operand_ranges(settings, operator)
+    low, high = answer_bounds(settings, operator)
+    if operator == "/" or (low == -np.inf and high == np.inf):
+        return ranges
+
+    for _ in range(len(ranges) + 1):
+        reachable = _reachable(operator, ranges)
+        if reachable is None:
+            return ranges
+        if reachable[0] > high or reachable[1] < low:
+            return None
+        tightened = []
+        for i, (term_low, term_high) in enumerate(ranges):
+            others = ranges[:i] + ranges[i + 1:]
+            if operator == "+":
+                other_low, other_high = _reachable("+", others)
+                term_low, term_high = max(term_low, low - other_high), min(term_high, high - other_low)
+            elif operator == "-" and i == 0:
+                other_low, other_high = _reachable("+", others)
+                term_low, term_high = max(term_low, low + other_low), min(term_high, high + other_high)
+            elif operator == "-":
+                rest_low, rest_high = _reachable("+", others[1:]) if len(others) > 1 else (0, 0)
+                term_low = max(term_low, ranges[0][0] - high - rest_high)
+                term_high = min(term_high, ranges[0][1] - low - rest_low)
+            elif operator == "*" and min(r[0] for r in others) >= 1:
+                other_low, other_high = _reachable("*", others)
+                term_high = min(term_high, int(high // other_low)) if high != np.inf else term_high
+                term_low = max(term_low, int(-(-low // other_high))) if low > 0 else term_low
+            tightened.append((int(term_low), int(term_high)))
+        if any(term_low > term_high for term_low, term_high in tightened):
+            return None
+        if tightened == ranges:
+            break
+        ranges = tightened
+    return ranges
+
+
+def sample_block(settings: Dict[str, Any], operator: str, size: int, rng: np.random.Generator) -> CandidateBlock:
+    """設定の範囲でオペランドをランダムに作ったブロック（答えの制限に届かない値は最初から除く）"""
+    ranges = tighten_ranges(settings, operator)
+    if ranges is None:
+        # 条件を満たす組み合わせがないので候補は作らない
+        return CandidateBlock(settings, operator, np.zeros((0, settings['term_count']), dtype=np.int64), rng)
+    columns = [rng.integers(low, high, size=size, endpoint=True) for low, high in ranges]
+    return CandidateBlock(settings, operator, np.column_stack(columns), rng)
+
+
+def enumerate_operands(settings: Dict[str, Any], operator: str, limit: int = ENUMERATION_LIMIT,
+                       rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """範囲内のオペランドの組み合わせをすべて列挙（網羅モード用）
+
+    1項目から順に途中までの組み合わせを広げ、途中までの和・差・積と残りの項の範囲から
+    答えの範囲に届かない組み合わせはその時点で除く。
+    組み合わせがlimitを超える場合は、途中までの組み合わせをランダムに間引く。
+    """
+    ranges = tighten_ranges(settings, operator)
+    if ranges is None:
+        return np.zeros((0, settings['term_count']), dtype=np.int64)
+    low, high = answer_bounds(settings, operator)
+    rng = rng or np.random.default_rng()
+
+    prefixes = np.zeros((1, 0), dtype=np.int64)
+    for i, (term_low, term_high) in enumerate(ranges):
+        values = np.arange(term_low, term_high + 1, dtype=np.int64)
+        if len(prefixes) * len(values) > limit:
+            prefixes = prefixes[rng.choice(len(prefixes), max(1, limit // len(values)), replace=False)]
+        prefixes = np.column_stack([np.repeat(prefixes, len(values), axis=0), np.tile(values, len(prefixes))])
+
+        rest = ranges[i + 1:]
+        if operator in ("+", "-") and (low > -np.inf or high < np.inf):
+            partial = prefixes[:, 0] - prefixes[:, 1:].sum(axis=1) if operator == "-" else prefixes.sum(axis=1)
+            rest_low, rest_high = _reachable("+", rest) if rest else (0, 0)
+            if operator == "+":
+                keep = (partial + rest_low <= high) & (partial + rest_high >= low)
+            else:
+                keep = (partial - rest_high <= high) & (partial - rest_low >= low)
+            prefixes = prefixes[keep]
+        elif operator == "*" and term_low >= 0 and all(r[0] >= 0 for r in rest) and (low > -np.inf or high < np.inf):
+            partial = prefixes.prod(axis=1)
+            rest_low, rest_high = _reachable("*", rest) if rest else (1, 1)
+            prefixes = prefixes[(partial * rest_low <= high) & (partial * rest_high >= low)]
+    return prefixes
+
+
+# 均等に出題する基準（設定のbalance_mode）
+BALANCE_NONE = 1  # 指定なし（一様にランダム）
+BALANCE_ANSWER = 2  # 答え
+BALANCE_FIRST_OPERAND = 3  # 1項目の数
+BALANCE_DIFFICULTY = 4  # 難しさ
+
+
+def stratum_values(block: CandidateBlock, balance_mode: int) -> np.ndarray:
+    """均等にする基準の値（行ごと）"""
+    if balance_mode == BALANCE_ANSWER:
+        return block.values
+    if balance_mode == BALANCE_FIRST_OPERAND:
+        return block.operands[:, 0]
+    return block.scores
+
+
+def balanced_order(operators: np.ndarray, strata: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """層（演算子と基準の値の組）から1つずつ順に取り出す並び
+
+    層の中はランダムな順にし、各層のk番目をまとめてランダムに並べたものをk=0, 1, ... の順につなぐ。
+    先頭から何問取っても層ごとの数の差は1以内になり、問題の少ない層の分は自然に他の層で埋まる。
+    """
+    _, inverse = np.unique(np.column_stack([operators, strata]), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    shuffled = rng.permutation(len(inverse))
+    grouped = shuffled[np.argsort(inverse[shuffled], kind='stable')]
+    sorted_strata = inverse[grouped]
+    starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    ranks = np.arange(len(grouped)) - np.repeat(starts, np.diff(np.r_[starts, len(grouped)]))
+    return grouped[np.lexsort((rng.random(len(grouped)), ranks))]
@@ -1,6 +1,7 @@
 import streamlit as st
 from typing import Dict, Any
 from display_settings import show_display_settings
+from rules import RULE_VARIABLES, check_rules
 
 def show_detailed_settings(generator):
     """詳細設定ページを表示"""
@@ -9,7 +10,7 @@ def show_detailed_settings(generator):
     # st.info(f"💡 **現在の項数: {generator.settings['term_count']}項** - 数値範囲は項数に応じて調整されます。")
     
     # タブで設定を分離
-    tab1, tab2, tab3 = st.tabs(["数値範囲", "制約設定", "表示設定"])
+    tab1, tab2, tab3, tab4 = st.tabs(["数値範囲", "制約設定", "表示設定", "問題バンク"])
     
     with tab1:
         st.subheader("数値範囲設定")
@@ -68,11 +69,12 @@ def show_detailed_settings(generator):
                         f"加数{i} 範囲",
                         min_value=1,
                         max_value=20,
-                        value=(1, 10),
+                        value=(generator.settings[f'add_min{i}'], generator.settings[f'add_max{i}']),
                         key=f"add_range{i}_slider"
                     )
-                    # 追加の数値範囲を設定に保存（必要に応じて実装）
-                    st.caption(f"範囲: {add_range_extra[0]} ～ {add_range_extra[1]}")
+                    generator.settings[f'add_min{i}'] = add_range_extra[0]
+                    generator.settings[f'add_max{i}'] = add_range_extra[1]
+                    st.caption(f"範囲: {generator.settings[f'add_min{i}']} ～ {generator.settings[f'add_max{i}']}")
         
         # 引き算の範囲設定
         with st.expander("➖ 引き算の範囲設定", expanded=False):
@@ -117,10 +119,12 @@ def show_detailed_settings(generator):
                         f"減数{i} 範囲",
                         min_value=1,
                         max_value=20,
-                        value=(1, 10),
+                        value=(generator.settings[f'sub_min{i}'], generator.settings[f'sub_max{i}']),
                         key=f"sub_range{i}_slider"
                     )
-                    st.caption(f"範囲: {sub_range_extra[0]} ～ {sub_range_extra[1]}")
+                    generator.settings[f'sub_min{i}'] = sub_range_extra[0]
+                    generator.settings[f'sub_max{i}'] = sub_range_extra[1]
+                    st.caption(f"範囲: {generator.settings[f'sub_min{i}']} ～ {generator.settings[f'sub_max{i}']}")
         
         # かけ算の範囲設定
         with st.expander("✖️ かけ算の範囲設定", expanded=False):
@@ -165,10 +169,12 @@ def show_detailed_settings(generator):
                         f"乗数{i} 範囲",
                         min_value=1,
                         max_value=12,
-                        value=(1, 9),
+                        value=(generator.settings[f'mul_min{i}'], generator.settings[f'mul_max{i}']),
                         key=f"mul_range{i}_slider"
                     )
-                    st.caption(f"範囲: {mul_range_extra[0]} ～ {mul_range_extra[1]}")
+                    generator.settings[f'mul_min{i}'] = mul_range_extra[0]
+                    generator.settings[f'mul_max{i}'] = mul_range_extra[1]
+                    st.caption(f"範囲: {generator.settings[f'mul_min{i}']} ～ {generator.settings[f'mul_max{i}']}")
         
         # わり算の範囲設定
         with st.expander("➗ わり算の範囲設定", expanded=False):
@@ -213,10 +219,47 @@ def show_detailed_settings(generator):
                         f"除数{i} 範囲",
                         min_value=1,
                         max_value=12,
-                        value=(1, 9),
+                        value=(generator.settings[f'div_min{i}'], generator.settings[f'div_max{i}']),
                         key=f"div_range{i}_slider"
                     )
-                    st.caption(f"範囲: {div_range_extra[0]} ～ {div_range_extra[1]}")
+                    generator.settings[f'div_min{i}'] = div_range_extra[0]
+                    generator.settings[f'div_max{i}'] = div_range_extra[1]
+                    st.caption(f"範囲: {generator.settings[f'div_min{i}']} ～ {generator.settings[f'div_max{i}']}")
+        
+        # 計算の順序（混合式）の範囲設定
+        with st.expander("🧮 計算の順序の範囲設定", expanded=False):
+            st.write("💡 **計算の順序について**\n\n"
+                   "• 問題形式「計算の順序」では、12 - 3 × 2 + 4 のように1問の中で＋－×÷が混ざった式を出します\n"
+                   "• かけ算・わり算を先に計算し、途中の値はすべて0以上の整数（わり算は割り切れる）になります\n"
+                   "• 項数は基本設定の項数を使います")
+            
+            expr_range = st.slider(
+                "式に使う数の範囲",
+                min_value=0,
+                max_value=20,
+                value=(generator.settings['expr_min'], generator.settings['expr_max']),
+                key="expr_range_slider"
+            )
+            generator.settings['expr_min'] = expr_range[0]
+            generator.settings['expr_max'] = expr_range[1]
+            
+            expr_answer_range = st.slider(
+                "答えの範囲",
+                min_value=0,
+                max_value=200,
+                value=(generator.settings['expr_answer_min'], generator.settings['expr_answer_max']),
+                key="expr_answer_range_slider"
+            )
+            generator.settings['expr_answer_min'] = expr_answer_range[0]
+            generator.settings['expr_answer_max'] = expr_answer_range[1]
+            
+            expr_operators = st.selectbox(
+                "使う計算",
+                options=[1, 2],
+                format_func=lambda x: {1: "＋ － ×", 2: "＋ － × ÷"}[x],
+                index=generator.settings['expr_operators'] - 1
+            )
+            generator.settings['expr_operators'] = expr_operators
     
     with tab2:
         st.subheader("🔒 制約設定")
@@ -262,6 +305,52 @@ def show_detailed_settings(generator):
         generator.settings['div_limit'] = div_limit
         st.write("💡 **わり算制限**: わり算で余りがある問題を含めるかどうかを設定します。余りなしは簡単、余りありは難しい問題になります。")
         
+        dedup_commutative = st.checkbox(
+            "順番を入れ替えただけの問題を同じ問題とみなす",
+            value=generator.settings.get('dedup_commutative', False)
+        )
+        generator.settings['dedup_commutative'] = dedup_commutative
+        st.write("💡 **重複の判定**: オンにすると、3+5と5+3のように足し算・かけ算の順番を入れ替えただけの問題を1つのプリントに両方は出しません。")
+
+        # 繰り上がり・繰り下がりの設定
+        carry_mode = st.selectbox(
+            "繰り上がり・繰り下がり",
+            options=[1, 2, 3],
+            format_func=lambda x: {1: "指定なし", 2: "なし", 3: "あり"}[x],
+            index=generator.settings.get('carry_mode', 1) - 1
+        )
+        generator.settings['carry_mode'] = carry_mode
+        sort_by_difficulty = st.checkbox(
+            "やさしい問題から順に並べる",
+            value=generator.settings.get('sort_by_difficulty', False)
+        )
+        generator.settings['sort_by_difficulty'] = sort_by_difficulty
+        balance_mode = st.selectbox(
+            "出題のかたより",
+            options=[1, 2, 3, 4],
+            format_func=lambda x: {1: "指定なし（ランダム）", 2: "答えが均等になるように", 3: "1項目の数が均等になるように", 4: "難しさが均等になるように"}[x],
+            index=generator.settings.get('balance_mode', 1) - 1
+        )
+        generator.settings['balance_mode'] = balance_mode
+        st.write("💡 **難しさの設定**: 足し算・引き算の筆算で繰り上がり・繰り下がりがある問題だけ、またはない問題だけを出せます。並べ替えは繰り上がり・繰り下がりの回数、かけ算の筆算の手数、わり算の余りをもとにします。均等に出題する設定では、答えなどの値ごとの問題数の差がなるべく1問以内になるように選びます。")
+        
+        # 自由入力のルール
+        custom_rules = st.text_area(
+            "出題ルール（1行に1つ）",
+            value=generator.settings.get('custom_rules', ''),
+            placeholder="answer % 2 == 0\nb <= a\n+: answer in [11, 18]"
+        )
+        rule_errors = check_rules(custom_rules, generator.settings['term_count'])
+        if rule_errors:
+            # 誤りのあるルールは保存せず、前のルールのままにする
+            for message in rule_errors:
+                st.error(message)
+        else:
+            generator.settings['custom_rules'] = custom_rules
+        variables = "、".join(f"{name}: {description}" for name, description in RULE_VARIABLES.items())
+        st.write(f"💡 **出題ルール**: すべてのルールを満たす問題だけを出します。a, b, c, ... は左から1項目, 2項目, ... の数です。使える値は {variables}。"
+                 "「answer in [11, 18]」は11以上18以下、行頭に「+:」のように書くとその計算だけに使います。")
+        
         # 値制限設定
         value_limit_enabled = st.selectbox(
             "解の値制限",
@@ -285,4 +374,45 @@ def show_detailed_settings(generator):
             st.caption(f"範囲: {generator.settings['value_min']} ～ {generator.settings['value_max']}")
     
     with tab3:
-        show_display_settings(generator) 
\ No newline at end of file
+        show_display_settings(generator)
+    
+    with tab4:
+        show_problem_bank_settings(generator)
+
+def show_problem_bank_settings(generator):
+    """問題バンクの設定"""
+    from problem_bank import get_problem_bank
+    
+    st.subheader("🗃️ 問題バンク")
+    st.write("💡 **問題バンクについて**\n\n"
+           "• 作った問題をローカルのデータベースに蓄積します\n"
+           "• 「問題バンクから抽出」にすると、毎回生成する代わりに蓄積した問題から条件に合うものを選びます")
+    
+    if generator.settings['problem_type'] == generator.EXPRESSION_TYPE:
+        st.info("計算の順序の問題は問題バンクを使わず、毎回その場で生成します。")
+        return
+    
+    problem_source = st.radio(
+        "問題の作り方",
+        options=[1, 2],
+        format_func=lambda x: {1: "その場で生成", 2: "問題バンクから抽出"}[x],
+        index=generator.settings.get('problem_source', 1) - 1,
+        key="problem_source_radio"
+    )
+    generator.settings['problem_source'] = problem_source
+    
+    bank = get_problem_bank()
+    matched = sum(
+        bank.count(**bank.settings_filters(generator.settings, operator))
+        for operator in generator.OPERATOR_MAP.get(generator.settings['problem_type'], ["+"])
+    )
+    st.caption(f"蓄積済み: {bank.count()}問（現在の設定に合う問題: {matched}問）")
+    
+    if st.button("➕ 現在の設定で問題バンクに追加", use_container_width=True, key="fill_problem_bank"):
+        with st.spinner("問題バンクに追加中..."):
+            added = bank.fill(generator)
+            # 抽出はプロセス間で共有できるメモリマップ版から行う
+            from mmap_bank import export_problem_bank
+            export_problem_bank(bank)
+        st.success(f"{added}問を追加しました")
+        st.rerun() 
\ No newline at end of file
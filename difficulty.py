@@ -0,0 +1,100 @@
+from typing import Dict
+
+import numpy as np
+
+# 繰り上がり・繰り下がりの指定（設定のcarry_mode）
+CARRY_ANY = 1  # 指定なし
+CARRY_NONE = 2  # 繰り上がり・繰り下がりなし
+CARRY_REQUIRED = 3  # 繰り上がり・繰り下がりあり
+
+
+def _digit_count(operands: np.ndarray) -> int:
+    largest = int(operands.max()) if operands.size else 0
+    return max(1, len(str(max(largest, 0))))
+
+
+def carry_counts(operands: np.ndarray) -> np.ndarray:
+    """足し算の筆算で繰り上がりが起きる桁の数（行ごと）
+
+    全オペランドの同じ桁を足し、前の桁からの繰り上がりを加えて10以上になる桁を数える。
+    """
+    operands = np.maximum(np.asarray(operands, dtype=np.int64), 0)
+    counts = np.zeros(len(operands), dtype=np.int64)
+    carry = np.zeros(len(operands), dtype=np.int64)
+    place = 1
+    for _ in range(_digit_count(operands) + 1):
+        column = (operands // place % 10).sum(axis=1) + carry
+        carry = column // 10
+        counts += carry > 0
+        place *= 10
+    return counts
+
+
+def borrow_counts(operands: np.ndarray) -> np.ndarray:
+    """引き算の筆算で繰り下がりが起きる桁の数（行ごと、答えが負になる行は0）"""
+    operands = np.maximum(np.asarray(operands, dtype=np.int64), 0)
+    minuend, subtrahends = operands[:, 0], operands[:, 1:]
+    counts = np.zeros(len(operands), dtype=np.int64)
+    borrow = np.zeros(len(operands), dtype=np.int64)
+    place = 1
+    for _ in range(_digit_count(operands)):
+        column = minuend // place % 10 - (subtrahends // place % 10).sum(axis=1) - borrow
+        borrow = np.where(column < 0, (9 - column) // 10, 0)
+        counts += borrow > 0
+        place *= 10
+    counts[minuend < subtrahends.sum(axis=1)] = 0
+    return counts
+
+
+def multiplication_steps(operands: np.ndarray) -> np.ndarray:
+    """かけ算の筆算で行う1桁どうしのかけ算の回数（各オペランドの桁数の積）"""
+    operands = np.maximum(np.asarray(operands, dtype=np.int64), 0)
+    digits = np.ones(operands.shape, dtype=np.int64)
+    place = 10
+    for _ in range(_digit_count(operands) - 1):
+        digits += operands >= place
+        place *= 10
+    return digits.prod(axis=1)
+
+
+def remainder_flags(operands: np.ndarray) -> np.ndarray:
+    """わり算を左から順に行ったときに余りが出るか（行ごと）"""
+    operands = np.asarray(operands, dtype=np.int64)
+    quotient = operands[:, 0].copy()
+    flags = np.zeros(len(operands), dtype=bool)
+    for column in range(1, operands.shape[1]):
+        divisor = np.where(operands[:, column] == 0, 1, operands[:, column])
+        flags |= quotient % divisor != 0
+        quotient //= divisor
+    return flags
+
+
+def difficulty_features(operands: np.ndarray, operator: str) -> Dict[str, np.ndarray]:
+    """演算子に応じた難しさの特徴量（その演算に関係しないものは0）"""
+    operands = np.asarray(operands, dtype=np.int64)
+    zeros = np.zeros(len(operands), dtype=np.int64)
+    return {
+        'carries': carry_counts(operands) if operator == "+" else zeros,
+        'borrows': borrow_counts(operands) if operator == "-" else zeros,
+        'mul_steps': multiplication_steps(operands) if operator == "*" else zeros,
+        'has_remainder': remainder_flags(operands) if operator == "/" else zeros.astype(bool),
+    }
+
+
+def difficulty_scores(features: Dict[str, np.ndarray]) -> np.ndarray:
+    """並べ替え用の難しさ（繰り上がり・繰り下がりの数＋筆算の手数＋余り）"""
+    return (
+        features['carries'] + features['borrows']
+        + np.maximum(features['mul_steps'] - 1, 0)
+        + features['has_remainder'].astype(np.int64)
+    )
+
+
+def carry_mask(features: Dict[str, np.ndarray], operator: str, carry_mode: int) -> np.ndarray:
+    """繰り上がり・繰り下がりの指定に合う行（足し算・引き算以外は絞り込まない）"""
+    regroups = features['carries'] + features['borrows']
+    if operator not in ("+", "-") or carry_mode == CARRY_ANY:
+        return np.ones(len(regroups), dtype=bool)
+    if carry_mode == CARRY_NONE:
+        return regroups == 0
+    return regroups > 0
@@ -17,6 +17,27 @@ def show_display_settings(generator):
     generator.settings['answer_display'] = answer_display
     st.write("💡 **解答欄表示**: 解答の表示方法を選択します。あり：同じ画面に表示、なし：解答を隠す、別シート：解答を別画面に表示。")
     
+    if answer_display == 3:
+        answer_key_layout = st.selectbox(
+            "解答シートのレイアウト",
+            options=[1, 2],
+            format_func=lambda x: {1: "標準", 2: "コンパクト"}[x],
+            index=st.session_state.output_styles.get('answer_key_layout', 1) - 1,
+            key="answer_key_layout_selectbox"
+        )
+        st.session_state.output_styles['answer_key_layout'] = answer_key_layout
+        
+        if answer_key_layout == 2:
+            answer_key_pairs_per_row = st.slider(
+                "1行に並べる解答の数",
+                min_value=3,
+                max_value=8,
+                value=st.session_state.output_styles.get('answer_key_pairs_per_row', 5),
+                key="answer_key_pairs_per_row_slider"
+            )
+            st.session_state.output_styles['answer_key_pairs_per_row'] = answer_key_pairs_per_row
+        st.write("💡 **解答シートのレイアウト**: コンパクトにすると番号と正解を1行に複数並べ、小さな文字で1ページにまとめます。")
+    
     show_answer_column = st.checkbox(
         "答え欄の表示",
         value=generator.settings.get('show_answer_column', True)
@@ -115,4 +136,124 @@ def show_display_settings(generator):
         st.session_state.output_styles['header_row_height'] = header_row_height
         st.caption(f"ヘッダー行の高さ: {header_row_height}ポイント")
     
- 
\ No newline at end of file
+    # PDFの描画方式
+    st.markdown("---")
+    st.subheader("🗂️ PDF描画設定")
+    problem_layout = st.selectbox(
+        "問題のレイアウト",
+        options=[1, 2],
+        format_func=lambda x: {1: "横書き（表）", 2: "筆算"}[x],
+        index=st.session_state.output_styles.get('problem_layout', 1) - 1,
+        key="problem_layout_selectbox"
+    )
+    st.session_state.output_styles['problem_layout'] = problem_layout
+    st.write("💡 **問題のレイアウト**: 筆算にすると、たし算・ひき算・かけ算は位をそろえて縦に、わり算はわり算の筆算の形で、1問ずつ枠に入れて印刷します。混合式など筆算にできない問題は枠の中に横書きで表示します。")
+    
+    if problem_layout == 2:
+        col1, col2 = st.columns(2)
+        with col1:
+            vertical_columns = st.slider(
+                "横に並べる問題の数",
+                min_value=2,
+                max_value=4,
+                value=st.session_state.output_styles.get('vertical_columns', 3),
+                key="vertical_columns_slider"
+            )
+            st.session_state.output_styles['vertical_columns'] = vertical_columns
+        with col2:
+            vertical_cell_size = st.slider(
+                "マス目の大きさ (ポイント)",
+                min_value=14,
+                max_value=24,
+                value=st.session_state.output_styles.get('vertical_cell_size', 18),
+                key="vertical_cell_size_slider"
+            )
+            st.session_state.output_styles['vertical_cell_size'] = vertical_cell_size
+        st.caption("マス目は枠の幅に収まる大きさまで小さくなります")
+    
+    pdf_use_forms = st.checkbox(
+        "共通部分を再利用して描画",
+        value=st.session_state.output_styles.get('pdf_use_forms', False),
+        key="pdf_use_forms_checkbox"
+    )
+    st.session_state.output_styles['pdf_use_forms'] = pdf_use_forms
+    st.write("💡 **共通部分の再利用**: タイトル・ヘッダー行・答え欄の枠を1回だけ描画し、各ページで使い回します。ページ数が多いPDFのファイルサイズと生成時間を減らせます。")
+    
+    print_preview_mode = st.checkbox(
+        "プレビューモード",
+        value=generator.settings.get('print_preview_mode', False),
+        key="print_preview_mode_checkbox"
+    )
+    generator.settings['print_preview_mode'] = print_preview_mode
+    st.write("💡 **プレビューモード**: 問題生成時は1ページ目だけをすぐに表示し、PDF全体はダウンロードするときに作成します。網羅モードなど問題数が多いときに便利です。")
+    
+    pdf_profile = st.selectbox(
+        "PDF出力プロファイル",
+        options=[1, 2, 3],
+        format_func=lambda x: {1: "標準", 2: "コンパクト", 3: "フォント埋め込み"}[x],
+        index=st.session_state.output_styles.get('pdf_profile', 1) - 1,
+        key="pdf_profile_selectbox"
+    )
+    st.session_state.output_styles['pdf_profile'] = pdf_profile
+    st.write("💡 **出力プロファイル**: 標準：従来どおり、コンパクト：ファイルサイズを小さくします、フォント埋め込み：使用する文字だけをPDFに埋め込み、どの環境でも同じ見た目で表示されます。")
+    
+    if pdf_profile == 3:
+        pdf_embed_font_path = st.text_input(
+            "埋め込むフォントファイル（.ttf / .ttc）",
+            value=st.session_state.output_styles.get('pdf_embed_font_path', ''),
+            key="pdf_embed_font_path_input"
+        )
+        st.session_state.output_styles['pdf_embed_font_path'] = pdf_embed_font_path
+        st.caption("空欄の場合はWindows・Linux・macOSの標準的な場所からフォントを探します。")
+    
+     
+    # ブラウザ印刷（HTML）の設定
+    st.markdown("---")
+    st.subheader("🖨️ ブラウザ印刷設定")
+    st.write("💡 **ブラウザ印刷**: 「ブラウザで印刷（HTML）」で作る印刷用のページの余白・段数・枠線を設定します。PDFの出力には影響しません。")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        print_margin = st.slider(
+            "余白 (mm)",
+            min_value=5,
+            max_value=40,
+            value=generator.settings['print_margin'],
+            key="print_margin_slider"
+        )
+        generator.settings['print_margin'] = print_margin
+        
+        print_columns = st.slider(
+            "段数",
+            min_value=1,
+            max_value=4,
+            value=generator.settings['print_columns'],
+            key="print_columns_slider"
+        )
+        generator.settings['print_columns'] = print_columns
+    
+    with col2:
+        print_show_border = st.checkbox(
+            "問題ごとに枠線を表示",
+            value=generator.settings['print_show_border'],
+            key="print_show_border_checkbox"
+        )
+        generator.settings['print_show_border'] = print_show_border
+        
+        if print_show_border:
+            print_border_width = st.slider(
+                "枠線の幅 (px)",
+                min_value=1,
+                max_value=5,
+                value=generator.settings['print_border_width'],
+                key="print_border_width_slider"
+            )
+            generator.settings['print_border_width'] = print_border_width
+        
+        print_show_grid = st.checkbox(
+            "段の区切り線を表示",
+            value=generator.settings['print_show_grid'],
+            key="print_show_grid_checkbox"
+        )
+        generator.settings['print_show_grid'] = print_show_grid
@@ -0,0 +1,202 @@
+import argparse
+import codecs
+import sys
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 書き出しの形式（拡張子 → 表示名）
+EXPORT_FORMATS = {
+    'csv': "CSV",
+    'jsonl': "JSON Lines",
+    'xlsx': "Excel（XLSX）",
+}
+
+EXPORT_MIME_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# 1回に文字列へ変換する行数（DataFrame全体の文字列を一度に作らない）
+EXPORT_CHUNK_ROWS = 5000
+
+# 書き出さない列（生徒が記入する空の答え欄）
+EXCLUDED_COLUMNS = ('こたえ',)
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{sheets}</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_XLSX_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_FOOTER = '</sheetData></worksheet>'
+
+
+def export_tables(problems_df: pd.DataFrame, answers_df: pd.DataFrame) -> List[Tuple[str, pd.DataFrame]]:
+    """書き出す表（シート名, 表）。問題の表は正解の列も含むので、それだけで解答付きの問題集になる"""
+    columns = [column for column in problems_df.columns if column not in EXCLUDED_COLUMNS]
+    return [("もんだい", problems_df[columns]), ("解答", answers_df)]
+
+
+def iter_chunks(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """表を行の範囲ごとに切り出す（ilocの範囲指定なので列のデータは複製しない）"""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_csv(df: pd.DataFrame, output: BinaryIO) -> None:
+    """CSV（Excelで文字化けしないようBOM付きUTF-8）"""
+    output.write(codecs.BOM_UTF8)
+    if len(df) == 0:
+        output.write(df.to_csv(index=False).encode('utf-8'))
+    for i, chunk in enumerate(iter_chunks(df)):
+        output.write(chunk.to_csv(header=i == 0, index=False).encode('utf-8'))
+
+
+def write_jsonl(df: pd.DataFrame, output: BinaryIO) -> None:
+    """1行に1問のJSON（to_jsonのlines形式は各行を改行で終える）"""
+    for chunk in iter_chunks(df):
+        output.write(chunk.to_json(orient='records', lines=True, force_ascii=False).encode('utf-8'))
+
+
+def _xml_escape(values: pd.Series) -> pd.Series:
+    return (values.str.replace('&', '&amp;', regex=False)
+            .str.replace('<', '&lt;', regex=False)
+            .str.replace('>', '&gt;', regex=False))
+
+
+def _xlsx_cells(values: pd.Series) -> pd.Series:
+    """1列分のセルのXML（数値は数値のセル、それ以外は文字列のセル）"""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return '<c><v>' + values.astype(str) + '</v></c>'
+    numeric = values.map(lambda v: isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, bool))
+    text = values.astype(str)
+    strings = '<c t="inlineStr"><is><t xml:space="preserve">' + _xml_escape(text) + '</t></is></c>'
+    return strings.where(~numeric, '<c><v>' + text + '</v></c>')
+
+
+def _xlsx_rows(df: pd.DataFrame) -> Iterator[str]:
+    """見出し行と、行の範囲ごとのシートのXML（列ごとに文字列の配列演算で組み立てる）"""
+    header = pd.Series([str(column) for column in df.columns])
+    yield '<row>' + ''.join(_xlsx_cells(header)) + '</row>'
+    for chunk in iter_chunks(df):
+        rows = pd.Series('<row>', index=chunk.index)
+        for column in chunk.columns:
+            rows = rows + _xlsx_cells(chunk[column])
+        yield ''.join(rows + '</row>')
+
+
+def write_xlsx(tables: List[Tuple[str, pd.DataFrame]], output: BinaryIO) -> None:
+    """表ごとに1シートのXLSX（シートのXMLはZIPの中へ直接書き出し、全体を組み立てない）"""
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        overrides = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(tables) + 1)
+        )
+        archive.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES.format(sheets=overrides))
+        archive.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        sheets = ''.join(
+            f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, (name, _) in enumerate(tables, start=1)
+        )
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets>{sheets}</sheets></workbook>'
+        ))
+        relationships = ''.join(
+            f'<Relationship Id="rId{i}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, len(tables) + 1)
+        )
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{relationships}</Relationships>'
+        ))
+        for i, (_, df) in enumerate(tables, start=1):
+            with archive.open(f'xl/worksheets/sheet{i}.xml', 'w') as sheet:
+                sheet.write(_XLSX_SHEET_HEADER.encode('utf-8'))
+                for xml in _xlsx_rows(df):
+                    sheet.write(xml.encode('utf-8'))
+                sheet.write(_XLSX_SHEET_FOOTER.encode('utf-8'))
+
+
+def write_export(export_format: str, problems_df: pd.DataFrame, answers_df: pd.DataFrame, output: BinaryIO,
+                 answers_only: bool = False) -> None:
+    """問題（または解答）を指定の形式で output へ書き出す
+
+    CSV・JSON Linesは1つの表（既定は正解付きの問題、answers_only=Trueなら解答）、
+    XLSXは問題と解答を別のシートにする。
+    """
+    tables = export_tables(problems_df, answers_df)
+    if export_format == 'xlsx':
+        write_xlsx(tables, output)
+        return
+    df = tables[1][1] if answers_only else tables[0][1]
+    if export_format == 'csv':
+        write_csv(df, output)
+    elif export_format == 'jsonl':
+        write_jsonl(df, output)
+    else:
+        raise ValueError(f"未対応の形式です: {export_format}")
+
+
+def load_settings(preset: str = None) -> Dict[str, Any]:
+    """コマンドラインから使う設定（プリセット名を指定しなければ既定の設定）"""
+    from main import MathProblemGenerator
+    from presets import get_preset_store
+
+    settings = MathProblemGenerator.default_settings()
+    if preset:
+        data = get_preset_store().load(preset)
+        if data is None:
+            raise SystemExit(f"プリセット「{preset}」が見つかりません")
+        settings.update(data['settings'])
+    return settings
+
+
+def main(argv: List[str] = None) -> None:
+    """問題を生成して、CSV・JSON Lines・XLSXのファイル（または標準出力）へ書き出す"""
+    from bundle import bundle_settings
+    from main import MathProblemGenerator
+
+    parser = argparse.ArgumentParser(description="けいさんドリルの問題を書き出す")
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--preset', help="使うプリセット名（省略時は既定の設定）")
+    parser.add_argument('--seed', help="乱数の種（同じ種なら同じ問題）")
+    parser.add_argument('--answers-only', action='store_true', help="CSV・JSON Linesで解答だけを書き出す")
+    parser.add_argument('--output', '-o', default='-', help="出力先のファイル（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    generator = MathProblemGenerator(bundle_settings(load_settings(args.preset)))
+    problems_df, answers_df = generator.problem_dataframes(generator.generate_problem_rows(seed=args.seed))
+    if args.output == '-':
+        write_export(args.format, problems_df, answers_df, sys.stdout.buffer, args.answers_only)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, 'wb') as f:
+            write_export(args.format, problems_df, answers_df, f, args.answers_only)
+
+
+if __name__ == "__main__":
+    main()
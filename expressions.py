@@ -0,0 +1,229 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 混合式に使う演算子の組（設定のexpr_operators）
+EXPR_OPERATORS = {
+    1: ("+", "-", "*"),  # たし算・ひき算・かけ算
+    2: ("+", "-", "*", "/"),  # 四則すべて
+}
+
+# 式の途中に出てくる値の上限（かけ算の積・途中までの計算結果）
+EXPR_VALUE_LIMIT = 999
+
+# 同じ形の式を作るときに使い回す、途中の値の集合の数
+MAX_CACHED_SHAPES = 512
+
+ADDITIVE = ("+", "-")
+
+SYMBOLS = {"+": "+", "-": "-", "*": "×", "/": "÷"}
+
+
+def format_expression(nums: List[int], operators: List[str]) -> str:
+    """混合式の問題文（例: 12 - 3 × 2 + 4）"""
+    result = str(nums[0])
+    for num, operator in zip(nums[1:], operators):
+        result += f" {SYMBOLS[operator]} {num}"
+    return result
+
+
+def evaluate_expression(nums: List[int], operators: List[str]) -> Optional[int]:
+    """かけ算・わり算を先に、左から順に計算した答え（割り切れない・負になる途中の値があればNone）"""
+    total, term, sign = 0, nums[0], 1
+    for num, operator in zip(nums[1:], operators):
+        if operator == "*":
+            term *= num
+        elif operator == "/":
+            if num == 0 or term % num != 0:
+                return None
+            term //= num
+        else:
+            total += sign * term
+            if total < 0:
+                return None
+            term, sign = num, (1 if operator == "+" else -1)
+    total += sign * term
+    return total if total >= 0 else None
+
+
+class ExpressionShape:
+    """演算子の並びが決まった式の、途中の値として取りうる値の集合
+
+    式を「＋・－でつながる項」に分け、各項（×・÷の連なり）について
+    左から計算したときの途中の値の集合を真偽値配列で持つ。
+    さらに後ろの項から順に「この途中の和から答えの範囲に届くか」を求めておき、
+    値を前から選ぶときに、答えに届く値だけを選べるようにする。
+    """
+
+    def __init__(self, operators: Tuple[str, ...], factors: np.ndarray, answer_low: int, answer_high: int):
+        self.operators = operators
+        self.factors = factors
+        self.divisors = factors[factors > 0]
+
+        # 項ごとの演算子（×・÷）と、項の前の符号
+        self.terms: List[List[str]] = [[]]
+        self.signs: List[str] = ["+"]
+        for operator in operators:
+            if operator in ADDITIVE:
+                self.terms.append([])
+                self.signs.append(operator)
+            else:
+                self.terms[-1].append(operator)
+        self.term_sets = [self._chain_sets(chain) for chain in self.terms]
+
+        # reachable[j][r]: j項目まで計算した和がrのとき、残りの項で答えの範囲に届くか
+        size = EXPR_VALUE_LIMIT + 1
+        target = np.zeros(size, dtype=bool)
+        target[max(answer_low, 0):min(answer_high, EXPR_VALUE_LIMIT) + 1] = True
+        self.reachable = [target]
+        for sign, sets in zip(reversed(self.signs[1:]), reversed(self.term_sets[1:])):
+            self.reachable.insert(0, self._shift_any(self.reachable[0], np.flatnonzero(sets[-1]), sign))
+        self.feasible = bool(np.any(self.term_sets[0][-1] & self.reachable[0]))
+
+    def _chain_sets(self, chain: List[str]) -> List[np.ndarray]:
+        """×・÷の連なりを左から計算したときの、各段階で取りうる値"""
+        size = EXPR_VALUE_LIMIT + 1
+        current = np.zeros(size, dtype=bool)
+        current[self.factors[self.factors < size]] = True
+        sets = [current]
+        for operator in chain:
+            values = np.flatnonzero(current)
+            following = np.zeros(size, dtype=bool)
+            if operator == "*":
+                products = np.outer(values, self.factors).ravel()
+                following[products[products < size]] = True
+            else:
+                dividends = np.repeat(values, len(self.divisors))
+                divisors = np.tile(self.divisors, len(values))
+                exact = dividends % divisors == 0
+                following[dividends[exact] // divisors[exact]] = True
+            current = following
+            sets.append(current)
+        return sets
+
+    @staticmethod
+    def _shift_any(reachable: np.ndarray, values: np.ndarray, sign: str) -> np.ndarray:
+        """和がrのときに値のどれかを足す（引く）と reachable に入るrの集合"""
+        size = len(reachable)
+        result = np.zeros(size, dtype=bool)
+        for value in values:
+            if sign == "+":
+                result[:size - value] |= reachable[value:]
+            else:
+                result[value:] |= reachable[:size - value]
+        return result
+
+    def sample(self, rng: np.random.Generator) -> Tuple[List[int], int]:
+        """答えの範囲に入る数の並びと答えを1つ作る（選び直しは起きない）"""
+        total = 0
+        term_values = []
+        for j, (sign, sets) in enumerate(zip(self.signs, self.term_sets)):
+            values = np.flatnonzero(sets[-1])
+            results = total + values if sign == "+" else total - values
+            ok = (results >= 0) & (results <= EXPR_VALUE_LIMIT)
+            ok[ok] = self.reachable[j][results[ok]]
+            value = int(rng.choice(values[ok]))
+            term_values.append(value)
+            total = total + value if sign == "+" else total - value
+
+        nums = []
+        for chain, sets, value in zip(self.terms, self.term_sets, term_values):
+            nums.extend(self._realize(chain, sets, value, rng))
+        return nums, total
+
+    def _realize(self, chain: List[str], sets: List[np.ndarray], value: int, rng: np.random.Generator) -> List[int]:
+        """項の値から、後ろの数から順に×・÷の数を決める"""
+        nums = []
+        for k in range(len(chain), 0, -1):
+            previous_set = sets[k - 1]
+            if chain[k - 1] == "*" and value == 0:
+                # 積が0になるのは、かける数が0（前の値は何でもよい）か前の値が0のとき
+                options = [(int(f), 0) for f in self.divisors] if previous_set[0] else []
+                if self.factors[0] == 0:
+                    options += [(0, int(p)) for p in np.flatnonzero(previous_set)]
+                factor, value = options[rng.integers(len(options))]
+                nums.append(factor)
+                continue
+            if chain[k - 1] == "*":
+                factors = self.divisors[value % self.divisors == 0]
+                previous = value // factors
+            else:
+                factors = self.divisors
+                previous = value * factors
+            inside = previous <= EXPR_VALUE_LIMIT
+            inside[inside] = previous_set[previous[inside]]
+            choice = int(rng.choice(np.flatnonzero(inside)))
+            nums.append(int(factors[choice]))
+            value = int(previous[choice])
+        nums.append(value)
+        return nums[::-1]
+
+
+class ExpressionEngine:
+    """設定ごとの混合式の作り方（式の形ごとの値の集合をキャッシュする）"""
+
+    def __init__(self, low: int, high: int, answer_low: int, answer_high: int, operators: Tuple[str, ...]):
+        self.factors = np.arange(max(low, 0), min(high, EXPR_VALUE_LIMIT) + 1)
+        self.answer_low = answer_low
+        self.answer_high = answer_high
+        self.operators = operators
+        self._lock = threading.Lock()
+        self._shapes: Dict[Tuple[str, ...], ExpressionShape] = {}
+
+    def shape(self, operators: Tuple[str, ...]) -> ExpressionShape:
+        with self._lock:
+            shape = self._shapes.get(operators)
+            if shape is None:
+                if len(self._shapes) >= MAX_CACHED_SHAPES:
+                    self._shapes.clear()
+                shape = ExpressionShape(operators, self.factors, self.answer_low, self.answer_high)
+                self._shapes[operators] = shape
+            return shape
+
+    def random_operators(self, term_count: int, rng: np.random.Generator) -> Tuple[str, ...]:
+        """演算子の並び（3項以上なら＋・－と×・÷の両方を必ず含める）"""
+        operators = list(rng.choice(self.operators, size=term_count - 1))
+        additive = [op for op in self.operators if op in ADDITIVE]
+        multiplicative = [op for op in self.operators if op not in ADDITIVE]
+        if term_count >= 3 and additive and multiplicative:
+            first, second = rng.choice(term_count - 1, size=2, replace=False)
+            if not any(op in ADDITIVE for op in operators):
+                operators[first] = rng.choice(additive)
+            if all(op in ADDITIVE for op in operators):
+                operators[second] = rng.choice(multiplicative)
+        return tuple(str(op) for op in operators)
+
+    def sample(self, term_count: int, rng: np.random.Generator,
+               attempts: int = 20) -> Optional[Tuple[List[int], List[str], int]]:
+        """(数, 演算子, 答え) を1つ作る（どの形でも答えの範囲に届かなければNone）"""
+        for _ in range(attempts):
+            operators = self.random_operators(term_count, rng)
+            shape = self.shape(operators)
+            if shape.feasible:
+                nums, answer = shape.sample(rng)
+                return nums, list(operators), answer
+        return None
+
+
+_engines: Dict[Tuple, ExpressionEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_expression_engine(settings: Dict) -> ExpressionEngine:
+    """設定に合う混合式の作り方（同じ設定なら同じものを使い回す）"""
+    key = (
+        settings['expr_min'], settings['expr_max'],
+        settings['expr_answer_min'], settings['expr_answer_max'],
+        settings['expr_operators'],
+    )
+    with _engines_lock:
+        if key not in _engines:
+            if len(_engines) >= 16:
+                _engines.clear()
+            _engines[key] = ExpressionEngine(
+                settings['expr_min'], settings['expr_max'],
+                settings['expr_answer_min'], settings['expr_answer_max'],
+                EXPR_OPERATORS[settings['expr_operators']],
+            )
+        return _engines[key]
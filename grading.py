@@ -0,0 +1,188 @@
+import io
+import threading
+from collections import OrderedDict
+from itertools import repeat
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from bundle import BUNDLE_WORKER_COUNT, bundle_settings, generate_variant, get_bundle_executor
+from problem_pool import settings_fingerprint
+
+# 答えの書き方（商と余り）。全角はNFKC正規化で半角にしてから照合する
+# 例: 12, 3.5, 7余り2, 7あまり2, 7r2, 7...2
+# マイナス記号（U+2212）はNFKCでは変わらないので、別に半角の「-」にする
+ANSWER_PATTERN = r'^(-?\d+(?:\.\d+)?)(?:(?:余り|あまり|r|\.\.\.)(\d+))?$'
+
+# 提出されたCSVの列名（番号の列がなければ1列目を生徒の番号とみなす）
+STUDENT_COLUMN = '番号'
+NAME_COLUMN = '名前'
+
+# 作り直した解答を覚えておく件数（生徒1人分で1件）
+MAX_CACHED_ANSWER_KEYS = 5000
+
+# Excelで保存したCSVはShift_JISのことが多いので、UTF-8で読めなければそちらで読む
+CSV_ENCODINGS = ('utf-8-sig', 'cp932')
+
+
+class GradingError(ValueError):
+    """提出されたCSVの形式の誤り"""
+
+
+def answer_key(settings: Dict[str, Any], base_seed: int, student: int) -> Tuple[List[str], List[str]]:
+    """生徒1人分の問題文と正解を作り直す（ワーカープロセスでも実行）"""
+    rows = generate_variant(settings, base_seed, student)
+    return [row['もんだい'] for row in rows], [str(row['せいかい']) for row in rows]
+
+
+class AnswerKeyCache:
+    """(設定, プリント番号, 生徒の番号) ごとの問題文と正解（問題を作り直さずに済むよう覚えておく）"""
+
+    def __init__(self, capacity: int = MAX_CACHED_ANSWER_KEYS):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._keys: "OrderedDict[Tuple[str, int, int], Tuple[List[str], List[str]]]" = OrderedDict()
+
+    def get(self, fingerprint: str, settings: Dict[str, Any], base_seed: int,
+            student: int) -> Tuple[List[str], List[str]]:
+        return self.get_many(fingerprint, settings, base_seed, [student])[0]
+
+    def get_many(self, fingerprint: str, settings: Dict[str, Any], base_seed: int,
+                 students: List[int]) -> List[Tuple[List[str], List[str]]]:
+        """生徒ごとの問題文と正解（キャッシュにない生徒の分は、まとめて作成と同じプロセスプールで並列に作り直す）"""
+        entries = {}
+        with self._lock:
+            for student in students:
+                key = (fingerprint, base_seed, student)
+                if key in self._keys:
+                    self._keys.move_to_end(key)
+                    entries[student] = self._keys[key]
+        missing = [student for student in dict.fromkeys(students) if student not in entries]
+        if BUNDLE_WORKER_COUNT > 1 and len(missing) > 1:
+            results = get_bundle_executor().map(answer_key, repeat(settings), repeat(base_seed), missing)
+        else:
+            results = (answer_key(settings, base_seed, student) for student in missing)
+        for student, entry in zip(missing, results):
+            entries[student] = entry
+        with self._lock:
+            for student in missing:
+                self._keys[(fingerprint, base_seed, student)] = entries[student]
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+        return [entries[student] for student in students]
+
+
+@st.cache_resource
+def get_answer_key_cache() -> AnswerKeyCache:
+    """全セッション共通の解答のキャッシュ"""
+    return AnswerKeyCache()
+
+
+def read_submissions(data: bytes) -> pd.DataFrame:
+    """アップロードされたCSVを文字列のまま読み込む"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding=encoding)
+        except UnicodeDecodeError:
+            continue
+    raise GradingError("CSVの文字コードを読み取れません（UTF-8またはShift_JISで保存してください）")
+
+
+def parse_answers(values: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """答えの文字列をまとめて (商, 余り, 読み取れたか) の配列にする（余りがなければ0）"""
+    text = (values.astype(str).str.normalize('NFKC').str.replace('\u2212', '-', regex=False)
+            .str.lower().str.replace(r'\s+', '', regex=True))
+    parts = text.str.extract(ANSWER_PATTERN)
+    quotients = pd.to_numeric(parts[0]).to_numpy(dtype=np.float64)
+    remainders = pd.to_numeric(parts[1]).fillna(0).to_numpy(dtype=np.float64)
+    return quotients, remainders, parts[0].notna().to_numpy()
+
+
+def answer_columns(submissions: pd.DataFrame) -> List[Tuple[int, str]]:
+    """(問題番号, 列名) の組（列名が数字の列。なければ番号・名前以外の列を順に1, 2, ...とする）"""
+    student_column = STUDENT_COLUMN if STUDENT_COLUMN in submissions.columns else submissions.columns[0]
+    others = [column for column in submissions.columns if column not in (student_column, NAME_COLUMN)]
+    numbered = [(int(str(column).strip()), column) for column in others if str(column).strip().isdigit()]
+    if numbered:
+        return sorted(numbered)
+    return list(enumerate(others, start=1))
+
+
+def grade_submissions(settings: Dict[str, Any], base_seed: int,
+                      submissions: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """提出された答えをまとめて採点し、(生徒ごと, 問題ごと, 1問ずつの明細) の表を返す
+
+    正解はまとめて作成したときと同じ設定・プリント番号から生徒ごとに作り直す
+    （一度作った正解はキャッシュから使い、ない分はプロセスプールで並列に作る）。
+    照合は全員分の答えを1つの配列にして行う。
+    """
+    if len(submissions.columns) < 2 or len(submissions) == 0:
+        raise GradingError("生徒の番号と答えの列があるCSVを指定してください")
+    student_column = STUDENT_COLUMN if STUDENT_COLUMN in submissions.columns else submissions.columns[0]
+    students = pd.to_numeric(submissions[student_column].str.strip(), errors='coerce')
+    if students.isna().any() or (students < 1).any():
+        raise GradingError(f"「{student_column}」の列には1以上の番号を入れてください")
+    students = students.astype(int).to_numpy()
+    names = submissions[NAME_COLUMN].to_numpy() if NAME_COLUMN in submissions.columns else np.full(len(students), '')
+
+    # 生徒ごとの問題文と正解（問題数は網羅モードなどで生徒ごとに異なることがある）
+    settings = bundle_settings(settings)
+    fingerprint = settings_fingerprint(settings)
+    cache = get_answer_key_cache()
+    keys = cache.get_many(fingerprint, settings, base_seed, [int(student) for student in students])
+    problem_count = max(len(answers) for _, answers in keys)
+    questions = np.full((len(students), problem_count), '', dtype=object)
+    correct_answers = np.full((len(students), problem_count), '', dtype=object)
+    for i, (question_list, answer_list) in enumerate(keys):
+        questions[i, :len(question_list)] = question_list
+        correct_answers[i, :len(answer_list)] = answer_list
+
+    # 提出された答え（列のない問題は無回答）
+    given = np.full((len(students), problem_count), '', dtype=object)
+    for number, column in answer_columns(submissions):
+        if 1 <= number <= problem_count:
+            given[:, number - 1] = submissions[column].to_numpy()
+
+    # 正解と答えを全員分まとめて読み取って照合
+    key_quotients, key_remainders, _ = parse_answers(pd.Series(correct_answers.ravel()))
+    quotients, remainders, readable = parse_answers(pd.Series(given.ravel()))
+    exists = (correct_answers != '').ravel()
+    blank = pd.Series(given.ravel()).astype(str).str.strip().eq('').to_numpy() & exists
+    correct = readable & exists & (quotients == key_quotients) & (remainders == key_remainders)
+
+    shape = (len(students), problem_count)
+    exists, blank, correct = exists.reshape(shape), blank.reshape(shape), correct.reshape(shape)
+    counts = exists.sum(axis=1)
+
+    student_stats = pd.DataFrame({
+        '番号': students,
+        '名前': names,
+        '正解数': correct.sum(axis=1),
+        '問題数': counts,
+        '無回答': blank.sum(axis=1),
+        '正答率(%)': np.round(correct.sum(axis=1) / np.maximum(counts, 1) * 100, 1),
+    })
+    if NAME_COLUMN not in submissions.columns:
+        student_stats = student_stats.drop(columns='名前')
+
+    answered = exists.sum(axis=0)
+    problem_stats = pd.DataFrame({
+        'ばんごう': np.arange(1, problem_count + 1),
+        '正解数': correct.sum(axis=0),
+        '解いた人数': answered,
+        '無回答': blank.sum(axis=0),
+        '正答率(%)': np.round(correct.sum(axis=0) / np.maximum(answered, 1) * 100, 1),
+    })
+
+    rows, columns = np.nonzero(exists)
+    details = pd.DataFrame({
+        '番号': students[rows],
+        'ばんごう': columns + 1,
+        'もんだい': questions[rows, columns],
+        'せいかい': correct_answers[rows, columns],
+        '答え': given[rows, columns],
+        '判定': np.where(correct[rows, columns], '○', '×'),
+    })
+    return student_stats, problem_stats, details
@@ -0,0 +1,53 @@
+import streamlit as st
+
+from grading import GradingError, grade_submissions, read_submissions
+
+
+def show_grading_page(generator):
+    """提出された答えのCSVを採点するページを表示"""
+    st.header("✅ 採点")
+    st.write("💡 **採点について**\n\n"
+             "• 「クラス分をまとめて作成」で作ったプリントの答えを、まとめて採点します\n"
+             "• 作成したときと同じ設定・プリント番号を指定してください（正解はそこから作り直します）\n"
+             "• CSVは1行に1人分で、「番号」列（なければ1列目）に何番のプリントか、"
+             "「1」「2」…の列に各問題の答えを入れます（「名前」列は任意）\n"
+             "• 余りのある答えは「7 余り 2」「7あまり2」「7...2」のどれでも構いません")
+
+    base_seed = st.number_input(
+        "プリント番号", min_value=0, max_value=999999, step=1,
+        value=int(st.session_state.get('bundle_seed', 0)), key="grading_seed"
+    )
+    uploaded = st.file_uploader("答えのCSV", type=["csv"], key="grading_csv")
+    if uploaded is None:
+        return
+
+    try:
+        submissions = read_submissions(uploaded.getvalue())
+        student_stats, problem_stats, details = grade_submissions(generator.settings, int(base_seed), submissions)
+    except GradingError as e:
+        st.error(str(e))
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("人数", f"{len(student_stats)}人")
+    with col2:
+        st.metric("平均正答率", f"{student_stats['正答率(%)'].mean():.1f}%")
+    with col3:
+        st.metric("無回答", f"{int(student_stats['無回答'].sum())}問")
+
+    st.subheader("👤 生徒ごとの結果")
+    st.dataframe(student_stats, use_container_width=True, hide_index=True)
+
+    st.subheader("📊 問題ごとの正答率")
+    st.dataframe(problem_stats, use_container_width=True, hide_index=True)
+
+    with st.expander("📋 1問ずつの結果"):
+        st.dataframe(details, use_container_width=True, hide_index=True)
+    st.download_button(
+        "💾 採点結果をダウンロード（CSV）",
+        data=details.to_csv(index=False).encode('utf-8-sig'),
+        file_name=f"採点結果_{int(base_seed)}.csv",
+        mime="text/csv",
+        key="grading_download"
+    )
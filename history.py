@@ -0,0 +1,186 @@
+import streamlit as st
+from collections import OrderedDict
+from typing import Hashable, Iterable
+import atexit
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+import time
+
+# 出題履歴の保存先（環境変数で変更可能）
+HISTORY_DIR = os.environ.get(
+    'MATH_CREATOR_HISTORY_DIR',
+    os.path.join(os.path.expanduser('~'), '.math_creator', 'history')
+)
+
+# 1世代のフィルタに記録する問題数と誤判定率
+# 2世代分（直近10万〜20万問）を覚えておき、古い世代から忘れる
+HISTORY_CAPACITY = 100000
+HISTORY_ERROR_RATE = 0.01
+
+# 履歴ファイル（約240KB）を書き直す最短の間隔（秒）
+# 間隔内の記録はメモリ上だけに反映し、次の記録・キャッシュからの追い出し・終了時に保存する
+HISTORY_SAVE_INTERVAL = 30
+
+# メモリ上に保持する履歴の数（古く使われたものから保存して手放す）
+MAX_CACHED_HISTORIES = 32
+
+# 履歴ファイル名に使う名前の最大文字数（長い名前はハッシュで区別する）
+MAX_HISTORY_STEM_LENGTH = 48
+
+_HEADER = struct.Struct('<4sIII')  # 識別子, 1世代の容量, 現世代の件数, 前世代の件数
+_MAGIC = b'MCH2'
+
+
+def _key_bytes(key: Hashable) -> bytes:
+    """問題のキー（problem_keys.pack_problem_key）をハッシュ用のバイト列にする"""
+    if isinstance(key, int):
+        return key.to_bytes(key.bit_length() // 8 + 1, 'little')
+    return repr(key).encode('utf-8')
+
+
+class BloomFilter:
+    """固定サイズのブルームフィルタ（件数が増えても判定の手間は一定）"""
+
+    def __init__(self, capacity: int, error_rate: float, bits: bytearray = None):
+        self.bit_count = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, key: Hashable):
+        digest = hashlib.blake2b(_key_bytes(key), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.bit_count
+
+    def add(self, key: Hashable) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class ProblemHistory:
+    """1人（または1クラス）分の出題履歴
+
+    現世代のフィルタが容量に達したら前世代と入れ替え、最も古い世代を捨てる。
+    """
+
+    def __init__(self, path: str, capacity: int = HISTORY_CAPACITY, error_rate: float = HISTORY_ERROR_RATE):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = BloomFilter(capacity, error_rate)
+        self.current_count = 0
+        self.previous_count = 0
+        self._dirty = False
+        self._saved_at = float('-inf')
+        self._load()
+
+    def seen(self, key: Hashable) -> bool:
+        """最近出題した問題か（まれに未出題でもTrueになる）"""
+        with self._lock:
+            return key in self.current or key in self.previous
+
+    def record(self, keys: Iterable[Hashable]) -> None:
+        """出題した問題を記録する（前回の保存から HISTORY_SAVE_INTERVAL 秒以上たっていれば保存）"""
+        with self._lock:
+            for key in keys:
+                if self.current_count >= self.capacity:
+                    self.previous, self.previous_count = self.current, self.current_count
+                    self.current, self.current_count = BloomFilter(self.capacity, self.error_rate), 0
+                self.current.add(key)
+                self.current_count += 1
+                self._dirty = True
+            if self._dirty and time.monotonic() - self._saved_at >= HISTORY_SAVE_INTERVAL:
+                self._save()
+
+    def flush(self) -> None:
+        """保存していない記録があれば保存"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def __len__(self) -> int:
+        return self.current_count + self.previous_count
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        if len(data) < _HEADER.size:
+            return
+        magic, capacity, current_count, previous_count = _HEADER.unpack_from(data)
+        size = len(self.current.bits)
+        # 容量の設定が変わったファイルは読み込まない
+        if magic != _MAGIC or capacity != self.capacity or len(data) != _HEADER.size + 2 * size:
+            return
+        offset = _HEADER.size
+        self.current = BloomFilter(self.capacity, self.error_rate, bytearray(data[offset:offset + size]))
+        self.previous = BloomFilter(self.capacity, self.error_rate, bytearray(data[offset + size:]))
+        self.current_count, self.previous_count = current_count, previous_count
+
+    def _save(self) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.capacity, self.current_count, self.previous_count))
+            f.write(self.current.bits)
+            f.write(self.previous.bits)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+
+class HistoryStore:
+    """生徒・クラスごとの出題履歴をまとめて管理する
+
+    履歴はファイルのパスごとに1つだけ持つ。ファイル名は名前の先頭部分と名前全体の
+    ハッシュから作るので、置き換えや切り詰めで同じ文字列になる名前も別の履歴になる。
+    """
+
+    def __init__(self, directory: str, max_cached: int = MAX_CACHED_HISTORIES):
+        self.directory = directory
+        self.max_cached = max_cached
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._histories: "OrderedDict[str, ProblemHistory]" = OrderedDict()
+        atexit.register(self.flush)
+
+    def get(self, student: str) -> ProblemHistory:
+        # ファイル名に使えない文字は置き換え、長すぎる名前は切り詰める
+        stem = re.sub(r'[\\/:*?"<>|\s]', '_', student)[:MAX_HISTORY_STEM_LENGTH]
+        digest = hashlib.sha1(student.encode('utf-8')).hexdigest()[:8]
+        path = os.path.join(self.directory, f"{stem}_{digest}.bloom")
+        evicted = []
+        with self._lock:
+            history = self._histories.get(path)
+            if history is None:
+                history = self._histories[path] = ProblemHistory(path)
+                while len(self._histories) > self.max_cached:
+                    evicted.append(self._histories.popitem(last=False)[1])
+            self._histories.move_to_end(path)
+        for old in evicted:
+            old.flush()
+        return history
+
+    def flush(self) -> None:
+        """保存していない記録をすべて保存"""
+        with self._lock:
+            histories = list(self._histories.values())
+        for history in histories:
+            history.flush()
+
+
+@st.cache_resource
+def get_history_store() -> HistoryStore:
+    """全セッション共通の出題履歴ストア"""
+    return HistoryStore(HISTORY_DIR)
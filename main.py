@@ -1,21 +1,79 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
+import base64
+import copy
+import io
+import os
 import random
-from typing import List, Tuple, Dict, Any
-from output_formatter import OutputFormatter
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Any, Optional, TYPE_CHECKING
+from output_formatter import DOWNLOAD_MIME_TYPES, OutputFormatter
+from session_store import get_session_store
+from problem_pool import ProblemPool, settings_fingerprint
+from presets import PRESET_BANK_SIZE, get_preset_store
+from problem_bank import get_problem_bank
+from history import get_history_store
+from problem_keys import pack_problem_key
 
-# ページ設定
-st.set_page_config(
-    page_title="けいさんドリル作成ツール",
-    page_icon="🧮",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+if TYPE_CHECKING:
+    # pandasは問題生成時に読み込む（起動を速くするため）
+    import pandas as pd
+    from candidates import CandidateBlock
+
+# PDF生成中に進捗を確認する間隔（秒）
+PDF_JOB_POLL_INTERVAL = 0.5
+
+# 網羅モードで生成する問題数の上限
+COVERAGE_QUESTION_LIMIT = 10000
+
+# プリセットから読み込んだ生成プランを覚えておく数（古く使われたものから捨てる）
+MAX_REGISTERED_PLANS = 8
+
+# 通常モードで1度にまとめて作る問題候補の数と、1回の生成で作る候補の上限
+CANDIDATE_BLOCK_SIZE = 1024
+MAX_CANDIDATES = 20000
+
+# 均等出題で集める候補の数（問題数の何倍か）
+BALANCE_OVERSAMPLE = 8
+
+# 計算の順序の問題の上限（網羅モードでも全組み合わせは作らない）
+MAX_EXPRESSION_PROBLEMS = 100
+
+# 問題形式の表示名
+PROBLEM_TYPE_LABELS = {
+    1: "足し算", 2: "引き算", 3: "足し引き混合",
+    4: "かけ算", 5: "わり算", 6: "四則混合", 7: "計算の順序"
+}
 
 class MathProblemGenerator:
-    def __init__(self):
-        self.initialize_default_settings()
+    # 問題形式ごとの演算子
+    OPERATOR_MAP = {
+        1: ["+"],
+        2: ["-"],
+        3: ["+", "-"],
+        4: ["*"],
+        5: ["/"],
+        6: ["+", "-", "*", "/"]
+    }
+    
+    # 計算の順序の問題（1問の中で演算子が混ざる式）
+    EXPRESSION_TYPE = 7
+    
+    # プリセットから読み込んだ生成プラン（プランのキー → プラン）
+    _plans: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    _plans_lock = threading.Lock()
+    
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        # settingsを渡した場合はセッションを使わずに生成する（バックグラウンド生成用）
+        self._settings = settings
+        self.rng = random.Random()
+        # 出題履歴（設定すると最近出題した問題を避ける）と、直近に生成した問題
+        self.history = None
+        self.generated_keys: List[Any] = []
+        self.generated_terms: List[Tuple[List[int], str]] = []
+        if settings is None:
+            self.initialize_default_settings()
     
     def validate_slider_values(self):
         """スライダーの値の整合性をチェック"""
@@ -45,6 +103,12 @@ class MathProblemGenerator:
         if settings['div_min2'] > settings['div_max2']:
             settings['div_max2'] = settings['div_min2']
         
+        # 3項目以降の範囲チェック
+        for prefix in ('add', 'sub', 'mul', 'div'):
+            for i in range(3, 6):
+                if settings[f'{prefix}_min{i}'] > settings[f'{prefix}_max{i}']:
+                    settings[f'{prefix}_max{i}'] = settings[f'{prefix}_min{i}']
+        
         # 値制限のチェック
         if settings['value_min'] > settings['value_max']:
             settings['value_max'] = settings['value_min']
@@ -52,164 +116,73 @@ class MathProblemGenerator:
     def initialize_default_settings(self):
         """デフォルト設定の初期化"""
         if 'settings' not in st.session_state:
-            st.session_state.settings = {
-                # 基本設定
-                'problem_type': 1,  # 1:足し算, 2:引き算, 3:足し引き混合, 4:かけ算, 5:わり算, 6:四則混合
-                'randomize_order': True,
-                'question_count': 30,
-                'term_count': 2,
-                'generation_mode': 1,  # 1:通常モード, 2:網羅モード
-                
-                # 網羅設定
-                'add_coverage': 1,  # 1:通常, 2:全組合せ
-                'sub_coverage': 1,
-                'mul_coverage': 1,
-                'div_coverage': 1,
-                
-                # 数値範囲設定
-                'add_min1': 1, 'add_max1': 10,
-                'add_min2': 0, 'add_max2': 10,
-                'sub_min1': 1, 'sub_max1': 10,
-                'sub_min2': 1, 'sub_max2': 10,
-                'mul_min1': 1, 'mul_max1': 9,
-                'mul_min2': 1, 'mul_max2': 9,
-                'div_min1': 1, 'div_max1': 81,
-                'div_min2': 1, 'div_max2': 9,
-                
-                # 制約設定
-                'add_limit': 1,  # 1:10以下, 2:11-20, 3:制限なし
-                'sub_limit': 1,  # 1:正の整数, 2:負の値もOK
-                'mul_limit': 1,  # 1:100以下, 2:制限なし
-                'div_limit': 1,  # 1:余りなし, 2:余りあり
-                'value_limit_enabled': 1,  # 1:無効, 2:有効
-                'value_min': 0, 'value_max': 50,
-                
-                # 表示設定
-                'answer_display': 1,  # 1:あり, 2:なし, 3:別シート
-                'show_answer_column': True,  # 答え欄の表示
-                'font_size': 14,  # フォントサイズを14ptに固定
-                'header_text': "計算プリント",
-                
-                # 印刷設定
-                'print_margin': 20,  # 印刷時の余白（mm）
-                'print_columns': 2,  # 印刷時の列数
-                'print_show_border': True,  # 枠線の表示
-                'print_border_width': 1,  # 枠線の幅（px）
-                'print_show_grid': False,  # グリッド線の表示
-                'print_preview_mode': False,  # プレビューモード
-            }
-    
-    def get_random_number(self, min_val: int, max_val: int) -> int:
-        """指定された範囲の乱数生成"""
-        if min_val > max_val:
-            min_val, max_val = max_val, min_val
-        return random.randint(min_val, max_val)
+            st.session_state.settings = self.default_settings()
     
-    def generate_operands(self, operator: str) -> List[int]:
-        """各演算子のオペランド生成"""
-        nums = []
-        for i in range(self.settings['term_count']):
-            if operator == "+":
-                if i == 0:
-                    nums.append(self.get_random_number(self.settings['add_min1'], self.settings['add_max1']))
-                else:
-                    nums.append(self.get_random_number(self.settings['add_min2'], self.settings['add_max2']))
-            elif operator == "-":
-                if i == 0:
-                    nums.append(self.get_random_number(self.settings['sub_min1'], self.settings['sub_max1']))
-                else:
-                    nums.append(self.get_random_number(self.settings['sub_min2'], self.settings['sub_max2']))
-            elif operator == "*":
-                if i == 0:
-                    nums.append(self.get_random_number(self.settings['mul_min1'], self.settings['mul_max1']))
-                else:
-                    nums.append(self.get_random_number(self.settings['mul_min2'], self.settings['mul_max2']))
-            elif operator == "/":
-                if i == 0:
-                    nums.append(self.get_random_number(self.settings['div_min1'], self.settings['div_max1']))
-                else:
-                    num = self.get_random_number(self.settings['div_min2'], self.settings['div_max2'])
-                    nums.append(num if num != 0 else 1)
-        return nums
-    
-    def adjust_div_operands(self, nums: List[int], operator: str) -> List[int]:
-        """わり算の場合の被除数調整"""
-        if operator != "/" or self.settings['div_limit'] != 1:
-            return nums
-        
-        # 余りなしの場合、除数部分の積で被除数を調整
-        product = 1
-        for i in range(1, len(nums)):
-            product *= nums[i]
-        
-        multiplier = self.get_random_number(
-            max(1, self.settings['value_min'] // product),
-            self.settings['value_max'] // product
-        )
-        nums[0] = product * multiplier
-        if nums[0] == 0:
-            nums[0] = product
-        
-        return nums
-    
-    def calculate_answer(self, nums: List[int], operator: str) -> Any:
-        """計算結果の取得"""
-        answer = nums[0]
-        
-        for i in range(1, len(nums)):
-            if operator == "+":
-                answer += nums[i]
-            elif operator == "-":
-                answer -= nums[i]
-            elif operator == "*":
-                answer *= nums[i]
-            elif operator == "/":
-                if nums[i] == 0:
-                    return "ERROR"
-                elif self.settings['div_limit'] == 1:
-                    answer = answer / nums[i]
-                else:
-                    quotient = answer // nums[i]
-                    remainder = answer % nums[i]
-                    if remainder == 0:
-                        answer = quotient
-                    else:
-                        answer = f"{quotient} 余り {remainder}"
-        
-        return answer
-    
-    def is_valid_question(self, answer: Any, operator: str) -> bool:
-        """問題の妥当性チェック"""
-        if answer == "ERROR":
-            return False
-        
-        # 足し算の制約
-        if operator == "+":
-            if self.settings['add_limit'] == 1 and answer > 10:
-                return False
-            elif self.settings['add_limit'] == 2 and (answer <= 10 or answer > 20):
-                return False
-        
-        # 引き算の制約
-        elif operator == "-":
-            if self.settings['sub_limit'] == 1 and answer <= 0:
-                return False
-        
-        # かけ算の制約
-        elif operator == "*":
-            if self.settings['mul_limit'] == 1 and answer > 100:
-                return False
-        
-        # 解の値制限
-        if self.settings['value_limit_enabled'] == 2:
-            try:
-                numeric_value = float(answer)
-                if numeric_value < self.settings['value_min'] or numeric_value > self.settings['value_max']:
-                    return False
-            except (ValueError, TypeError):
-                return False
-        
-        return True
+    @staticmethod
+    def default_settings() -> Dict[str, Any]:
+        """デフォルト設定"""
+        return {
+            # 基本設定
+            'problem_type': 1,  # 1:足し算, 2:引き算, 3:足し引き混合, 4:かけ算, 5:わり算, 6:四則混合
+            'randomize_order': True,
+            'question_count': 30,
+            'term_count': 2,
+            'generation_mode': 1,  # 1:通常モード, 2:網羅モード
+            'problem_source': 1,  # 1:その場で生成, 2:問題バンクから抽出
+            'dedup_commutative': False,  # 3+5と5+3を同じ問題とみなす
+            'carry_mode': 1,  # 1:指定なし, 2:繰り上がり・繰り下がりなし, 3:繰り上がり・繰り下がりあり
+            'sort_by_difficulty': False,  # やさしい問題から順に並べる
+            'balance_mode': 1,  # 1:指定なし, 2:答え, 3:1項目の数, 4:難しさ が均等になるように出題
+            'custom_rules': '',  # 自由入力の出題ルール（1行に1つ）
+            
+            # 計算の順序（混合式）の設定
+            'expr_min': 1, 'expr_max': 10,  # 式に使う数の範囲
+            'expr_answer_min': 0, 'expr_answer_max': 50,  # 答えの範囲
+            'expr_operators': 2,  # 1:＋－×, 2:＋－×÷
+            
+            # 網羅設定
+            'add_coverage': 1,  # 1:通常, 2:全組合せ
+            'sub_coverage': 1,
+            'mul_coverage': 1,
+            'div_coverage': 1,
+            
+            # 数値範囲設定
+            'add_min1': 1, 'add_max1': 10,
+            'add_min2': 0, 'add_max2': 10,
+            'sub_min1': 1, 'sub_max1': 10,
+            'sub_min2': 1, 'sub_max2': 10,
+            'mul_min1': 1, 'mul_max1': 9,
+            'mul_min2': 1, 'mul_max2': 9,
+            'div_min1': 1, 'div_max1': 81,
+            'div_min2': 1, 'div_max2': 9,
+            # 3項目以降の範囲（既定は2項目と同じ）
+            'add_min3': 0, 'add_max3': 10, 'add_min4': 0, 'add_max4': 10, 'add_min5': 0, 'add_max5': 10,
+            'sub_min3': 1, 'sub_max3': 10, 'sub_min4': 1, 'sub_max4': 10, 'sub_min5': 1, 'sub_max5': 10,
+            'mul_min3': 1, 'mul_max3': 9, 'mul_min4': 1, 'mul_max4': 9, 'mul_min5': 1, 'mul_max5': 9,
+            'div_min3': 1, 'div_max3': 9, 'div_min4': 1, 'div_max4': 9, 'div_min5': 1, 'div_max5': 9,
+            
+            # 制約設定
+            'add_limit': 1,  # 1:10以下, 2:11-20, 3:制限なし
+            'sub_limit': 1,  # 1:正の整数, 2:負の値もOK
+            'mul_limit': 1,  # 1:100以下, 2:制限なし
+            'div_limit': 1,  # 1:余りなし, 2:余りあり
+            'value_limit_enabled': 1,  # 1:無効, 2:有効
+            'value_min': 0, 'value_max': 50,
+            
+            # 表示設定
+            'answer_display': 1,  # 1:あり, 2:なし, 3:別シート
+            'show_answer_column': True,  # 答え欄の表示
+            'font_size': 14,  # フォントサイズを14ptに固定
+            'header_text': "計算プリント",
+            
+            # 印刷設定
+            'print_margin': 20,  # 印刷時の余白（mm）
+            'print_columns': 2,  # 印刷時の列数
+            'print_show_border': True,  # 枠線の表示
+            'print_border_width': 1,  # 枠線の幅（px）
+            'print_show_grid': False,  # グリッド線の表示
+            'print_preview_mode': False,  # プレビューモード
+        }
     
     def build_question_string(self, nums: List[int], operator: str) -> str:
         """問題文（文字列）の生成"""
@@ -226,27 +199,36 @@ class MathProblemGenerator:
         return result
     
     def format_vertical_equation(self, nums: List[int], operator: str) -> str:
-        """問題文生成（横書き形式）"""
+        """問題文生成（横書き形式。PDFの筆算はこの問題文から vertical_layout で配置する）"""
         return self.build_question_string(nums, operator)
     
-    def generate_problems(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    def generate_problems(self) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
         """問題生成メイン"""
-        random.seed()
+        return self.problem_dataframes(self.generate_problem_rows())
+    
+    def generate_problem_rows(self, seed: Optional[str] = None) -> List[Dict[str, Any]]:
+        """出題順に並べて番号を振った問題の行（PDFへの書き出しはDataFrameを作らずにこれを使える）
+        
+        seedを指定すると、同じ設定・同じseedからは同じ問題が同じ順で作られる（出題履歴は使わない）。
+        """
+        import numpy as np
+        
+        if seed is not None:
+            self.history = None
+        self.rng.seed(seed)
+        np_rng = np.random.default_rng(self.rng.getrandbits(64))
+        
+        if self.settings['problem_type'] == self.EXPRESSION_TYPE:
+            return self.generate_expression_problems(np_rng)
         
         problems = []
-        answers = []
-        used_questions = set()
+        used_keys = set()
+        recently_seen = []
+        self.reset_generated()
+        plan = self.get_plan()
         
         # 演算子リストの決定
-        operator_map = {
-            1: ["+"],
-            2: ["-"],
-            3: ["+", "-"],
-            4: ["*"],
-            5: ["/"],
-            6: ["+", "-", "*", "/"]
-        }
-        operators = operator_map.get(self.settings['problem_type'], ["+"])
+        operators = self.OPERATOR_MAP.get(self.settings['problem_type'], ["+"])
         
         # 網羅モードの処理
         for operator in operators:
@@ -258,72 +240,176 @@ class MathProblemGenerator:
             }
             
             if coverage_map.get(operator, 1) == 2:
-                # 網羅的な全組み合わせ生成
-                min_val = self.get_min_value(operator)
-                max_val = self.get_max_value(operator)
-                combinations = self.generate_combinations(min_val, max_val)
+                # 網羅的な全組み合わせ生成（プランがあれば列挙済みの組み合わせを使う）
+                candidates = plan['coverage'].get(operator) if plan else None
+                if candidates is None:
+                    candidates = self.enumerate_coverage(operator, np_rng)
                 
-                for combo in combinations:
-                    nums = combo.copy()
-                    nums = self.adjust_div_operands(nums, operator)
-                    answer = self.calculate_answer(nums, operator)
-                    
-                    if self.is_valid_question(answer, operator):
-                        question = self.build_question_string(nums, operator)
-                        if question not in used_questions:
-                            used_questions.add(question)
-                            problems.append({
-                                'ばんごう': len(problems) + 1,
-                                'もんだい': self.format_vertical_equation(nums, operator),
-                                'こたえ': '',  # 生徒が記入する答え欄
-                                'せいかい': answer
-                            })
-                            answers.append({
-                                'もんだいばんごう': len(answers) + 1,
-                                'せいかい': answer
-                            })
-        
-        # 通常生成モード
-        max_tries = 20000
-        try_count = 0
+                for nums, answer in candidates:
+                    key = self.problem_key(nums, operator)
+                    if key not in used_keys:
+                        used_keys.add(key)
+                        self.append_problem(problems, nums, operator, answer, key)
         
-        while len(problems) < self.settings['question_count'] and try_count < max_tries:
-            try_count += 1
-            
-            # 演算子の選択
-            if self.settings['problem_type'] == 3:
-                operator = random.choice(["+", "-"])
-            elif self.settings['problem_type'] == 6:
-                operator = random.choice(["+", "-", "*", "/"])
-            else:
-                operator = operators[0]
-            
-            nums = self.generate_operands(operator)
-            nums = self.adjust_div_operands(nums, operator)
-            answer = self.calculate_answer(nums, operator)
-            
-            if not self.is_valid_question(answer, operator):
+        # 通常生成モード（候補をブロック単位でまとめて作り、条件の判定は配列演算で行う）
+        question_count = self.settings['question_count']
+        
+        for entries in self.candidate_batches(operators, question_count, np_rng):
+            if len(problems) >= question_count:
+                break
+            for block, i in entries:
+                if len(problems) >= question_count:
+                    break
+                nums = block.operands[i].tolist()
+                operator = block.operator
+                
+                # 重複チェックは整数キーで行い、文字列は採用した問題だけ作る
+                key = self.problem_key(nums, operator)
+                if key in used_keys:
+                    continue
+                used_keys.add(key)
+                answer = block.answer(i)
+                if self.history is not None and self.history.seen(key):
+                    # 最近出題した問題は、問題数が足りないときだけ使う
+                    if len(recently_seen) < question_count:
+                        recently_seen.append((nums, operator, answer, key))
+                    continue
+                self.append_problem(problems, nums, operator, answer, key)
+        
+        for nums, operator, answer, key in recently_seen[:question_count - len(problems)]:
+            self.append_problem(problems, nums, operator, answer, key)
+        
+        return self.order_problems(problems)
+    
+    def generate_expression_problems(self, np_rng) -> List[Dict[str, Any]]:
+        """計算の順序の問題を生成（答えの範囲から逆算して作るので、作り直しは起きない）"""
+        from expressions import format_expression, get_expression_engine
+        
+        engine = get_expression_engine(self.settings)
+        question_count = min(self.settings['question_count'], MAX_EXPRESSION_PROBLEMS)
+        problems = []
+        used_keys = set()
+        recently_seen = []
+        self.reset_generated()
+        
+        for _ in range(question_count * 20):
+            if len(problems) >= question_count:
+                break
+            sampled = engine.sample(self.settings['term_count'], np_rng)
+            if sampled is None:
+                # どの演算子の並びでも答えの範囲に届かない
+                break
+            nums, operators, answer = sampled
+            question = format_expression(nums, operators)
+            key = ('expr', question)
+            if key in used_keys:
                 continue
-            
-            question = self.build_question_string(nums, operator)
-            if question not in used_questions:
-                used_questions.add(question)
-                problems.append({
-                    'ばんごう': len(problems) + 1,
-                    'もんだい': self.format_vertical_equation(nums, operator),
-                    'こたえ': '',  # 生徒が記入する答え欄
-                    'せいかい': answer
-                })
-                answers.append({
-                    'もんだいばんごう': len(answers) + 1,
-                    'せいかい': answer
-                })
+            used_keys.add(key)
+            if self.history is not None and self.history.seen(key):
+                if len(recently_seen) < question_count:
+                    recently_seen.append((nums, answer, key, question))
+                continue
+            self.append_problem(problems, nums, 'expr', answer, key, question)
+        
+        for nums, answer, key, question in recently_seen[:question_count - len(problems)]:
+            self.append_problem(problems, nums, 'expr', answer, key, question)
+        
+        return self.order_problems(problems)
+    
+    def sample_blocks(self, operators: List[str], size: int, np_rng) -> List["CandidateBlock"]:
+        """演算子ごとの候補ブロック（混合の場合は候補ごとにランダムな演算子）"""
+        from candidates import sample_block
+        
+        sizes = np_rng.multinomial(size, [1 / len(operators)] * len(operators))
+        return [sample_block(self.settings, operator, n, np_rng) for operator, n in zip(operators, sizes) if n > 0]
+    
+    def candidate_batches(self, operators: List[str], question_count: int, np_rng):
+        """採用を試す候補 (ブロック, 行番号) のリストを順に返す
+        
+        均等出題の設定では、まず候補を集めて層ごとに均等になる順に並べたリストを1つ返す。
+        その後（または設定がなければ最初から）、ブロックごとのランダムな候補を返す。
+        """
+        import numpy as np
+        from candidates import BALANCE_NONE, balanced_order, stratum_values
+        from problem_keys import OPERATOR_CODES
+        
+        try_count = 0
+        balance_mode = self.settings.get('balance_mode', BALANCE_NONE)
+        if balance_mode != BALANCE_NONE:
+            # 新しい問題が出なくなるか十分な数が集まるまで、重複を除いて候補を集める
+            pool, pool_keys, strata = [], set(), []
+            while try_count < MAX_CANDIDATES and len(pool) < question_count * BALANCE_OVERSAMPLE:
+                size = min(CANDIDATE_BLOCK_SIZE, MAX_CANDIDATES - try_count)
+                try_count += size
+                pool_size = len(pool)
+                for block in self.sample_blocks(operators, size, np_rng):
+                    values = stratum_values(block, balance_mode)
+                    for i in np.flatnonzero(block.valid):
+                        key = self.problem_key(block.operands[i].tolist(), block.operator)
+                        if key not in pool_keys:
+                            pool_keys.add(key)
+                            pool.append((block, i))
+                            strata.append(values[i])
+                if len(pool) == pool_size:
+                    break
+            if pool:
+                codes = np.array([OPERATOR_CODES[block.operator] for block, _ in pool])
+                order = balanced_order(codes, np.array(strata, dtype=np.float64), np_rng)
+                yield [pool[j] for j in order]
+        
+        while try_count < MAX_CANDIDATES:
+            size = min(CANDIDATE_BLOCK_SIZE, MAX_CANDIDATES - try_count)
+            try_count += size
+            blocks = self.sample_blocks(operators, size, np_rng)
+            entries = [(block, i) for block in blocks for i in np.flatnonzero(block.valid)]
+            if len(blocks) > 1:
+                self.rng.shuffle(entries)
+            yield entries
+    
+    def problem_key(self, nums: List[int], operator: str) -> Any:
+        """重複チェック用の問題のキー（設定により3+5と5+3を同じ問題とみなす）"""
+        return pack_problem_key(nums, operator, self.settings.get('dedup_commutative', False))
+    
+    def append_problem(self, problems: List[Dict[str, Any]], nums: List[int], operator: str, answer: Any,
+                       key: Any, question: Optional[str] = None):
+        """問題を1問分追加（questionを省略した場合は演算子から問題文を作る）"""
+        problems.append({
+            'ばんごう': len(problems) + 1,
+            'もんだい': question or self.format_vertical_equation(nums, operator),
+            'こたえ': '',  # 生徒が記入する答え欄
+            'せいかい': answer
+        })
+        self.generated_keys.append(key)
+        self.generated_terms.append((nums, operator))
+    
+    def reset_generated(self):
+        """直近に生成した問題の記録を空にする"""
+        self.generated_keys = []
+        self.generated_terms = []
+    
+    def sample_candidates(self, operator: str, count: int) -> List[Tuple[List[int], Any]]:
+        """候補をcount個ランダムに作り、条件を満たすもの（オペランドと答え）を返す"""
+        import numpy as np
+        from candidates import sample_block
+        
+        block = sample_block(self.settings, operator, count, np.random.default_rng(self.rng.getrandbits(64)))
+        return [(block.operands[i].tolist(), block.answer(i)) for i in np.flatnonzero(block.valid)]
+    
+    def finalize_problems(self, problems: List[Dict[str, Any]]) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+        """順序設定を適用して番号を振り直し、DataFrameにする"""
+        return self.problem_dataframes(self.order_problems(problems))
+    
+    def order_problems(self, problems: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """順序設定を適用して番号を振り直す"""
+        if self.settings.get('sort_by_difficulty', False):
+            # 難しさは演算子ごとにまとめて計算する（problemsはgenerated_termsと同じ順）
+            for problem, score in zip(problems, self.difficulty_scores()):
+                problem['_score'] = score
         
         # 順序設定の適用
         if self.settings['randomize_order']:
             # ランダム順序
-            random.shuffle(problems)
-            random.shuffle(answers)
+            self.rng.shuffle(problems)
         else:
             # 昇順（数値順）
             def extract_numbers(problem):
@@ -332,57 +418,370 @@ class MathProblemGenerator:
                 return [int(n) for n in numbers]
             
             problems.sort(key=lambda x: extract_numbers(x))
-            answers.sort(key=lambda x: extract_numbers(problems[x['もんだいばんごう']-1]))
+        
+        if self.settings.get('sort_by_difficulty', False):
+            # やさしい問題から順に（同じ難しさの中では上の順序のまま）
+            problems.sort(key=lambda x: x.pop('_score'))
         
         # 番号の再割り当て
         for i, problem in enumerate(problems):
             problem['ばんごう'] = i + 1
-        for i, answer in enumerate(answers):
-            answer['もんだいばんごう'] = i + 1
+        return problems
+    
+    @staticmethod
+    def problem_dataframes(problems: List[Dict[str, Any]]) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+        """問題の行から問題と解答のDataFrameを作る（解答は問題と同じ順）"""
+        import pandas as pd
         
+        answers = [{'もんだいばんごう': problem['ばんごう'], 'せいかい': problem['せいかい']} for problem in problems]
         return pd.DataFrame(problems), pd.DataFrame(answers)
     
-    def get_min_value(self, operator: str) -> int:
-        """最小値取得"""
-        min_map = {
-            "+": self.settings['add_min1'],
-            "-": self.settings['sub_min1'],
-            "*": self.settings['mul_min1'],
-            "/": self.settings['div_min1']
-        }
-        return min_map.get(operator, 1)
-    
-    def get_max_value(self, operator: str) -> int:
-        """最大値取得"""
-        max_map = {
-            "+": self.settings['add_max1'],
-            "-": self.settings['sub_max1'],
-            "*": self.settings['mul_max1'],
-            "/": self.settings['div_max1']
-        }
-        return max_map.get(operator, 10)
+    def enumerate_coverage(self, operator: str, np_rng=None) -> List[Tuple[List[int], Any]]:
+        """網羅モードで使う有効な組み合わせ（オペランドと答え）を列挙（項ごとの範囲の全組み合わせ）"""
+        import numpy as np
+        from candidates import CandidateBlock, enumerate_operands
+        
+        combinations = enumerate_operands(self.settings, operator, rng=np_rng)
+        if len(combinations) == 0:
+            return []
+        block = CandidateBlock(self.settings, operator, combinations, np_rng)
+        return [(block.operands[i].tolist(), block.answer(i)) for i in np.flatnonzero(block.valid)]
+    
+    def difficulty_scores(self) -> List[int]:
+        """直近に生成した問題の難しさ（generated_termsと同じ順）"""
+        import numpy as np
+        from difficulty import difficulty_features, difficulty_scores
+        
+        scores = [0] * len(self.generated_terms)
+        groups: Dict[Tuple[str, int], List[int]] = {}
+        for i, (nums, operator) in enumerate(self.generated_terms):
+            groups.setdefault((operator, len(nums)), []).append(i)
+        for (operator, _), indexes in groups.items():
+            operands = np.array([self.generated_terms[i][0] for i in indexes])
+            for i, score in zip(indexes, difficulty_scores(difficulty_features(operands, operator)).tolist()):
+                scores[i] = score
+        return scores
+    
+    def plan_key(self) -> str:
+        """生成プランのキー（問題数と順序はプランに影響しないので除く）"""
+        settings = {k: v for k, v in self.settings.items() if k not in ('question_count', 'randomize_order')}
+        return settings_fingerprint(settings)
+    
+    def build_generation_plan(self) -> Dict[str, Any]:
+        """網羅モードの組み合わせを列挙済みにした生成プランを作る
+        
+        余りなしのわり算は被除数を毎回ランダムに決めるため、プランには含めない。
+        """
+        coverage = {}
+        coverage_keys = {"+": 'add_coverage', "-": 'sub_coverage', "*": 'mul_coverage', "/": 'div_coverage'}
+        for operator in self.OPERATOR_MAP.get(self.settings['problem_type'], ["+"]):
+            if self.settings[coverage_keys[operator]] != 2:
+                continue
+            if operator == "/" and self.settings['div_limit'] == 1:
+                continue
+            coverage[operator] = [[nums, answer] for nums, answer in self.enumerate_coverage(operator)]
+        return {'key': self.plan_key(), 'coverage': coverage}
     
-    def generate_combinations(self, min_val: int, max_val: int) -> List[List[int]]:
-        """組み合わせ生成"""
-        combinations = []
-        for i in range(min_val, max_val + 1):
-            for j in range(min_val, max_val + 1):
-                combinations.append([i, j])
-        return combinations
+    @classmethod
+    def register_plan(cls, plan: Dict[str, Any]) -> None:
+        """生成プランを登録（同じ設定の生成で列挙を省く）"""
+        with cls._plans_lock:
+            cls._plans[plan['key']] = plan
+            cls._plans.move_to_end(plan['key'])
+            while len(cls._plans) > MAX_REGISTERED_PLANS:
+                cls._plans.popitem(last=False)
+    
+    def get_plan(self) -> Optional[Dict[str, Any]]:
+        key = self.plan_key()
+        with self._plans_lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+            return plan
     
     @property
     def settings(self) -> Dict[str, Any]:
+        if self._settings is not None:
+            return self._settings
         return st.session_state.settings
 
 
+@st.cache_resource
+def get_problem_pool() -> ProblemPool:
+    """全セッション共通の問題プール（よく使われる設定を起動時から補充しておく）"""
+    pool = ProblemPool(lambda settings: MathProblemGenerator(settings).generate_problems())
+    pool.warm_up(MathProblemGenerator.default_settings())
+    return pool
+
+
+
+def generation_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """問題生成ボタンと同じ条件で生成するための設定（網羅モードは上限まで生成）"""
+    settings = copy.deepcopy(settings)
+    if settings['generation_mode'] == 2:
+        settings['question_count'] = COVERAGE_QUESTION_LIMIT
+    return settings
+
+def apply_preset(name: str) -> bool:
+    """プリセットを読み込んで現在の設定に反映"""
+    preset = get_preset_store().load(name)
+    if preset is None:
+        return False
+    
+    # 現在のバージョンに無い項目は捨て、足りない項目はデフォルト値で補う
+    settings = MathProblemGenerator.default_settings()
+    settings.update({k: v for k, v in preset['settings'].items() if k in settings})
+    st.session_state.settings = settings
+    
+    generator = MathProblemGenerator()
+    generator.validate_slider_values()
+    if preset['plan'].get('key') == generator.plan_key():
+        MathProblemGenerator.register_plan(preset['plan'])
+    bank = get_preset_store().take_bank(name)
+    if bank:
+        get_problem_pool().add(generation_settings(settings), bank)
+    
+    # スライダー等は前回の値を保持しているので、設定値から作り直させる
+    for key in list(st.session_state.keys()):
+        if key.endswith(('_slider', '_radio')):
+            del st.session_state[key]
+    return True
+
+def show_preset_controls(generator: MathProblemGenerator):
+    """プリセットの保存・読み込み"""
+    store = get_preset_store()
+    names = store.list_names()
+    
+    if names:
+        selected = st.selectbox("保存済みプリセット", options=names, key="preset_select")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("📂 読み込む", use_container_width=True, key="load_preset"):
+                if apply_preset(selected):
+                    st.rerun()
+                st.error("プリセットを読み込めませんでした")
+        with col2:
+            if st.button("🗑️ 削除", use_container_width=True, key="delete_preset"):
+                store.delete(selected)
+                st.rerun()
+    
+    name = st.text_input("プリセット名", key="preset_name")
+    include_bank = st.checkbox("問題セットも保存", value=False, key="preset_include_bank")
+    st.caption(f"オンにすると{PRESET_BANK_SIZE}回分の問題を作り置きし、次に読み込んだときにすぐ使えます（作り置きは一度だけ使われます）")
+    if st.button("💾 現在の設定を保存", use_container_width=True, key="save_preset"):
+        if not name.strip():
+            st.warning("プリセット名を入力してください")
+            return
+        generator.validate_slider_values()
+        bank = None
+        if include_bank:
+            settings = generation_settings(generator.settings)
+            bank = [MathProblemGenerator(settings).generate_problems() for _ in range(PRESET_BANK_SIZE)]
+        store.save(name.strip(), copy.deepcopy(generator.settings), generator.build_generation_plan(), bank)
+        st.success(f"プリセット「{name.strip()}」を保存しました")
+
+def show_bundle_controls(formatter: OutputFormatter, generator: MathProblemGenerator):
+    """生徒ごとに問題の違うプリントを、クラスの人数分まとめて作成"""
+    from bundle import BUNDLE_PDF, BUNDLE_ZIP, MAX_BUNDLE_STUDENTS, submit_bundle_job
+    
+    with st.expander("👥 クラス分をまとめて作成"):
+        student_count = st.number_input(
+            "人数", min_value=1, max_value=MAX_BUNDLE_STUDENTS, value=30, step=1, key="bundle_student_count"
+        )
+        if 'bundle_seed' not in st.session_state:
+            st.session_state.bundle_seed = random.randrange(100000)
+        base_seed = st.number_input("プリント番号", min_value=0, max_value=999999, step=1, key="bundle_seed")
+        st.caption("設定とプリント番号が同じなら、同じ問題を作り直せます")
+        if generator.settings.get('problem_source', 1) == 2:
+            st.info("同じ問題を作り直せるよう、まとめて作成するときは問題バンクを使わずにその場で生成します")
+        bundle_format = st.radio(
+            "出力形式",
+            options=[BUNDLE_PDF, BUNDLE_ZIP],
+            format_func=lambda x: "1つのPDF" if x == BUNDLE_PDF else "1人ずつのPDF（ZIP）",
+            key="bundle_format"
+        )
+        if bundle_format == BUNDLE_ZIP:
+            st.caption("全員分の解答（解答.pdf）も入ります")
+        
+        if st.button("👥 まとめて作成", use_container_width=True, key="create_bundle"):
+            clear_pdf_outputs()
+            st.session_state.pdf_job = submit_bundle_job(
+                formatter, generator.settings, int(student_count), int(base_seed), bundle_format
+            )
+
+def submit_pdf_job(formatter: OutputFormatter, settings: Dict[str, Any], problems_df, answers_df):
+    """PDF全体の生成ジョブを投入してセッションに保持"""
+    file_name = f"{settings['header_text']}_{len(problems_df)}問.pdf"
+    st.session_state.pdf_job = formatter.submit_pdf_job(problems_df, answers_df, settings, file_name)
+
+def clear_pdf_outputs():
+    """前回の問題セットのPDF（生成中のジョブ・プレビュー・完成品）と書き出したデータを破棄"""
+    store = get_session_store()
+    if 'pdf_job' in st.session_state:
+        st.session_state.pdf_job.cancel()
+        del st.session_state.pdf_job
+    st.session_state.pop('pdf_download', None)
+    store.delete('pdf')
+    store.delete('pdf_preview')
+    store.delete('export')
+    store.delete('print_html')
+
+def show_export_controls(generator: MathProblemGenerator):
+    """生成した問題をCSV・JSON Lines・XLSXで書き出す"""
+    from exports import EXPORT_FORMATS, EXPORT_MIME_TYPES, write_export
+    
+    store = get_session_store()
+    if 'problems_df' not in store:
+        return
+    
+    with st.expander("📤 データで書き出す"):
+        export_format = st.selectbox(
+            "形式", options=list(EXPORT_FORMATS), format_func=EXPORT_FORMATS.get, key="export_format"
+        )
+        answers_only = False
+        if export_format == 'xlsx':
+            st.caption("問題と解答を別のシートにします")
+        else:
+            answers_only = st.checkbox("解答だけを書き出す", key="export_answers_only")
+        
+        if st.button("📤 書き出す", use_container_width=True, key="create_export"):
+            problems_df = store.get('problems_df')
+            buffer = io.BytesIO()
+            write_export(export_format, problems_df, store.get('answers_df'), buffer, answers_only)
+            suffix = "_解答" if answers_only else ""
+            store.put('export', {
+                'data': buffer.getvalue(),
+                'file_name': f"{generator.settings['header_text']}_{len(problems_df)}問{suffix}.{export_format}",
+                'mime': EXPORT_MIME_TYPES[export_format],
+            })
+        
+        export = store.get('export')
+        if export is not None:
+            st.download_button(
+                f"💾 {export['file_name']}",
+                data=export['data'],
+                file_name=export['file_name'],
+                mime=export['mime'],
+                use_container_width=True,
+                key="export_download"
+            )
+
+def show_print_html_controls(generator: MathProblemGenerator):
+    """ブラウザからそのまま印刷できるHTML（PDFを作らずに印刷する場合）"""
+    from print_html import PRINT_HTML_MIME, print_html_key, render_print_html
+    
+    store = get_session_store()
+    if 'problems_df' not in store:
+        return
+    
+    with st.expander("🖨️ ブラウザで印刷（HTML）"):
+        # 文書はボタンを押したときだけ作る（同じ問題・同じ印刷設定なら、前に作った文書をそのまま使う）
+        key = print_html_key(generator.settings)
+        print_html = store.get('print_html')
+        if print_html is not None and print_html['key'] != key:
+            # 印刷設定が変わった古い文書は捨てる
+            store.delete('print_html')
+            print_html = None
+        if print_html is None:
+            if not st.button("🖨️ 印刷用HTMLを作成", use_container_width=True, key="create_print_html"):
+                return
+            problems_df = store.get('problems_df')
+            document = render_print_html(problems_df, store.get('answers_df'), generator.settings)
+            print_html = {
+                'key': key,
+                'data': document.encode('utf-8'),
+                'file_name': f"{generator.settings['header_text']}_{len(problems_df)}問.html",
+            }
+            store.put('print_html', print_html)
+        
+        st.download_button(
+            f"💾 {print_html['file_name']}",
+            data=print_html['data'],
+            file_name=print_html['file_name'],
+            mime=PRINT_HTML_MIME,
+            use_container_width=True,
+            key="print_html_download"
+        )
+        st.caption("開いたファイルの「印刷」ボタン（またはブラウザの印刷）で印刷できます。余白・段数・枠線は表示設定の「ブラウザ印刷設定」で変えられます")
+
+def show_pdf_preview(formatter: OutputFormatter, generator: MathProblemGenerator):
+    """1ページ目のプレビューと、PDF全体を作成するボタンを表示"""
+    store = get_session_store()
+    pdf_preview = store.get('pdf_preview')
+    if pdf_preview is None:
+        return
+    
+    if 'pdf_job' not in st.session_state and 'pdf_download' not in st.session_state:
+        if st.button("📄 PDFを作成してダウンロード", use_container_width=True, key="create_full_pdf"):
+            submit_pdf_job(formatter, generator.settings, store.get('problems_df'), store.get('answers_df'))
+    
+    with st.expander("👀 1ページ目のプレビュー", expanded=True):
+        st.markdown(formatter.create_inline_preview(pdf_preview), unsafe_allow_html=True)
+
+def show_pdf_job_status(formatter: OutputFormatter) -> bool:
+    """バックグラウンドのPDF生成の進捗、または完成したPDFのリンクを表示（生成中ならTrue）"""
+    store = get_session_store()
+    job = st.session_state.get('pdf_job')
+    if job is not None:
+        if not job.done():
+            st.progress(job.progress, text=f"PDFを生成中... {job.pages_rendered}/{job.total_pages}{job.unit}")
+            return True
+        
+        # 完成したPDFはストアに移し、ジョブは破棄する
+        del st.session_state.pdf_job
+        try:
+            pdf_buffer = job.result()
+        except Exception as e:
+            st.error(f"PDFの生成に失敗しました: {e}")
+            return False
+        if pdf_buffer is None:
+            st.error("PDFの生成に失敗しました")
+            return False
+        store.put('pdf', pdf_buffer)
+        st.session_state.pdf_download = {'file_name': job.file_name, 'delivered': False}
+    
+    download = st.session_state.get('pdf_download')
+    pdf_buffer = store.get('pdf')
+    if download is None or pdf_buffer is None:
+        return False
+    
+    # ダウンロードボタンはファイルをURLで渡すので、再実行のたびに中身を送り直さない
+    extension = os.path.splitext(download['file_name'])[1].lower()
+    st.download_button(
+        f"💾 {extension.lstrip('.').upper() or 'PDF'}をダウンロード",
+        data=pdf_buffer.getvalue(),
+        file_name=download['file_name'],
+        mime=DOWNLOAD_MIME_TYPES.get(extension, 'application/pdf'),
+        key="pdf_download_button"
+    )
+    size_label = "ZIPサイズ" if extension == '.zip' else "PDFサイズ"
+    st.caption(f"{size_label}: {formatter.format_file_size(len(pdf_buffer.getbuffer()))}")
+    
+    # 自動ダウンロードは完成直後の1回だけ（base64に変換して送るのもこの1回だけ）
+    if not download['delivered']:
+        b64_pdf = base64.b64encode(pdf_buffer.getvalue()).decode()
+        script = formatter.create_auto_download_script(b64_pdf, download['file_name'])
+        st.markdown(script, unsafe_allow_html=True)
+        download['delivered'] = True
+    return False
 
 def main():
+    # ページ設定（pages/ から main をインポートしたときに二重に呼ばれないよう、ここで設定）
+    st.set_page_config(
+        page_title="けいさんドリル作成ツール",
+        page_icon="🧮",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
     st.title("🧮 けいさんドリル作成ツール")
     st.markdown("---")
     
     # ジェネレーターとフォーマッターの初期化
     generator = MathProblemGenerator()
     formatter = OutputFormatter()
+    get_problem_pool()
+    pdf_job_running = False
     
     # バリデーション実行
     generator.validate_slider_values()
@@ -394,11 +793,8 @@ def main():
         # 問題形式
         problem_type = st.selectbox(
             "問題形式",
-            options=[1, 2, 3, 4, 5, 6],
-            format_func=lambda x: {
-                1: "足し算", 2: "引き算", 3: "足し引き混合",
-                4: "かけ算", 5: "わり算", 6: "四則混合"
-            }[x],
+            options=list(PROBLEM_TYPE_LABELS),
+            format_func=lambda x: PROBLEM_TYPE_LABELS[x],
             index=generator.settings['problem_type'] - 1
         )
         generator.settings['problem_type'] = problem_type
@@ -456,6 +852,19 @@ def main():
         
 
         
+        # 出題履歴
+        st.markdown("---")
+        student = st.text_input("生徒・クラス名（任意）", key="history_student")
+        if student.strip():
+            st.caption(f"最近出題した問題を避けます（出題履歴: {len(get_history_store().get(student.strip()))}問）")
+        else:
+            st.caption("入力すると、その生徒・クラスに最近出題した問題を避けます")
+        
+        # プリセット
+        st.markdown("---")
+        st.subheader("💾 プリセット")
+        show_preset_controls(generator)
+        
         # 詳細設定ページへのリンク
         st.markdown("---")
         # st.subheader("🔗 ページリンク")
@@ -466,6 +875,9 @@ def main():
         # if st.button("🖨️ 表示設定ページ", use_container_width=True, key="go_to_display_settings"):
         #     st.session_state.show_display_settings = True
             # st.rerun()
+        if st.button("✅ 採点ページ", use_container_width=True, key="go_to_grading"):
+            st.session_state.show_grading = True
+            st.rerun()
         if st.button("📖 使い方ページ", use_container_width=True, key="go_to_usage_guide"):
             st.session_state.show_usage_guide = True
             st.rerun()
@@ -518,6 +930,16 @@ def main():
                 generator.initialize_default_settings()
                 st.rerun()
     
+    # 採点ページの表示制御
+    elif st.session_state.get('show_grading', False):
+        # 採点ページを表示
+        from grading_page import show_grading_page
+        show_grading_page(generator)
+        
+        if st.button("🏠 メインページに戻る", use_container_width=True, key="back_to_main_grading"):
+            st.session_state.show_grading = False
+            st.rerun()
+    
     # 使い方ページの表示制御
     elif st.session_state.get('show_usage_guide', False):
         # 使い方ページを表示
@@ -551,42 +973,76 @@ def main():
                     # 組み合わせ網羅モードの場合は問題数を十分大きく設定
                     if generator.settings['generation_mode'] == 2:
                         original_count = generator.settings['question_count']
-                        generator.settings['question_count'] = 10000  # 十分大きな数
+                        generator.settings['question_count'] = COVERAGE_QUESTION_LIMIT
                     
-                    problems_df, answers_df = generator.generate_problems()
+                    student = st.session_state.get('history_student', '').strip()
+                    if student:
+                        generator.history = get_history_store().get(student)
                     
-                    # 組み合わせ網羅モードの場合は実際の生成数を設定に反映
-                    if generator.settings['generation_mode'] == 2:
-                        generator.settings['question_count'] = len(problems_df)
-                    
-                    st.session_state.problems_df = problems_df
-                    st.session_state.answers_df = answers_df
-                    st.success(f"{len(problems_df)}問の問題が生成されました！")
+                    use_bank = generator.settings.get('problem_source', 1) == 2 and \
+                        generator.settings['problem_type'] != generator.EXPRESSION_TYPE
+                    if use_bank:
+                        # 問題バンクから条件に合う問題を抽出（書き出し済みならメモリマップ版を使う）
+                        # 書き出した後に問題が追加・削除されていたら、古い書き出しは使わずSQLiteから抽出する
+                        from mmap_bank import get_mmap_bank
+                        bank = get_mmap_bank()
+                        if not bank.available() or bank.revision() != get_problem_bank().revision():
+                            bank = get_problem_bank()
+                        problems_df, answers_df = bank.build_worksheet(generator)
+                    elif generator.history is not None:
+                        # 出題履歴を見ながら生成するので、作り置きは使わない
+                        problems_df, answers_df = generator.generate_problems()
+                    else:
+                        # よく使われる設定はプールに生成済みの問題セットから取り出す
+                        problems_df, answers_df = get_problem_pool().take(generator.settings)
                     
-                    # PDFも同時に生成・ダウンロード
-                    with st.spinner("PDFを生成中..."):
-                        pdf_buffer = formatter.create_pdf(problems_df, answers_df, generator.settings)
+                    if len(problems_df) == 0:
+                        if generator.settings['generation_mode'] == 2:
+                            generator.settings['question_count'] = original_count
+                        st.error("条件に合う問題がありません。設定を見直すか、問題バンクに問題を追加してください。")
+                    else:
+                        # 組み合わせ網羅モードの場合は実際の生成数を設定に反映
+                        if generator.settings['generation_mode'] == 2:
+                            generator.settings['question_count'] = len(problems_df)
+                        
+                        if generator.history is not None:
+                            generator.history.record(generator.generated_keys)
                         
-                        # PDFを自動ダウンロード
-                        file_name = f"{generator.settings['header_text']}_{len(problems_df)}問.pdf"
-                        href, b64_pdf = formatter.create_download_link(pdf_buffer, file_name)
+                        # 生成した問題はセッションストアに保持（メモリ予算を超えたらディスクへ退避）
+                        store = get_session_store()
+                        store.put('problems_df', problems_df)
+                        store.put('answers_df', answers_df)
+                        st.success(f"{len(problems_df)}問の問題が生成されました！")
                         
-                        st.markdown(href, unsafe_allow_html=True)
+                        clear_pdf_outputs()
                         
-                        # 自動ダウンロードのJavaScript
-                        script = formatter.create_auto_download_script(b64_pdf, file_name)
-                        st.markdown(script, unsafe_allow_html=True)
+                        if generator.settings.get('print_preview_mode', False):
+                            # プレビューモード: 1ページ目だけ描画し、PDF全体はダウンロード時に作成
+                            store.put('pdf_preview', formatter.create_preview_pdf(problems_df, generator.settings))
+                        else:
+                            # PDFはワーカープールで生成し、画面はそのまま操作できるようにする
+                            submit_pdf_job(formatter, generator.settings, problems_df, answers_df)
         
         with col2:
             if st.button("📊 設定をリセット", use_container_width=True, key="reset_settings_main"):
                 generator.initialize_default_settings()
                 st.rerun()
         
+        # クラス分のプリント
+        show_bundle_controls(formatter, generator)
+        
+        # プレビューとPDF生成の進捗・ダウンロード
+        show_pdf_preview(formatter, generator)
+        pdf_job_running = show_pdf_job_status(formatter)
+        show_export_controls(generator)
+        show_print_html_controls(generator)
+        
         # st.markdown("---")
         
         # 問題の表示
-        if 'problems_df' in st.session_state:
-            formatter.display_problems(st.session_state.problems_df, st.session_state.answers_df, generator.settings)
+        store = get_session_store()
+        if 'problems_df' in store:
+            formatter.display_problems(store.get('problems_df'), store.get('answers_df'), generator.settings)
         else:
             # st.info("👆 上記の「問題生成」ボタンをクリックして問題を生成してください。")
             
@@ -595,10 +1051,7 @@ def main():
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                st.metric("問題形式", {
-                    1: "足し算", 2: "引き算", 3: "足し引き混合",
-                    4: "かけ算", 5: "わり算", 6: "四則混合"
-                }[generator.settings['problem_type']])
+                st.metric("問題形式", PROBLEM_TYPE_LABELS[generator.settings['problem_type']])
                 st.metric("項数", f"{generator.settings['term_count']}項")
             
             with col2:
@@ -642,6 +1095,11 @@ def main():
     }
     </style>
     """, unsafe_allow_html=True)
+    
+    # PDF生成中は画面を描き終えてから進捗を取りに再実行する
+    if pdf_job_running:
+        time.sleep(PDF_JOB_POLL_INTERVAL)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,240 @@
+import streamlit as st
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from problem_bank import ProblemBank, pick_rows, rows_to_worksheet
+from problem_keys import OPERATOR_CODES, unique_problem_indexes
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# メモリマップ形式の問題バンクの保存先（環境変数で変更可能）
+MMAP_BANK_DIR = os.environ.get(
+    'MATH_CREATOR_MMAP_BANK_DIR',
+    os.path.join(os.path.expanduser('~'), '.math_creator', 'problem_bank_mmap')
+)
+MMAP_BANK_VERSION = 1
+
+# オペランド行列の列数（項数の上限）
+MAX_TERMS = 5
+
+CODE_OPERATORS = {code: operator for operator, code in OPERATOR_CODES.items()}
+
+# 答えの種類（整数・小数・余りあり）
+ANSWER_INT = 0
+ANSWER_FLOAT = 1
+ANSWER_REMAINDER = 2
+
+# 配列の名前 → (1行あたりの形, 型)
+COLUMNS = {
+    'operands': ((MAX_TERMS,), np.int32),
+    'operators': ((), np.uint8),
+    'term_counts': ((), np.uint8),
+    'rest_min': ((), np.int32),
+    'rest_max': ((), np.int32),
+    'answer_values': ((), np.float64),
+    'remainders': ((), np.int64),
+    'answer_kinds': ((), np.uint8),
+    'carry_counts': ((), np.uint8),
+}
+
+
+def export_problem_bank(bank: ProblemBank, directory: str = MMAP_BANK_DIR) -> int:
+    """SQLiteの問題バンクをメモリマップ用の.npyファイルに書き出す
+
+    書き出し先は毎回新しいサブディレクトリにし、最後にmeta.jsonを置き換えて切り替える。
+    読み込み中のプロセスは古いファイルをそのまま使い続けられる。
+    """
+    revision = bank.revision()
+    rows = list(bank.all_rows())
+    count = len(rows)
+    arrays = {name: np.zeros((count,) + shape, dtype) for name, (shape, dtype) in COLUMNS.items()}
+
+    for i, row in enumerate(rows):
+        nums, answer = row['operands'], row['answer']
+        arrays['operands'][i, :len(nums)] = nums
+        arrays['operators'][i] = OPERATOR_CODES[row['operator']]
+        arrays['term_counts'][i] = len(nums)
+        rest = nums[1:] or [0]
+        arrays['rest_min'][i] = min(rest)
+        arrays['rest_max'][i] = max(rest)
+        arrays['carry_counts'][i] = row['carry_count']
+        if isinstance(answer, str):
+            quotient, remainder = answer.split(" 余り ")
+            arrays['answer_values'][i] = int(quotient)
+            arrays['remainders'][i] = int(remainder)
+            arrays['answer_kinds'][i] = ANSWER_REMAINDER
+        else:
+            arrays['answer_values'][i] = answer
+            arrays['answer_kinds'][i] = ANSWER_FLOAT if isinstance(answer, float) else ANSWER_INT
+
+    snapshot = f"snapshot-{revision[0]}-{revision[1]}"
+    snapshot_dir = os.path.join(directory, snapshot)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(snapshot_dir, f"{name}.npy"), array)
+
+    meta = {'version': MMAP_BANK_VERSION, 'snapshot': snapshot, 'count': count, 'revision': list(revision)}
+    meta_path = os.path.join(directory, 'meta.json')
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+    # 古いスナップショットを削除（開いているプロセスのマップは削除後も有効）
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith('snapshot-') and name != snapshot and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return count
+
+
+class MmapProblemBank:
+    """.npyファイルをnumpy.memmapで開いて問題を抽出する
+
+    ファイルはOSのページキャッシュを通して全プロセスで共有されるため、
+    プロセスごとの読み込みや候補表の作り直しが要らない。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        self._snapshot: Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray]]] = None
+
+    def _current(self) -> Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+        """最新のスナップショットの (meta, 配列)（書き出されていなければNone）
+
+        1回の処理の途中でスナップショットが切り替わっても古い配列と新しい配列が
+        混ざらないよう、呼び出し側は1回だけ取得して最後までその配列を使う。
+        """
+        meta_path = os.path.join(self.directory, 'meta.json')
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._meta_mtime:
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta.get('version') != MMAP_BANK_VERSION:
+                    return None
+                snapshot_dir = os.path.join(self.directory, meta['snapshot'])
+                arrays = {
+                    name: np.load(os.path.join(snapshot_dir, f"{name}.npy"), mmap_mode='r')
+                    for name in COLUMNS
+                }
+                self._snapshot, self._meta_mtime = (meta, arrays), mtime
+            return self._snapshot
+
+    def available(self) -> bool:
+        snapshot = self._current()
+        return snapshot is not None and len(snapshot[1]['operators']) > 0
+
+    def revision(self) -> Optional[Tuple[int, int]]:
+        """書き出し元のProblemBank.revision()（書き出されていなければNone）"""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        return tuple(snapshot[0]['revision'])
+
+    def mask(self, **filters) -> np.ndarray:
+        """条件に合う問題の真偽値配列（条件名はproblem_bank.FILTERSと同じ）"""
+        snapshot = self._current()
+        if snapshot is None:
+            return np.zeros(0, dtype=bool)
+        return self._mask(snapshot[1], filters)
+
+    @staticmethod
+    def _mask(arrays: Dict[str, np.ndarray], filters: Dict[str, Any]) -> np.ndarray:
+        result = np.ones(len(arrays['operators']), dtype=bool)
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name == 'operator':
+                result &= arrays['operators'] == OPERATOR_CODES[value]
+            elif name == 'term_count':
+                result &= arrays['term_counts'] == value
+            elif name == 'first_min':
+                result &= arrays['operands'][:, 0] >= value
+            elif name == 'first_max':
+                result &= arrays['operands'][:, 0] <= value
+            elif name == 'rest_min':
+                result &= arrays['rest_min'] >= value
+            elif name == 'rest_max':
+                result &= arrays['rest_max'] <= value
+            elif name == 'answer_min':
+                result &= arrays['answer_values'] >= value
+            elif name == 'answer_max':
+                result &= arrays['answer_values'] <= value
+            elif name == 'has_remainder':
+                result &= (arrays['answer_kinds'] == ANSWER_REMAINDER) == bool(value)
+            elif name == 'carry_min':
+                result &= arrays['carry_counts'] >= value
+            elif name == 'carry_max':
+                result &= arrays['carry_counts'] <= value
+            else:
+                raise ValueError(f"不明な抽出条件です: {name}")
+        return result
+
+    def count(self, **filters) -> int:
+        return int(np.count_nonzero(self.mask(**filters)))
+
+    def fetch(self, indexes: np.ndarray) -> List[Dict[str, Any]]:
+        """行番号の順に問題を取り出す（必要な行だけを読む）"""
+        return self._fetch(self._current()[1], indexes)
+
+    @staticmethod
+    def _fetch(arrays: Dict[str, np.ndarray], indexes: np.ndarray) -> List[Dict[str, Any]]:
+        operands = arrays['operands'][indexes]
+        operators = arrays['operators'][indexes]
+        term_counts = arrays['term_counts'][indexes]
+        values = arrays['answer_values'][indexes]
+        remainders = arrays['remainders'][indexes]
+        kinds = arrays['answer_kinds'][indexes]
+        carries = arrays['carry_counts'][indexes]
+
+        rows = []
+        for i in range(len(indexes)):
+            if kinds[i] == ANSWER_REMAINDER:
+                answer = f"{int(values[i])} 余り {int(remainders[i])}"
+            elif kinds[i] == ANSWER_FLOAT:
+                answer = float(values[i])
+            else:
+                answer = int(values[i])
+            rows.append({
+                'operator': CODE_OPERATORS[int(operators[i])],
+                'operands': [int(n) for n in operands[i, :term_counts[i]]],
+                'answer': answer,
+                'carry_count': int(carries[i]),
+            })
+        return rows
+
+    def build_worksheet(self, generator) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+        """ジェネレーターの設定に合う問題を抽出してプリントを作る（ProblemBankと同じ条件）"""
+        settings = generator.settings
+        _, arrays = self._current()
+        mask = np.zeros(len(arrays['operators']), dtype=bool)
+        for operator in generator.OPERATOR_MAP.get(settings['problem_type'], ["+"]):
+            mask |= self._mask(arrays, ProblemBank.settings_filters(settings, operator))
+        candidates = np.flatnonzero(mask)
+        if settings.get('dedup_commutative', False):
+            # 3+5と5+3のように交換しただけの問題は1つにまとめる
+            candidates = candidates[unique_problem_indexes(
+                arrays['operands'][candidates], arrays['operators'][candidates],
+                arrays['term_counts'][candidates], commutative=True
+            )]
+
+        generator.rng.seed()
+        picked = pick_rows(generator, len(candidates), lambda positions: self._fetch(arrays, candidates[positions]))
+        return rows_to_worksheet(generator, picked)
+
+
+@st.cache_resource
+def get_mmap_bank() -> MmapProblemBank:
+    """プロセス内で共有するメモリマップ形式の問題バンク"""
+    return MmapProblemBank(MMAP_BANK_DIR)
@@ -1,28 +1,192 @@
 import streamlit as st
-import pandas as pd
+# ReportLabの描画・フォント関連モジュールは読み込みに時間がかかるため、
+# 起動を速くするよう最初のPDF生成時に各メソッド内で読み込む
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import functools
+import hashlib
 import io
 import base64
+import itertools
+import math
 import os
 
+# 埋め込み用TrueTypeフォントの候補（先頭から順に探す）
+EMBED_FONT_CANDIDATES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'ipaexm.ttf'),  # 同梱フォント
+    'C:/Windows/Fonts/msmincho.ttc',                                  # Windows標準
+    'C:/Windows/Fonts/msgothic.ttc',                                  # Windows標準（ゴシック体）
+    '/usr/share/fonts/opentype/ipaexfont-mincho/ipaexm.ttf',          # Linux（IPAexフォント）
+    '/usr/share/fonts/truetype/fonts-japanese-mincho.ttf',            # Linux（Debian系）
+    '/Library/Fonts/Arial Unicode.ttf',                               # macOS
+]
+
+# 画面に表示する問題の1ページあたりの件数
+DISPLAY_PAGE_SIZE_OPTIONS = [50, 100, 200, 500]
+
+# ダウンロードするファイルの拡張子ごとのMIMEタイプ
+DOWNLOAD_MIME_TYPES = {
+    '.pdf': 'application/pdf',
+    '.zip': 'application/zip',
+}
+
+# バックグラウンドでPDFを描画するワーカー数（全セッション共通）
+PDF_WORKER_COUNT = 2
+
+# これより行数の多い問題セットは、表（Table）を組まずに1ページずつ書き出す
+STREAM_PDF_ROW_THRESHOLD = 2000
+
+# 問題のレイアウト（出力スタイルのproblem_layout）
+LAYOUT_TABLE = 1  # 横書きの表
+LAYOUT_VERTICAL = 2  # 筆算
+
+# 筆算のページの左右の余白と、解答の数字の色
+VERTICAL_PAGE_MARGIN = 30
+VERTICAL_ANSWER_COLOR = 'red'
+
+# フォーム名に使えない記号の言い換え（筆算のマス目のフォーム名用）
+_FORM_NAME_SYMBOLS = {'+': 'p', '−': 'm', '×': 'x'}
+
+def _form_name(kind, *parts):
+    """描く内容から決まるフォーム名（同じ内容のフォームは文書内で1つの名前になる）"""
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+    return f"{kind}_{digest}"
+
+def _pdf_canvas_class(page_compression):
+    """pageCompressionの値に合うキャンバスのクラス（1はコンパクトのプロファイルで、ASCII85で包まない）"""
+    from reportlab.pdfgen import canvas as pdf_canvas
+    
+    return _flate_canvas_class() if page_compression == 1 else pdf_canvas.Canvas
+
+@functools.lru_cache(maxsize=None)
+def _flate_canvas_class():
+    from reportlab.pdfbase import pdfdoc
+    from reportlab.pdfgen import canvas as pdf_canvas
+    
+    def flate_stream(content, comment):
+        stream = pdfdoc.PDFStream(content=content, filters=[pdfdoc.PDFZCompress])
+        stream.__Comment__ = comment
+        return stream
+    
+    class FlateCanvas(pdf_canvas.Canvas):
+        """ページとフォームの内容をASCII85で包まずにFlateだけで圧縮するキャンバス
+        
+        rl_config.useA85 はプロセス全体の設定なので変えず、この文書に加えるページと
+        フォームに圧縮の方法を先に指定しておく（他の文書の描画と同時に行える）。
+        """
+        
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            doc = self._doc
+            add_page, add_form = doc.addPage, doc.addForm
+            
+            def addPage(page):
+                page.Contents = flate_stream(page.stream, "page stream")
+                add_page(page)
+            
+            def addForm(name, form):
+                form.Contents = flate_stream(form.stream, "xobject form stream")
+                form.compression = 0  # 書き出し時に rl_config の設定で圧縮の方法を上書きさせない
+                add_form(name, form)
+            
+            doc.addPage, doc.addForm = addPage, addForm
+    
+    return FlateCanvas
+
+def page_chunks(rows, rows_per_page):
+    """行の並びを1ページ分ずつのリストに区切る（行は必要になった分だけ読み進める）"""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, rows_per_page))
+        if not chunk:
+            return
+        yield chunk
+
+def iter_table_rows(problems, columns):
+    """問題（DataFrameまたは辞書の並び）から、表の1行分の文字列を順に取り出す"""
+    if hasattr(problems, 'itertuples'):
+        for row in problems[columns].itertuples(index=False):
+            yield [str(value) for value in row]
+    else:
+        for problem in problems:
+            yield [str(problem[column]) for column in columns]
+
+@st.cache_resource
+def get_pdf_executor():
+    """PDF描画用のワーカープール（プロセス全体で共有）"""
+    return ThreadPoolExecutor(max_workers=PDF_WORKER_COUNT, thread_name_prefix="pdf-render")
+
+class PdfRenderJob:
+    """ワーカープールで実行中のPDF生成ジョブ（セッションごとに1つ保持）"""
+    
+    def __init__(self, file_name, total_pages, unit="ページ"):
+        self.file_name = file_name
+        self.total_pages = max(1, total_pages)
+        self.unit = unit  # 進捗の単位（クラス分のZIPは「人分」）
+        self.pages_rendered = 0
+        self.future = None
+    
+    def update_progress(self, pages_rendered):
+        """描画済みページ数を更新（ワーカースレッドから呼ばれる）"""
+        self.pages_rendered = pages_rendered
+    
+    def update_total(self, total_pages):
+        """総ページ数の見積もりを更新（ワーカースレッドから呼ばれる）"""
+        self.total_pages = max(1, total_pages)
+    
+    @property
+    def progress(self):
+        return min(1.0, self.pages_rendered / self.total_pages)
+    
+    def done(self):
+        return self.future.done()
+    
+    def cancel(self):
+        return self.future.cancel()
+    
+    def result(self):
+        return self.future.result()
+
 class OutputFormatter:
     """問題の出力フォーマットとデザインを管理するクラス"""
     
     def __init__(self):
+        self._styles = None  # 描画用に固定したスタイル（Noneならセッションの設定を使う）
+        self.japanese_font = None  # 最初のPDF生成時に設定
+        self.japanese_bold_font = None
+        self.embedded_font_path = None  # 埋め込み用フォントを使う場合のファイル
         self.initialize_default_styles()
-        self.setup_japanese_fonts()
+    
+    def ensure_fonts(self):
+        """日本語フォントが未設定なら設定する（最初のPDF生成時に1回だけ）"""
+        if self.japanese_font is None:
+            self.setup_japanese_fonts()
+    
+    def prepare_fonts(self):
+        """出力プロファイルに合うフォントを設定する（フォント埋め込みならTrueTypeフォント）"""
+        self.ensure_fonts()
+        if self.styles.get('pdf_profile', 1) == 3:
+            self.setup_embedded_font()
+    
+    def register_fonts(self):
+        """別プロセスで描画するときに、設定済みのフォントをそのプロセスにも登録する"""
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        from reportlab.pdfbase.ttfonts import TTFont
+        
+        font_name = self.japanese_font
+        if font_name in pdfmetrics.standardFonts or font_name in pdfmetrics.getRegisteredFontNames():
+            return
+        if self.embedded_font_path:
+            pdfmetrics.registerFont(TTFont(font_name, self.embedded_font_path))
+        else:
+            pdfmetrics.registerFont(UnicodeCIDFont(font_name))
     
     def setup_japanese_fonts(self):
         """日本語フォントの設定"""
-        import os
-        import platform
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
         
         # 利用可能な日本語フォントのリスト
         japanese_fonts = [
@@ -50,7 +214,6 @@ class OutputFormatter:
         # すべての日本語フォントが失敗した場合
         try:
             # 最後の手段として、ReportLabのデフォルト日本語フォントを試す
-            from reportlab.pdfbase.cidfonts import UnicodeCIDFont
             pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
             self.japanese_font = 'HeiseiMin-W3'
             self.japanese_bold_font = 'HeiseiMin-W3'
@@ -61,6 +224,34 @@ class OutputFormatter:
             self.japanese_bold_font = 'Helvetica-Bold'
             st.warning(f"⚠️ 日本語フォントの設定に失敗しました。英語フォントを使用します。\nエラー詳細: {e}")
     
+    def setup_embedded_font(self):
+        """埋め込み用TrueTypeフォントの設定（サブセットとしてPDFに埋め込まれる）
+        
+        見つからない場合は従来のCIDフォントのままにしてFalseを返す。
+        """
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        
+        font_path = self.styles.get('pdf_embed_font_path', '')
+        candidates = [font_path] if font_path else EMBED_FONT_CANDIDATES
+        
+        for path in candidates:
+            if not os.path.exists(path):
+                continue
+            font_name = f"Embedded-{os.path.splitext(os.path.basename(path))[0]}"
+            try:
+                if font_name not in pdfmetrics.getRegisteredFontNames():
+                    pdfmetrics.registerFont(TTFont(font_name, path))
+                self.japanese_font = font_name
+                self.japanese_bold_font = font_name
+                self.embedded_font_path = path
+                return True
+            except Exception:
+                continue
+        
+        st.warning("⚠️ 埋め込み用のTrueTypeフォントが見つかりません。標準のフォントで出力します。")
+        return False
+    
     def initialize_default_styles(self):
         """デフォルトのスタイル設定を初期化"""
         if 'output_styles' not in st.session_state:
@@ -71,12 +262,24 @@ class OutputFormatter:
                 'pdf_header_font_size': 14,  # ヘッダーフォントサイズを14ptに固定
                 'pdf_margin': 20,
                 'pdf_line_spacing': 1.2,
+                'pdf_use_forms': False,  # 共通部分をフォーム（XObject）で使い回す
+                'pdf_profile': 1,  # 1:標準, 2:コンパクト, 3:フォント埋め込み
+                'pdf_embed_font_path': '',  # 埋め込むTrueTypeフォント（空なら候補から探す）
+                'problem_layout': LAYOUT_TABLE,  # 1:横書きの表, 2:筆算
+                'vertical_columns': 3,  # 筆算で横に並べる問題の数
+                'vertical_cell_size': 18,  # 筆算のマス目の大きさ（ポイント）
+                
+                # 解答シート（別シート）設定
+                'answer_key_layout': 1,  # 1:標準, 2:コンパクト（1行に複数の解答）
+                'answer_key_pairs_per_row': 5,  # コンパクト時に1行に並べる解答の数
+                'answer_key_font_size': 11,  # コンパクト時のフォントサイズ
+                'answer_key_row_height': 20,  # コンパクト時の行の高さ（ポイント）
                 
-                # テーブル設定
-                'table_header_bg_color': colors.grey,
-                'table_header_text_color': colors.whitesmoke,
-                'table_body_bg_color': colors.white,  # 背景色を白に変更
-                'table_border_color': colors.black,
+                # テーブル設定（色はReportLabの色名で指定）
+                'table_header_bg_color': 'grey',
+                'table_header_text_color': 'whitesmoke',
+                'table_body_bg_color': 'white',  # 背景色を白に変更
+                'table_border_color': 'black',
                 'table_border_width': 1,
                 
                 # 表示設定
@@ -104,11 +307,216 @@ class OutputFormatter:
                 'header_row_height': 25,     # ヘッダー行の高さ（ポイント）
             }
     
-    def create_pdf(self, problems_df, answers_df, settings):
-        """PDFファイルを生成する関数"""
+    def _problem_table_columns(self, settings):
+        """問題テーブルに載せる列と列幅"""
+        column_widths = self.styles['column_widths']
+        show_answer_column = settings.get('show_answer_column', True)
+        
+        if settings['answer_display'] == 2:
+            # 解答なしの場合
+            if show_answer_column:
+                columns = ['ばんごう', 'もんだい', 'こたえ']
+                # 列幅設定: 番号、問題、答え欄
+                col_widths = [
+                    column_widths['problem_number'],
+                    column_widths['problem'],
+                    column_widths['answer_column']
+                ]
+            else:
+                columns = ['ばんごう', 'もんだい']
+                # 列幅設定: 番号、問題
+                col_widths = [
+                    column_widths['problem_number'],
+                    column_widths['problem'] + column_widths['answer_column']
+                ]
+        else:
+            # 解答ありの場合
+            if show_answer_column:
+                columns = ['ばんごう', 'もんだい', 'こたえ', 'せいかい']
+                # 列幅設定: 番号、問題、答え欄、解答
+                col_widths = [
+                    column_widths['problem_number'],
+                    column_widths['problem'],
+                    column_widths['answer_column'],
+                    column_widths['answer']
+                ]
+            else:
+                columns = ['ばんごう', 'もんだい', 'せいかい']
+                # 列幅設定: 番号、問題、解答
+                col_widths = [
+                    column_widths['problem_number'],
+                    column_widths['problem'] + column_widths['answer_column'],
+                    column_widths['answer']
+                ]
+        return columns, col_widths
+    
+    def _check_problem_columns(self, problems_df, columns):
+        """問題のDataFrameに必要な列がそろっているか（なければエラーを表示）"""
+        if not set(columns).issubset(problems_df.columns):
+            st.error(f"カラム名が一致しません。期待: {columns}, 実際: {list(problems_df.columns)}")
+            return False
+        return True
+    
+    def _build_problem_table_data(self, problems_df, settings):
+        """問題テーブルのデータと列幅を作成する（カラム不一致の場合はNone）"""
+        columns, col_widths = self._problem_table_columns(settings)
+        if not self._check_problem_columns(problems_df, columns):
+            return None, None
+        return [columns] + list(iter_table_rows(problems_df, columns)), col_widths
+    
+    def _build_answer_table_data(self, answers_df):
+        """解答テーブルのデータと列幅を作成する（カラム不一致の場合はNone）"""
+        columns = ['もんだいばんごう', 'せいかい']
+        # カラム名の存在確認
+        if not set(columns).issubset(answers_df.columns):
+            st.error(f"解答テーブルのカラム名が一致しません。期待: {columns}, 実際: {list(answers_df.columns)}")
+            return None, None
+        
+        header, rows, answer_col_widths = self._answer_key_table(iter_table_rows(answers_df, columns))
+        return [header] + list(rows), answer_col_widths
+    
+    def _answer_key_table(self, pairs):
+        """(番号, 正解) の並びから解答表の見出し・行の並び・列幅を作る（行は必要な分だけ作る）"""
+        if self._answer_key_is_compact():
+            return self._compact_answer_key_table(pairs)
+        
+        # 解答テーブルの列幅設定
+        answer_col_widths = [
+            self.styles['column_widths']['problem_number'],
+            self.styles['column_widths']['answer']
+        ]
+        rows = ([str(number), str(answer)] for number, answer in pairs)
+        return ['もんだいばんごう', 'せいかい'], rows, answer_col_widths
+    
+    def _answer_key_is_compact(self):
+        """解答シートをコンパクトな一覧表にするか"""
+        return self.styles.get('answer_key_layout', 1) == 2
+    
+    def _compact_answer_key_table(self, pairs):
+        """番号と正解の組を1行に複数並べた解答表の見出し・行の並び・列幅"""
+        pairs_per_row = self.styles.get('answer_key_pairs_per_row', 5)
+        
+        # 問題テーブルと同じ幅に収まるように組の幅を決める
+        pair_width = sum(self.styles['column_widths'].values()) // pairs_per_row
+        number_width = round(pair_width * 0.4)
+        answer_col_widths = [number_width, pair_width - number_width] * pairs_per_row
+        
+        def rows():
+            for chunk in page_chunks(pairs, pairs_per_row):
+                row = [str(value) for pair in chunk for value in pair]
+                yield row + [''] * (pairs_per_row * 2 - len(row))
+        return ['ばんごう', 'せいかい'] * pairs_per_row, rows(), answer_col_widths
+    
+    def _table_metrics(self, compact=False):
+        """表の文字サイズと行の高さ（compact=Trueはコンパクトな解答表用）"""
+        if compact:
+            font_size = self.styles.get('answer_key_font_size', 11)
+            return {
+                'font_size': font_size,
+                'header_font_size': font_size - 2,
+                'row_height': self.styles.get('answer_key_row_height', 20),
+                'header_row_height': self.styles['header_row_height'],
+                'side_padding': 2,
+            }
+        return {
+            'font_size': self.styles['pdf_table_font_size'],
+            'header_font_size': self.styles['pdf_header_font_size'],
+            'row_height': self.styles['row_height'],
+            'header_row_height': self.styles['header_row_height'],
+            'side_padding': 6,
+        }
+    
+    def _table_style_commands(self, metrics=None):
+        """問題・解答テーブル共通のスタイル定義"""
+        output_styles = self.styles
+        if metrics is None:
+            metrics = self._table_metrics()
+        return [
+            ('BACKGROUND', (0, 0), (-1, 0), output_styles['table_header_bg_color']),
+            ('TEXTCOLOR', (0, 0), (-1, 0), output_styles['table_header_text_color']),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), self.japanese_font),  # 日本語フォントを使用
+            ('FONTSIZE', (0, 0), (-1, 0), metrics['header_font_size']),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), output_styles['table_body_bg_color']),
+            ('GRID', (0, 0), (-1, -1), output_styles['table_border_width'], output_styles['table_border_color']),
+            ('FONTSIZE', (0, 1), (-1, -1), metrics['font_size']),
+            ('FONTNAME', (0, 1), (-1, -1), self.japanese_font),  # 日本語フォントを使用
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            # 行の高さ設定
+            ('LEFTPADDING', (0, 0), (-1, -1), metrics['side_padding']),
+            ('RIGHTPADDING', (0, 0), (-1, -1), metrics['side_padding']),
+            ('TOPPADDING', (0, 0), (-1, 0), metrics['header_row_height'] // 2 - 6),  # ヘッダー行の高さ
+            ('BOTTOMPADDING', (0, 0), (-1, 0), metrics['header_row_height'] // 2 - 6),
+            ('TOPPADDING', (0, 1), (-1, -1), metrics['row_height'] // 2 - 6),  # 通常行の高さ
+            ('BOTTOMPADDING', (0, 1), (-1, -1), metrics['row_height'] // 2 - 6),
+        ]
+    
+    @staticmethod
+    def _page_compression(profile):
+        """出力プロファイルに応じてキャンバスに渡すpageCompressionの値
+        
+        コンパクトは1（_pdf_canvas_class で圧縮したページ内容をASCII85で包まずに書き出す）、
+        それ以外はReportLabの既定に任せる。
+        """
+        return 1 if profile == 2 else None
+    
+    def estimate_page_count(self, problems_df, answers_df, settings):
+        """PDFのおおよそのページ数（進捗表示用）"""
+        return self.estimate_pages(len(problems_df), answers_df is not None, settings)
+    
+    def estimate_pages(self, problem_count, answer_sheet, settings):
+        """問題数からPDF1シート分のおおよそのページ数を求める"""
+        rows_per_page = self._rows_per_page()
+        pages = math.ceil(max(problem_count, 1) / self._problems_per_page())
+        if settings['answer_display'] == 3 and answer_sheet:
+            answer_rows = max(problem_count, 1)
+            if self._answer_key_is_compact():
+                answer_rows = math.ceil(answer_rows / self.styles.get('answer_key_pairs_per_row', 5))
+                rows_per_page = self._rows_per_page(self._table_metrics(compact=True)['row_height'])
+            pages += math.ceil(answer_rows / rows_per_page)
+        return pages
+    
+    def create_pdf(self, problems_df, answers_df, settings, progress_callback=None):
+        """PDFファイルを生成する関数
+        
+        progress_callback を指定すると、描画済みのページ数を引数に呼び出す。
+        """
+        self.prepare_fonts()
+        profile = self.styles.get('pdf_profile', 1)
+        
+        page_compression = self._page_compression(profile)
+        # フォーム（XObject）で共通部分を使い回す描画方式
+        # 行数の多い問題セットも、表全体を組まずに済むこちらで1ページずつ書き出す
+        # 筆算はこの方式でだけ描ける
+        if self.styles.get('pdf_use_forms', False) or len(problems_df) > STREAM_PDF_ROW_THRESHOLD \
+                or self._uses_vertical_layout():
+            return self.create_pdf_with_forms(problems_df, answers_df, settings, page_compression, progress_callback)
+        return self.create_pdf_with_flowables(problems_df, answers_df, settings, page_compression, progress_callback)
+    
+    def create_preview_pdf(self, problems_df, settings, max_rows=None):
+        """プレビュー用に先頭の問題だけをPDFにする（既定は1ページ分）
+        
+        解答の別シートは含めないため、大きな問題セットでもすぐに描画できる。
+        """
+        if max_rows is None:
+            max_rows = self._problems_per_page()
+        return self.create_pdf(problems_df.head(max_rows), None, settings)
+    
+    def create_pdf_with_flowables(self, problems_df, answers_df, settings, page_compression=None, progress_callback=None):
+        """表（Table）を並べてPDFを生成する標準の描画方式"""
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        
         buffer = io.BytesIO()
         # A4の上部と下部マージンを小さくする（デフォルトは72ポイント）
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=30, bottomMargin=30, leftMargin=72, rightMargin=72)
+        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=30, bottomMargin=30, leftMargin=72, rightMargin=72,
+                                pageCompression=page_compression)
+        if progress_callback is not None:
+            # 新しいページに入るたびに、その前までのページ数を通知する
+            doc.setProgressCallBack(
+                lambda kind, value: progress_callback(value - 1) if kind == 'PAGE' else None
+            )
         elements = []
         
         # スタイル設定
@@ -116,7 +524,7 @@ class OutputFormatter:
         title_style = ParagraphStyle(
             'CustomTitle',
             parent=styles['Heading1'],
-            fontSize=st.session_state.output_styles['pdf_title_font_size'],
+            fontSize=self.styles['pdf_title_font_size'],
             spaceAfter=10,  # タイトルの後の余白を小さく
             spaceBefore=0,  # タイトルの前の余白を0に
             alignment=0,  # 左揃え
@@ -156,101 +564,21 @@ class OutputFormatter:
             ('RIGHTPADDING', (0, 0), (-1, -1), 0),
             ('TOPPADDING', (0, 0), (-1, -1), 0),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-            ('BACKGROUND', (0, 0), (-1, -1), colors.white),  # 背景を白に
-            ('GRID', (0, 0), (-1, -1), 0, colors.white),  # グリッドを透明に
+            ('BACKGROUND', (0, 0), (-1, -1), 'white'),  # 背景を白に
+            ('GRID', (0, 0), (-1, -1), 0, 'white'),  # グリッドを透明に
         ]))
         
         elements.append(title_table)
         elements.append(Spacer(1, 5))  # タイトルとテーブルの間隔を小さく
         
         # 問題テーブルの作成
-        if settings['answer_display'] == 2:
-            # 解答なしの場合
-            if settings.get('show_answer_column', True):
-                table_data = [['ばんごう', 'もんだい', 'こたえ']]
-                for _, row in problems_df.iterrows():
-                    # カラム名の存在確認
-                    if 'ばんごう' in row and 'もんだい' in row and 'こたえ' in row:
-                        table_data.append([str(row['ばんごう']), str(row['もんだい']), str(row['こたえ'])])
-                    else:
-                        st.error(f"カラム名が一致しません。期待: ['ばんごう', 'もんだい', 'こたえ'], 実際: {list(row.index)}")
-                        return None
-                # 列幅設定: 番号、問題、答え欄
-                col_widths = [
-                    st.session_state.output_styles['column_widths']['problem_number'],
-                    st.session_state.output_styles['column_widths']['problem'],
-                    st.session_state.output_styles['column_widths']['answer_column']
-                ]
-            else:
-                table_data = [['ばんごう', 'もんだい']]
-                for _, row in problems_df.iterrows():
-                    # カラム名の存在確認
-                    if 'ばんごう' in row and 'もんだい' in row:
-                        table_data.append([str(row['ばんごう']), str(row['もんだい'])])
-                    else:
-                        st.error(f"カラム名が一致しません。期待: ['ばんごう', 'もんだい'], 実際: {list(row.index)}")
-                        return None
-                # 列幅設定: 番号、問題
-                col_widths = [
-                    st.session_state.output_styles['column_widths']['problem_number'],
-                    st.session_state.output_styles['column_widths']['problem'] + st.session_state.output_styles['column_widths']['answer_column']
-                ]
-        else:
-            # 解答ありの場合
-            if settings.get('show_answer_column', True):
-                table_data = [['ばんごう', 'もんだい', 'こたえ', 'せいかい']]
-                for _, row in problems_df.iterrows():
-                    # カラム名の存在確認
-                    if 'ばんごう' in row and 'もんだい' in row and 'こたえ' in row and 'せいかい' in row:
-                        table_data.append([str(row['ばんごう']), str(row['もんだい']), str(row['こたえ']), str(row['せいかい'])])
-                    else:
-                        st.error(f"カラム名が一致しません。期待: ['ばんごう', 'もんだい', 'こたえ', 'せいかい'], 実際: {list(row.index)}")
-                        return None
-                # 列幅設定: 番号、問題、答え欄、解答
-                col_widths = [
-                    st.session_state.output_styles['column_widths']['problem_number'],
-                    st.session_state.output_styles['column_widths']['problem'],
-                    st.session_state.output_styles['column_widths']['answer_column'],
-                    st.session_state.output_styles['column_widths']['answer']
-                ]
-            else:
-                table_data = [['ばんごう', 'もんだい', 'せいかい']]
-                for _, row in problems_df.iterrows():
-                    # カラム名の存在確認
-                    if 'ばんごう' in row and 'もんだい' in row and 'せいかい' in row:
-                        table_data.append([str(row['ばんごう']), str(row['もんだい']), str(row['せいかい'])])
-                    else:
-                        st.error(f"カラム名が一致しません。期待: ['ばんごう', 'もんだい', 'せいかい'], 実際: {list(row.index)}")
-                        return None
-                # 列幅設定: 番号、問題、解答
-                col_widths = [
-                    st.session_state.output_styles['column_widths']['problem_number'],
-                    st.session_state.output_styles['column_widths']['problem'] + st.session_state.output_styles['column_widths']['answer_column'],
-                    st.session_state.output_styles['column_widths']['answer']
-                ]
+        table_data, col_widths = self._build_problem_table_data(problems_df, settings)
+        if table_data is None:
+            return None
         
         # テーブル作成（列幅を指定）
         table = Table(table_data, colWidths=col_widths)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), st.session_state.output_styles['table_header_bg_color']),
-            ('TEXTCOLOR', (0, 0), (-1, 0), st.session_state.output_styles['table_header_text_color']),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), self.japanese_font),  # 日本語フォントを使用
-            ('FONTSIZE', (0, 0), (-1, 0), st.session_state.output_styles['pdf_header_font_size']),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), st.session_state.output_styles['table_body_bg_color']),
-            ('GRID', (0, 0), (-1, -1), st.session_state.output_styles['table_border_width'], st.session_state.output_styles['table_border_color']),
-            ('FONTSIZE', (0, 1), (-1, -1), st.session_state.output_styles['pdf_table_font_size']),
-            ('FONTNAME', (0, 1), (-1, -1), self.japanese_font),  # 日本語フォントを使用
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            # 行の高さ設定
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, 0), st.session_state.output_styles['header_row_height'] // 2 - 6),  # ヘッダー行の高さ
-            ('BOTTOMPADDING', (0, 0), (-1, 0), st.session_state.output_styles['header_row_height'] // 2 - 6),
-            ('TOPPADDING', (0, 1), (-1, -1), st.session_state.output_styles['row_height'] // 2 - 6),  # 通常行の高さ
-            ('BOTTOMPADDING', (0, 1), (-1, -1), st.session_state.output_styles['row_height'] // 2 - 6),
-        ]))
+        table.setStyle(TableStyle(self._table_style_commands()))
         
         elements.append(table)
         elements.append(Spacer(1, 10))  # テーブル下の余白を小さく
@@ -266,126 +594,541 @@ class OutputFormatter:
             elements.append(Spacer(1, 10))
             
             # 解答テーブル
-            answer_data = [['もんだいばんごう', 'せいかい']]
-            for _, row in answers_df.iterrows():
-                # カラム名の存在確認
-                if 'もんだいばんごう' in row and 'せいかい' in row:
-                    answer_data.append([str(row['もんだいばんごう']), str(row['せいかい'])])
-                else:
-                    st.error(f"解答テーブルのカラム名が一致しません。期待: ['もんだいばんごう', 'せいかい'], 実際: {list(row.index)}")
-                    return None
-            
-            # 解答テーブルの列幅設定
-            answer_col_widths = [
-                st.session_state.output_styles['column_widths']['problem_number'],
-                st.session_state.output_styles['column_widths']['answer']
-            ]
+            answer_data, answer_col_widths = self._build_answer_table_data(answers_df)
+            if answer_data is None:
+                return None
             
             answer_table = Table(answer_data, colWidths=answer_col_widths)
-            answer_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), st.session_state.output_styles['table_header_bg_color']),
-                ('TEXTCOLOR', (0, 0), (-1, 0), st.session_state.output_styles['table_header_text_color']),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), self.japanese_font),  # 日本語フォントを使用
-                ('FONTSIZE', (0, 0), (-1, 0), st.session_state.output_styles['pdf_header_font_size']),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), st.session_state.output_styles['table_body_bg_color']),
-                ('GRID', (0, 0), (-1, -1), st.session_state.output_styles['table_border_width'], st.session_state.output_styles['table_border_color']),
-                ('FONTSIZE', (0, 1), (-1, -1), st.session_state.output_styles['pdf_table_font_size']),
-                ('FONTNAME', (0, 1), (-1, -1), self.japanese_font),  # 日本語フォントを使用
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                # 行の高さ設定
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-                ('TOPPADDING', (0, 0), (-1, 0), st.session_state.output_styles['header_row_height'] // 2 - 6),  # ヘッダー行の高さ
-                ('BOTTOMPADDING', (0, 0), (-1, 0), st.session_state.output_styles['header_row_height'] // 2 - 6),
-                ('TOPPADDING', (0, 1), (-1, -1), st.session_state.output_styles['row_height'] // 2 - 6),  # 通常行の高さ
-                ('BOTTOMPADDING', (0, 1), (-1, -1), st.session_state.output_styles['row_height'] // 2 - 6),
-            ]))
+            answer_table.setStyle(TableStyle(
+                self._table_style_commands(self._table_metrics(compact=self._answer_key_is_compact()))
+            ))
             
             elements.append(answer_table)
         
         # PDF生成
-        doc.build(elements)
+        doc.build(elements, canvasmaker=_pdf_canvas_class(page_compression))
+        if progress_callback is not None:
+            progress_callback(doc.page)
+        buffer.seek(0)
+        return buffer
+    
+    def create_pdf_stream(self, worksheets, settings, output, progress_callback=None, **options):
+        """出力プロファイルを適用して、複数のシートを write_pdf_stream で書き出す"""
+        self.prepare_fonts()
+        page_compression = self._page_compression(self.styles.get('pdf_profile', 1))
+        self.write_pdf_stream(worksheets, settings, output, page_compression=page_compression,
+                              progress_callback=progress_callback, **options)
+    
+    def create_answer_key_pdf(self, answer_keys, output, progress_callback=None):
+        """出力プロファイルを適用して、複数のシートの解答をまとめたPDFを書き出す"""
+        self.prepare_fonts()
+        page_compression = self._page_compression(self.styles.get('pdf_profile', 1))
+        self.write_answer_key_stream(answer_keys, output, page_compression, progress_callback)
+    
+    def create_pdf_with_forms(self, problems_df, answers_df, settings, page_compression=None, progress_callback=None):
+        """ページ共通部分をフォーム（XObject）として1回だけ描画するPDF生成
+        
+        タイトル・日付、ヘッダー行、空の答え欄（罫線）はフォームとして
+        定義し、各ページではそれを参照して問題の文字だけを描画する。
+        """
+        columns = self._problem_table_columns(settings)[0]
+        if not self._check_problem_columns(problems_df, columns + ['ばんごう', 'せいかい']):
+            return None
+        
+        buffer = io.BytesIO()
+        self.write_pdf_stream(
+            [(settings['header_text'], problems_df)], settings, buffer,
+            answer_sheet=answers_df is not None, page_compression=page_compression,
+            progress_callback=progress_callback
+        )
         buffer.seek(0)
         return buffer
     
+    def write_pdf_stream(self, worksheets, settings, output, answer_sheet=True, page_compression=None,
+                         progress_callback=None, answer_key_at_end=False):
+        """問題を1ページ分ずつ読み進めながら、フォームを使ってPDFを書き出す
+        
+        worksheets は (タイトル, 問題) の並びで、問題はDataFrameまたは問題の辞書の並び。
+        シートも問題も必要になった時点で読み進めるので、保持するのは描画中の1ページ分と
+        解答シート用の番号・正解の文字列だけになる（描画済みのページはキャンバスが
+        ページ内容の命令列として持ち、save時にまとめて output へ書き出す）。
+        output はファイル名またはバイナリのファイルオブジェクト。
+        answer_key_at_end=True の場合、解答シートは各シートの後ろではなく最後にまとめて描く。
+        """
+        from datetime import datetime
+        
+        self.ensure_fonts()
+        answer_sheet = answer_sheet and settings['answer_display'] == 3
+        pdf = _pdf_canvas_class(page_compression)(output, pagesize=A4, pageCompression=page_compression)
+        current_datetime = datetime.now().strftime("%Y年%m月%d日 %H:%M")
+        
+        answer_keys = []
+        for title, problems in worksheets:
+            answer_key = [] if answer_sheet else None
+            self._draw_worksheet(pdf, title, current_datetime, problems, settings, answer_key, progress_callback)
+            if not answer_sheet:
+                continue
+            if answer_key_at_end:
+                answer_keys.append((f"解答（{title}）", answer_key))
+            else:
+                self._draw_answer_key(pdf, "解答", current_datetime, answer_key, progress_callback)
+        
+        for title, answer_key in answer_keys:
+            self._draw_answer_key(pdf, title, current_datetime, answer_key, progress_callback)
+        
+        pdf.save()
+    
+    def write_answer_key_stream(self, answer_keys, output, page_compression=None, progress_callback=None):
+        """(タイトル, [(番号, 正解)]) の並びから、解答だけをまとめたPDFを書き出す"""
+        from datetime import datetime
+        
+        self.ensure_fonts()
+        pdf = _pdf_canvas_class(page_compression)(output, pagesize=A4, pageCompression=page_compression)
+        current_datetime = datetime.now().strftime("%Y年%m月%d日 %H:%M")
+        for title, answer_key in answer_keys:
+            self._draw_answer_key(pdf, title, current_datetime, answer_key, progress_callback)
+        pdf.save()
+    
+    def _draw_worksheet(self, pdf, title, subtitle, problems, settings, answer_key=None,
+                        progress_callback=None):
+        """1シート分の問題を描画する（answer_key にリストを渡すと番号と正解をそこに集める）"""
+        if self._uses_vertical_layout():
+            def vertical_rows():
+                for number, question, answer in iter_table_rows(problems, ['ばんごう', 'もんだい', 'せいかい']):
+                    if answer_key is not None:
+                        answer_key.append((number, answer))
+                    yield number, question, answer
+            
+            self._draw_vertical_pages(
+                pdf, title, subtitle, vertical_rows(), settings['answer_display'] == 1, progress_callback
+            )
+            return
+        
+        columns, col_widths = self._problem_table_columns(settings)
+        # 解答シート用に番号と正解も読む（表に載せる列の後ろに並べる）
+        fields = list(dict.fromkeys(columns + ['ばんごう', 'せいかい'])) if answer_key is not None else columns
+        number_index = fields.index('ばんごう')
+        answer_index = fields.index('せいかい') if answer_key is not None else None
+        
+        def table_rows():
+            for values in iter_table_rows(problems, fields):
+                if answer_key is not None:
+                    answer_key.append((values[number_index], values[answer_index]))
+                yield values[:len(columns)]
+        
+        self._draw_form_table_pages(
+            pdf, title, subtitle, columns, table_rows(), col_widths, progress_callback
+        )
+    
+    def _draw_answer_key(self, pdf, title, subtitle, answer_key, progress_callback=None):
+        """1シート分の解答表を描画する"""
+        header, rows, answer_col_widths = self._answer_key_table(answer_key)
+        self._draw_form_table_pages(
+            pdf, title, subtitle, header, rows, answer_col_widths, progress_callback,
+            self._table_metrics(compact=self._answer_key_is_compact())
+        )
+    
+    def _form_page_geometry(self):
+        """フォーム描画時のタイトル上端・ヘッダー上端・本文上端のY座標"""
+        page_width, page_height = A4
+        top_margin = 30
+        title_top = page_height - top_margin
+        header_top = title_top - (self.styles['pdf_title_font_size'] + 15)
+        rows_top = header_top - self.styles['header_row_height']
+        return title_top, header_top, rows_top
+    
+    def _rows_per_page(self, row_height=None):
+        """1ページに入る行数"""
+        bottom_margin = 30
+        rows_top = self._form_page_geometry()[2]
+        if row_height is None:
+            row_height = self.styles['row_height']
+        return max(1, int((rows_top - bottom_margin) // row_height))
+    
+    def _draw_form_table_pages(self, pdf, title, subtitle, header, rows, col_widths,
+                               progress_callback=None, metrics=None):
+        """フォームを参照しながら表を複数ページに描画する（rowsは1ページ分ずつ読み進める）
+        
+        タイトル・ヘッダー・罫線のフォームは描く内容から名前を決めるので、同じ形の表は
+        シートが変わっても文書内で1回だけ定義したフォームを使い回す。
+        """
+        from reportlab.pdfbase import pdfmetrics
+        
+        output_styles = self.styles
+        if metrics is None:
+            metrics = self._table_metrics()
+        page_width = A4[0]
+        header_height = metrics['header_row_height']
+        row_height = metrics['row_height']
+        font_size = metrics['font_size']
+        
+        # 表は用紙の中央に配置
+        table_width = sum(col_widths)
+        table_left = round((page_width - table_width) / 2)
+        title_top, header_top, rows_top = self._form_page_geometry()
+        rows_per_page = self._rows_per_page(row_height)
+        
+        # 列ごとの左端位置
+        col_lefts = [table_left]
+        for width in col_widths[:-1]:
+            col_lefts.append(col_lefts[-1] + width)
+        
+        # タイトル・日付のフォーム
+        title_form = self._define_title_form(pdf, title, subtitle, table_left, table_width)
+        
+        # ヘッダー行のフォーム
+        header_font_size = metrics['header_font_size']
+        header_form = _form_name("header", header, col_widths, header_height, header_font_size)
+        if not pdf.hasForm(header_form):
+            pdf.beginForm(header_form)
+            pdf.setFillColor(output_styles['table_header_bg_color'])
+            pdf.rect(table_left, rows_top, table_width, header_height, stroke=0, fill=1)
+            pdf.setFillColor(output_styles['table_header_text_color'])
+            pdf.setFont(self.japanese_font, header_font_size)
+            for label, left, width in zip(header, col_lefts, col_widths):
+                pdf.drawCentredString(left + width / 2, rows_top + (header_height - header_font_size * 0.7) / 2, label)
+            self._draw_grid(pdf, col_lefts, col_widths, header_top, [header_height])
+            pdf.endForm()
+        
+        # 行が1つもなくても、タイトルとヘッダーだけのページを1枚出す
+        pages = page_chunks(rows, rows_per_page)
+        for page_rows in itertools.chain([next(pages, [])], pages):
+            # 空の答え欄（罫線）のフォームは列の幅・行の高さ・行数ごとに1回だけ定義する
+            grid_form = _form_name("grid", col_widths, row_height, len(page_rows))
+            if not pdf.hasForm(grid_form):
+                pdf.beginForm(grid_form)
+                pdf.setFillColor(output_styles['table_body_bg_color'])
+                pdf.rect(table_left, rows_top - row_height * len(page_rows), table_width,
+                         row_height * len(page_rows), stroke=0, fill=1)
+                self._draw_grid(pdf, col_lefts, col_widths, rows_top, [row_height] * len(page_rows))
+                pdf.endForm()
+            
+            pdf.doForm(title_form)
+            pdf.doForm(header_form)
+            pdf.doForm(grid_form)
+            
+            # 各セルの文字だけをページごとに1つのテキストオブジェクトで描画
+            pdf.setFillColor('black')
+            # 位置は前の文字列からの相対移動（Td）で指定してページの内容を小さくする
+            text = pdf.beginText(0, 0)
+            text.setFont(self.japanese_font, font_size)
+            cursor_x, cursor_y = 0, 0
+            for row_index, row in enumerate(page_rows):
+                baseline = round(rows_top - row_height * (row_index + 1) + (row_height - font_size * 0.7) / 2, 1)
+                for value, left, width in zip(row, col_lefts, col_widths):
+                    if value:
+                        text_width = pdfmetrics.stringWidth(value, self.japanese_font, font_size)
+                        x = round(left + (width - text_width) / 2, 1)
+                        text.moveCursor(x - cursor_x, cursor_y - baseline)
+                        text.textOut(value)
+                        cursor_x, cursor_y = x, baseline
+            pdf.drawText(text)
+            pdf.showPage()
+            if progress_callback is not None:
+                progress_callback(pdf.getPageNumber() - 1)
+    
+    def _define_title_form(self, pdf, title, subtitle, left, width):
+        """タイトル（左）と日付（右）のフォームを定義してその名前を返す（同じタイトルは定義済みのものを使う）"""
+        name = _form_name("title", title, subtitle, left, width)
+        if pdf.hasForm(name):
+            return name
+        title_top = self._form_page_geometry()[0]
+        title_font_size = self.styles['pdf_title_font_size']
+        pdf.beginForm(name)
+        pdf.setFillColor('black')
+        pdf.setFont(self.japanese_font, title_font_size)
+        pdf.drawString(left, title_top - title_font_size, title)
+        pdf.setFont(self.japanese_font, 10)
+        pdf.drawRightString(left + width, title_top - 10, subtitle)
+        pdf.endForm()
+        return name
+    
+    def _uses_vertical_layout(self):
+        """問題を筆算で描くか"""
+        return self.styles.get('problem_layout', LAYOUT_TABLE) == LAYOUT_VERTICAL
+    
+    def _problems_per_page(self):
+        """1ページに入る問題の数（表なら行数、筆算なら枠の数）"""
+        if self._uses_vertical_layout():
+            geometry = self._vertical_page_geometry()
+            return geometry['per_row'] * geometry['box_rows']
+        return self._rows_per_page()
+    
+    def _vertical_page_geometry(self):
+        """筆算のページの枠の並べ方とマス目の大きさ（マス目は枠の幅に収まる大きさまで）"""
+        from vertical_layout import VERTICAL_MAX_COLUMNS, VERTICAL_MAX_ROWS
+        
+        per_row = self.styles.get('vertical_columns', 3)
+        box_width = (A4[0] - VERTICAL_PAGE_MARGIN * 2) / per_row
+        cell = min(self.styles.get('vertical_cell_size', 18), (box_width - 16) / VERTICAL_MAX_COLUMNS)
+        # 枠の中は、番号の行＋筆算のマス目＋下の余白
+        box_height = cell * (VERTICAL_MAX_ROWS + 1) + 12
+        rows_top = self._form_page_geometry()[1]
+        return {
+            'per_row': per_row,
+            'box_width': box_width,
+            'box_height': box_height,
+            'box_rows': max(1, int((rows_top - 30) // box_height)),
+            'rows_top': rows_top,
+            'cell': cell,
+            'font_size': round(cell * 0.8, 1),
+        }
+    
+    def _vertical_grid_form(self, pdf, layout, geometry):
+        """筆算のマス目・演算子の記号・線・わり算の「)」のフォーム（同じ形の筆算で使い回す）"""
+        columns, rows, symbols, rules, bracket = layout.shape
+        name = "vgrid_" + "_".join(str(_FORM_NAME_SYMBOLS.get(value, value)) for value in (
+            columns, rows, *itertools.chain(*symbols), 'r', *itertools.chain(*rules), *(bracket or ())
+        ))
+        if pdf.hasForm(name):
+            return name
+        
+        cell = geometry['cell']
+        width, height = columns * cell, rows * cell
+        pdf.beginForm(name, -1, -1, width + 1, height + 1)
+        # 数字をそろえるための薄いマス目
+        pdf.setStrokeColor('lightgrey')
+        pdf.setLineWidth(0.5)
+        for column in range(columns + 1):
+            pdf.line(column * cell, 0, column * cell, height)
+        for row in range(rows + 1):
+            pdf.line(0, row * cell, width, row * cell)
+        # 答えの上の線・わり算の線
+        pdf.setStrokeColor(self.styles['table_border_color'])
+        pdf.setLineWidth(1.2)
+        for row, left, right in rules:
+            y = height - (row + 1) * cell
+            pdf.line(left * cell, y, right * cell, y)
+        if bracket is not None:
+            row, column = bracket
+            x, top, bottom = column * cell + cell * 0.3, height - row * cell, height - (row + 1) * cell
+            pdf.bezier(x, top, x + cell * 0.5, top - cell * 0.3, x + cell * 0.5, bottom + cell * 0.3, x, bottom)
+        font_size = geometry['font_size']
+        pdf.setFillColor('black')
+        pdf.setFont(self.japanese_font, font_size)
+        for row, column, symbol in symbols:
+            pdf.drawCentredString(column * cell + cell / 2, height - (row + 1) * cell + (cell - font_size * 0.7) / 2, symbol)
+        pdf.endForm()
+        return name
+    
+    def _vertical_run_form(self, pdf, text, answer, geometry):
+        """数字の並び（1文字1マス）のフォーム（同じ数字の並びは描画済みのものを使い回す）"""
+        from reportlab.pdfbase import pdfmetrics
+        
+        name = f"vrun_{'a' if answer else 'q'}_{text}"
+        if pdf.hasForm(name):
+            return name
+        
+        cell, font_size = geometry['cell'], geometry['font_size']
+        pdf.beginForm(name, 0, 0, len(text) * cell, cell)
+        pdf.setFillColor(VERTICAL_ANSWER_COLOR if answer else 'black')
+        run = pdf.beginText(0, 0)
+        run.setFont(self.japanese_font, font_size)
+        baseline = (cell - font_size * 0.7) / 2
+        for i, char in enumerate(text):
+            run.setTextOrigin(i * cell + (cell - pdfmetrics.stringWidth(char, self.japanese_font, font_size)) / 2, baseline)
+            run.textOut(char)
+        pdf.drawText(run)
+        pdf.endForm()
+        return name
+    
+    def _draw_vertical_pages(self, pdf, title, subtitle, rows, show_answers, progress_callback=None):
+        """(番号, 問題文, 正解) の並びを、1問ずつ枠に入れた筆算のページとして描画する
+        
+        マス目の形ごと・数字の並びごとにフォームを1回だけ定義し、各問題ではそれを
+        配置するだけにする。筆算にできない問題（混合式など）は枠の中に横書きで描く。
+        """
+        from vertical_layout import vertical_layout
+        
+        geometry = self._vertical_page_geometry()
+        cell, font_size = geometry['cell'], geometry['font_size']
+        per_row, box_width, box_height = geometry['per_row'], geometry['box_width'], geometry['box_height']
+        per_page = per_row * geometry['box_rows']
+        rows_top = geometry['rows_top']
+        page_width = A4[0] - VERTICAL_PAGE_MARGIN * 2
+        
+        title_form = self._define_title_form(pdf, title, subtitle, VERTICAL_PAGE_MARGIN, page_width)
+        
+        pages = page_chunks(rows, per_page)
+        for page_rows in itertools.chain([next(pages, [])], pages):
+            # 問題の枠はページの問題数ごとに1回だけ定義する
+            boxes_form = _form_name("boxes", per_row, box_width, box_height, len(page_rows))
+            if not pdf.hasForm(boxes_form):
+                pdf.beginForm(boxes_form)
+                pdf.setStrokeColor('grey')
+                pdf.setLineWidth(0.5)
+                for i in range(len(page_rows)):
+                    pdf.rect(VERTICAL_PAGE_MARGIN + i % per_row * box_width,
+                             rows_top - (i // per_row + 1) * box_height, box_width, box_height)
+                pdf.endForm()
+            
+            # このページで使うフォームを先に定義してから、ページの内容を描く
+            placements = []
+            for i, (number, question, answer) in enumerate(page_rows):
+                layout = vertical_layout(question)
+                if layout is None:
+                    continue
+                left = VERTICAL_PAGE_MARGIN + i % per_row * box_width + 8
+                top = rows_top - i // per_row * box_height - cell
+                placements.append((self._vertical_grid_form(pdf, layout, geometry), left, top - layout.rows * cell))
+                for runs, answer in ((layout.runs, False), (layout.answer_runs, True)):
+                    if answer and not show_answers:
+                        continue
+                    for row, column, run in runs:
+                        form = self._vertical_run_form(pdf, run, answer, geometry)
+                        placements.append((form, left + column * cell, top - (row + 1) * cell))
+            
+            pdf.doForm(title_form)
+            pdf.doForm(boxes_form)
+            # 原点を前のフォームの位置からの相対移動でずらしながら配置する（状態の保存は1ページに1回）
+            pdf.saveState()
+            origin_x, origin_y = 0, 0
+            for form, x, y in placements:
+                x, y = round(x, 1), round(y, 1)
+                pdf.translate(x - origin_x, y - origin_y)
+                pdf.doForm(form)
+                origin_x, origin_y = x, y
+            pdf.restoreState()
+            
+            # 番号と、筆算にできない問題の問題文は1つのテキストオブジェクトで描く
+            pdf.setFillColor('black')
+            text = pdf.beginText(0, 0)
+            text.setFont(self.japanese_font, font_size)
+            for i, (number, question, answer) in enumerate(page_rows):
+                left = VERTICAL_PAGE_MARGIN + i % per_row * box_width + 4
+                top = rows_top - i // per_row * box_height
+                text.setTextOrigin(left, round(top - cell + (cell - font_size * 0.7) / 2, 1))
+                text.textOut(f"({number})")
+                if vertical_layout(question) is None:
+                    text.setTextOrigin(left + 4, round(top - cell * 2 - font_size, 1))
+                    text.textOut(f"{question} =" + (f" {answer}" if show_answers else ""))
+            pdf.drawText(text)
+            pdf.showPage()
+            if progress_callback is not None:
+                progress_callback(pdf.getPageNumber() - 1)
+    
+    def _draw_grid(self, pdf, col_lefts, col_widths, top, row_heights):
+        """表の罫線を描画する"""
+        output_styles = self.styles
+        pdf.setStrokeColor(output_styles['table_border_color'])
+        pdf.setLineWidth(output_styles['table_border_width'])
+        left = col_lefts[0]
+        right = col_lefts[-1] + col_widths[-1]
+        bottom = top - sum(row_heights)
+        
+        # 横線
+        y = top
+        pdf.line(left, y, right, y)
+        for height in row_heights:
+            y -= height
+            pdf.line(left, y, right, y)
+        
+        # 縦線
+        for x in col_lefts + [right]:
+            pdf.line(x, top, x, bottom)
+    
     def display_problems(self, problems_df, answers_df, settings):
         """問題を画面に表示する関数"""
         # st.markdown("---")
         st.header("📝 生成された問題")
         
-        # 問題の表示
-        if settings['answer_display'] == 1:
-            # 解答あり
-            if settings.get('show_answer_column', True):
-                st.dataframe(
-                    problems_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-            else:
-                display_df = problems_df.drop('こたえ', axis=1)
-                st.dataframe(
-                    display_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-        elif settings['answer_display'] == 2:
-            # 解答なし
-            if settings.get('show_answer_column', True):
-                display_df = problems_df.drop('せいかい', axis=1)
-                st.dataframe(
-                    display_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-            else:
-                display_df = problems_df.drop(['せいかい', 'こたえ'], axis=1)
-                st.dataframe(
-                    display_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-        else:
+        # 表示する列（元のデータからは削除せず、列を選んで表示する）
+        hidden_columns = set()
+        if settings['answer_display'] != 1:
+            # 解答なし・別シートの場合は正解を隠す
+            hidden_columns.add('せいかい')
+        if not settings.get('show_answer_column', True):
+            hidden_columns.add('こたえ')
+        columns = [column for column in problems_df.columns if column not in hidden_columns]
+        
+        self._show_paginated_dataframe(problems_df, columns, key="problems")
+        
+        if settings['answer_display'] == 3:
             # 別シート
-            if settings.get('show_answer_column', True):
-                display_df = problems_df.drop('せいかい', axis=1)
-                st.dataframe(
-                    display_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-            else:
-                display_df = problems_df.drop(['せいかい', 'こたえ'], axis=1)
-                st.dataframe(
-                    display_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-            
             st.markdown("---")
             st.header("📋 解答")
-            st.dataframe(
-                answers_df,
-                use_container_width=True,
-                hide_index=True
-            )
+            self._show_paginated_dataframe(answers_df, list(answers_df.columns), key="answers")
+    
+    def _show_paginated_dataframe(self, df, columns, key):
+        """1ページ分の行と表示する列だけを切り出して表示する
+        
+        網羅モードなどで行数が多くても、ブラウザへ送るのは表示中のページだけになる。
+        """
+        total_rows = len(df)
+        page_size = st.session_state.get(f"{key}_page_size", DISPLAY_PAGE_SIZE_OPTIONS[0])
+        page_count = max(1, math.ceil(total_rows / page_size))
+        
+        page = 1
+        if total_rows > DISPLAY_PAGE_SIZE_OPTIONS[0]:
+            col1, col2 = st.columns(2)
+            with col1:
+                page_size = st.selectbox(
+                    "1ページの表示件数",
+                    options=DISPLAY_PAGE_SIZE_OPTIONS,
+                    key=f"{key}_page_size"
+                )
+                page_count = max(1, math.ceil(total_rows / page_size))
+            with col2:
+                page = st.number_input(
+                    f"ページ（全{page_count}ページ）",
+                    min_value=1,
+                    max_value=page_count,
+                    value=min(st.session_state.get(f"{key}_page", 1), page_count),
+                    step=1,
+                    key=f"{key}_page"
+                )
+        
+        start = (page - 1) * page_size
+        end = min(start + page_size, total_rows)
+        column_positions = [df.columns.get_loc(column) for column in columns]
+        st.dataframe(
+            df.iloc[start:end, column_positions],
+            use_container_width=True,
+            hide_index=True
+        )
+        if page_count > 1:
+            st.caption(f"全{total_rows}件中 {start + 1}〜{end}件目を表示")
+    
+    def snapshot(self):
+        """現在のスタイル設定を固定したコピーを作成（別スレッドでの描画用）"""
+        renderer = copy.copy(self)
+        renderer._styles = copy.deepcopy(self.styles)
+        return renderer
+    
+    def submit_pdf_job(self, problems_df, answers_df, settings, file_name):
+        """PDF生成をワーカープールに投入し、進捗を追跡できるジョブを返す"""
+        # フォントの設定と警告の表示はメインスレッドで済ませておく
+        self.prepare_fonts()
+        
+        renderer = self.snapshot()
+        job = PdfRenderJob(file_name, renderer.estimate_page_count(problems_df, answers_df, settings))
+        job.future = get_pdf_executor().submit(
+            renderer.create_pdf, problems_df, answers_df, dict(settings), job.update_progress
+        )
+        return job
+    
+    def format_file_size(self, num_bytes):
+        """バイト数を読みやすい表記にする"""
+        if num_bytes < 1024:
+            return f"{num_bytes} B"
+        if num_bytes < 1024 * 1024:
+            return f"{num_bytes / 1024:.1f} KB"
+        return f"{num_bytes / (1024 * 1024):.2f} MB"
     
-    def create_download_link(self, pdf_buffer, file_name):
-        """ダウンロードリンクを作成する関数"""
-        pdf_data = pdf_buffer.getvalue()
-        b64_pdf = base64.b64encode(pdf_data).decode()
-        href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="{file_name}" target="_blank">💾 PDFをダウンロード</a>'
-        return href, b64_pdf
+    def create_inline_preview(self, pdf_buffer, height=800):
+        """PDFを画面内に表示するHTMLを作成する関数"""
+        b64_pdf = base64.b64encode(pdf_buffer.getvalue()).decode()
+        return (f'<iframe src="data:application/pdf;base64,{b64_pdf}#view=FitH" '
+                f'width="100%" height="{height}" style="border: 1px solid #ddd;"></iframe>')
     
     def create_auto_download_script(self, b64_pdf, file_name):
         """自動ダウンロードスクリプトを作成する関数"""
+        mime_type = DOWNLOAD_MIME_TYPES.get(os.path.splitext(file_name)[1].lower(), 'application/pdf')
         script = f"""
         <script>
         setTimeout(function() {{
             var link = document.createElement('a');
-            link.href = 'data:application/pdf;base64,{b64_pdf}';
+            link.href = 'data:{mime_type};base64,{b64_pdf}';
             link.download = '{file_name}';
             document.body.appendChild(link);
             link.click();
@@ -397,4 +1140,6 @@ class OutputFormatter:
     
     @property
     def styles(self):
+        if self._styles is not None:
+            return self._styles
         return st.session_state.output_styles 
\ No newline at end of file
@@ -0,0 +1,121 @@
+import streamlit as st
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import os
+import pickle
+import re
+import time
+
+# プリセットの保存先（環境変数で変更可能）
+PRESET_DIR = os.environ.get(
+    'MATH_CREATOR_PRESET_DIR',
+    os.path.join(os.path.expanduser('~'), '.math_creator', 'presets')
+)
+PRESET_VERSION = 1
+
+# プリセットと一緒に保存する問題セットの数
+PRESET_BANK_SIZE = 10
+
+# ファイル名に使う名前の最大文字数（長い名前はハッシュで区別する）
+MAX_PRESET_STEM_LENGTH = 48
+
+
+class PresetStore:
+    """名前付きプリセットをローカルディスクに保存・読み込みする
+
+    設定と生成プランは「名前.json」に、一覧に表示する名前と保存日時は
+    「名前.meta.json」に、作り置きの問題セット（任意）は「名前.bank.pkl」に保存する。
+    生成プランは大きくなることがあるので、一覧には「名前.meta.json」だけを読む。
+    問題セットは同じ問題を何度も出さないよう、take_bank で一度だけ取り出して削除する。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def list_names(self) -> List[str]:
+        """保存済みのプリセット名（新しい順）"""
+        presets = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.meta.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name), encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(meta, dict) and 'name' in meta:
+                presets.append((meta.get('saved_at', 0), meta['name']))
+        return [name for _, name in sorted(presets, reverse=True)]
+
+    def save(self, name: str, settings: Dict[str, Any], plan: Dict[str, Any],
+             bank: Optional[List[Any]] = None) -> None:
+        """プリセットを保存（同じ名前のものは上書き）"""
+        meta = {'name': name, 'saved_at': time.time()}
+        data = dict(meta, version=PRESET_VERSION, settings=settings, plan=plan)
+        self._write(self._path(name, '.json'), json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        # 一覧に出すのは本体を書き終えてから
+        self._write(self._path(name, '.meta.json'), json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+        bank_path = self._path(name, '.bank.pkl')
+        if bank:
+            self._write(bank_path, pickle.dumps(bank, protocol=pickle.HIGHEST_PROTOCOL))
+        elif os.path.exists(bank_path):
+            os.remove(bank_path)
+
+    def load(self, name: str) -> Optional[Dict[str, Any]]:
+        """プリセットを読み込む（見つからない・壊れている場合はNone）"""
+        try:
+            with open(self._path(name, '.json'), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != PRESET_VERSION or not isinstance(data.get('settings'), dict):
+            return None
+        return data
+
+    def take_bank(self, name: str) -> Optional[List[Any]]:
+        """保存された問題セットを取り出して削除する（無い・取り出し済みの場合はNone）"""
+        # 別のセッションと同時に読み込んでも一方だけが受け取れるよう、先に名前を変えてから読む
+        bank_path = self._path(name, '.bank.pkl')
+        taken_path = f'{bank_path}.{os.getpid()}.{time.time_ns()}.taken'
+        try:
+            os.replace(bank_path, taken_path)
+        except OSError:
+            return None
+        try:
+            with open(taken_path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        finally:
+            os.remove(taken_path)
+
+    def delete(self, name: str) -> None:
+        for suffix in ('.meta.json', '.json', '.bank.pkl'):
+            path = self._path(name, suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _path(self, name: str, suffix: str) -> str:
+        # ファイル名に使えない文字は置き換えて長すぎる名前は切り詰め、
+        # 置き換えや切り詰めで同じ名前にならないよう元の名前のハッシュを付ける
+        name = name.strip()
+        stem = re.sub(r'[\\/:*?"<>|\s]', '_', name)[:MAX_PRESET_STEM_LENGTH]
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.directory, f'{stem}_{digest}{suffix}')
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        # 書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+@st.cache_resource
+def get_preset_store() -> PresetStore:
+    """全セッション共通のプリセットストア"""
+    return PresetStore(PRESET_DIR)
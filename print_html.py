@@ -0,0 +1,114 @@
+import html
+from typing import Any, Dict, Iterator, Tuple
+
+import pandas as pd
+
+from exports import iter_chunks
+
+PRINT_HTML_MIME = 'text/html'
+
+# 印刷用HTMLの見た目に関わる設定（この値が変わったときだけ作り直す）
+PRINT_HTML_SETTING_KEYS = (
+    'header_text', 'answer_display', 'show_answer_column',
+    'print_margin', 'print_columns', 'print_show_border', 'print_border_width', 'print_show_grid',
+)
+
+# 解答一覧は問題より短いので、問題の列数の何倍で並べるか
+ANSWER_KEY_COLUMN_FACTOR = 2
+
+_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+@page {{ size: A4; margin: {margin}mm; }}
+body {{ margin: 0; font-family: "Hiragino Sans", "Yu Gothic", "Meiryo", "Noto Sans CJK JP", sans-serif; color: #000; }}
+h1 {{ font-size: 16pt; text-align: center; margin: 0 0 4mm; }}
+.name {{ text-align: right; margin: 0 0 4mm; }}
+.sheet {{ column-count: {columns}; column-gap: 8mm; column-rule: {column_rule}; }}
+.item {{ display: flex; align-items: center; gap: 3mm; min-height: 12mm; padding: 1mm 2mm; margin: 0 0 2mm;
+  {item_border} break-inside: avoid; page-break-inside: avoid; }}
+.number {{ min-width: 10mm; }}
+.question {{ flex: 1; font-size: 14pt; white-space: nowrap; }}
+.blank {{ width: 22mm; height: 9mm; border: 1px solid #000; }}
+.correct {{ min-width: 14mm; text-align: right; color: #c00; }}
+.answer-key {{ break-before: page; page-break-before: always; }}
+.answer-key .sheet {{ column-count: {answer_columns}; }}
+.answer-key .item {{ min-height: 0; margin: 0; }}
+.print-button {{ position: fixed; top: 8px; right: 8px; }}
+@media screen {{ body {{ padding: {margin}mm; }} }}
+@media print {{ .print-button {{ display: none; }} }}
+</style>
+</head>
+<body>
+<button class="print-button" onclick="window.print()">印刷</button>
+"""
+
+
+def print_html_key(settings: Dict[str, Any]) -> Tuple:
+    """印刷用HTMLのキャッシュのキー（見た目に関わる設定の値）"""
+    return tuple(settings.get(key) for key in PRINT_HTML_SETTING_KEYS)
+
+
+def _escape(values: pd.Series) -> pd.Series:
+    return (values.astype(str).str.replace('&', '&amp;', regex=False)
+            .str.replace('<', '&lt;', regex=False)
+            .str.replace('>', '&gt;', regex=False))
+
+
+def _problem_items(problems_df: pd.DataFrame, settings: Dict[str, Any]) -> Iterator[str]:
+    """問題1問ずつの要素（行の範囲ごとに、列単位の文字列演算でまとめて作る）"""
+    show_answer_column = settings.get('show_answer_column', True)
+    show_correct = settings['answer_display'] == 1
+    for chunk in iter_chunks(problems_df):
+        items = ('<div class="item"><span class="number">(' + _escape(chunk['ばんごう'])
+                 + ')</span><span class="question">' + _escape(chunk['もんだい']) + '</span>')
+        if show_answer_column:
+            items = items + '<span class="blank"></span>'
+        if show_correct:
+            items = items + '<span class="correct">' + _escape(chunk['せいかい']) + '</span>'
+        yield ''.join(items + '</div>\n')
+
+
+def _answer_items(answers_df: pd.DataFrame) -> Iterator[str]:
+    for chunk in iter_chunks(answers_df):
+        items = ('<div class="item"><span class="number">(' + _escape(chunk['もんだいばんごう'])
+                 + ')</span><span class="correct">' + _escape(chunk['せいかい']) + '</span></div>\n')
+        yield ''.join(items)
+
+
+def render_print_html(problems_df: pd.DataFrame, answers_df: pd.DataFrame, settings: Dict[str, Any]) -> str:
+    """ブラウザからそのまま印刷できる、問題（と解答）の1つのHTML文書
+
+    ReportLabは使わず、改ページ・段組み・余白は印刷用のCSSに任せる。
+    print_margin（mm）を用紙の余白、print_columnsを段数にし、
+    print_show_border・print_border_widthで問題ごとの枠線、print_show_gridで段と行の区切り線を引く。
+    """
+    columns = max(1, int(settings.get('print_columns', 2)))
+    if settings.get('print_show_border', True):
+        item_border = f"border: {settings.get('print_border_width', 1)}px solid #000;"
+    elif settings.get('print_show_grid', False):
+        item_border = "border: none; border-bottom: 1px dotted #999;"
+    else:
+        item_border = "border: none;"
+    title = html.escape(str(settings['header_text']))
+
+    parts = [_PAGE_TEMPLATE.format(
+        title=title,
+        margin=settings.get('print_margin', 20),
+        columns=columns,
+        answer_columns=columns * ANSWER_KEY_COLUMN_FACTOR,
+        column_rule='1px solid #999' if settings.get('print_show_grid', False) else 'none',
+        item_border=item_border,
+    )]
+    parts.append(f'<h1>{title}</h1>\n<p class="name">なまえ（　　　　　　　　　　）</p>\n<div class="sheet">\n')
+    parts.extend(_problem_items(problems_df, settings))
+    parts.append('</div>\n')
+
+    if settings['answer_display'] == 3 and answers_df is not None:
+        parts.append(f'<section class="answer-key">\n<h1>{title}（解答）</h1>\n<div class="sheet">\n')
+        parts.extend(_answer_items(answers_df))
+        parts.append('</div>\n</section>\n')
+    parts.append('</body>\n</html>\n')
+    return ''.join(parts)
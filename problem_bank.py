@@ -0,0 +1,343 @@
+import streamlit as st
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+import json
+import os
+import random
+import sqlite3
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# 問題バンクのファイル（環境変数で変更可能）
+BANK_PATH = os.environ.get(
+    'MATH_CREATOR_BANK_PATH',
+    os.path.join(os.path.expanduser('~'), '.math_creator', 'problem_bank.sqlite3')
+)
+
+# 問題バンクに追加するときの試行回数（演算子ごと）
+BANK_FILL_TRIES = 20000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY,
+    question TEXT NOT NULL UNIQUE,
+    operator TEXT NOT NULL,
+    term_count INTEGER NOT NULL,
+    operands TEXT NOT NULL,
+    first_operand INTEGER NOT NULL,
+    rest_min INTEGER NOT NULL,
+    rest_max INTEGER NOT NULL,
+    answer TEXT NOT NULL,
+    answer_value REAL NOT NULL,
+    has_remainder INTEGER NOT NULL,
+    carry_count INTEGER NOT NULL
+);
+-- IDの絞り込みが表を読まずに済むよう、抽出条件の列をすべて含める
+CREATE INDEX IF NOT EXISTS idx_problems_operands
+    ON problems (operator, term_count, first_operand, rest_min, rest_max,
+                 answer_value, has_remainder, carry_count);
+CREATE INDEX IF NOT EXISTS idx_problems_answer
+    ON problems (operator, term_count, answer_value);
+CREATE INDEX IF NOT EXISTS idx_problems_carry
+    ON problems (operator, term_count, carry_count);
+"""
+
+# 抽出条件の名前とSQL
+FILTERS = {
+    'operator': 'operator = ?',
+    'term_count': 'term_count = ?',
+    'first_min': 'first_operand >= ?',
+    'first_max': 'first_operand <= ?',
+    'rest_min': 'rest_min >= ?',
+    'rest_max': 'rest_max <= ?',
+    'answer_min': 'answer_value >= ?',
+    'answer_max': 'answer_value <= ?',
+    'has_remainder': 'has_remainder = ?',
+    'carry_min': 'carry_count >= ?',
+    'carry_max': 'carry_count <= ?',
+}
+
+# 演算子ごとの設定項目の接頭辞
+OPERATOR_PREFIX = {"+": 'add', "-": 'sub', "*": 'mul', "/": 'div'}
+
+
+def answer_value(answer: Any) -> float:
+    """答えの数値（余りありの場合は商）"""
+    if isinstance(answer, str):
+        return float(answer.split(" 余り ")[0])
+    return float(answer)
+
+
+class ProblemBank:
+    """問題をSQLiteに蓄積し、条件に合う問題をインデックスで絞り込んで抽出する"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Streamlitは再実行ごとにスレッドが変わるため、操作ごとに接続する
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, entries: Iterable[Tuple[List[int], str, Any, str]]) -> int:
+        """(オペランド, 演算子, 答え, 問題文)を追加し、新しく追加できた数を返す"""
+        import numpy as np
+        from difficulty import difficulty_features
+
+        # 繰り上がり・繰り下がりの数は演算子と項数ごとにまとめて計算する
+        entries = list(entries)
+        carries = [0] * len(entries)
+        groups: Dict[Tuple[str, int], List[int]] = {}
+        for i, (nums, operator, _, _) in enumerate(entries):
+            groups.setdefault((operator, len(nums)), []).append(i)
+        for (operator, _), indexes in groups.items():
+            features = difficulty_features(np.array([entries[i][0] for i in indexes]), operator)
+            for i, count in zip(indexes, (features['carries'] + features['borrows']).tolist()):
+                carries[i] = count
+
+        rows = []
+        for (nums, operator, answer, question), carry_count in zip(entries, carries):
+            rest = nums[1:] or [0]
+            rows.append((
+                question, operator, len(nums), json.dumps(nums), nums[0], min(rest), max(rest),
+                json.dumps(answer, ensure_ascii=False), answer_value(answer),
+                int(isinstance(answer, str)), carry_count,
+            ))
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO problems (question, operator, term_count, operands, first_operand, "
+                "rest_min, rest_max, answer, answer_value, has_remainder, carry_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return conn.total_changes - before
+
+    def fill(self, generator, tries: int = BANK_FILL_TRIES) -> int:
+        """ジェネレーターの現在の設定で問題を作って追加する"""
+        entries = []
+        for operator in generator.OPERATOR_MAP.get(generator.settings['problem_type'], ["+"]):
+            if generator.settings[f"{OPERATOR_PREFIX[operator]}_coverage"] == 2:
+                candidates = generator.enumerate_coverage(operator)
+            else:
+                candidates = generator.sample_candidates(operator, tries)
+            for nums, answer in candidates:
+                entries.append((nums, operator, answer, generator.build_question_string(nums, operator)))
+        return self.add(entries)
+
+    def count(self, **filters) -> int:
+        where, params = self._where(filters)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM problems{where}", params).fetchone()[0]
+
+    def query_ids(self, **filters) -> List[int]:
+        """条件に合う問題のIDを返す（条件名はFILTERSを参照）"""
+        where, params = self._where(filters)
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(f"SELECT id FROM problems{where}", params)]
+
+    def fetch(self, ids: List[int]) -> List[Dict[str, Any]]:
+        """IDの順に問題を取り出す"""
+        rows = {}
+        with self._connect() as conn:
+            # SQLiteの変数の上限を超えないよう分けて取り出す
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                for row in conn.execute(
+                    f"SELECT id, operator, operands, answer, carry_count FROM problems WHERE id IN ({placeholders})",
+                    chunk
+                ):
+                    rows[row[0]] = {
+                        'operator': row[1],
+                        'operands': json.loads(row[2]),
+                        'answer': json.loads(row[3]),
+                        'carry_count': row[4],
+                    }
+        return [rows[i] for i in ids if i in rows]
+
+    def sample(self, count: int, rng: Optional[random.Random] = None, **filters) -> List[Dict[str, Any]]:
+        """条件に合う問題から重複なしでランダムに取り出す"""
+        ids = self.query_ids(**filters)
+        rng = rng or random.Random()
+        return self.fetch(rng.sample(ids, min(count, len(ids))))
+
+    @staticmethod
+    def settings_filters(settings: Dict[str, Any], operator: str) -> Dict[str, Any]:
+        """生成設定を抽出条件に変換（MathProblemGeneratorの範囲・制約と同じ条件）"""
+        from candidates import operand_ranges
+
+        ranges = operand_ranges(settings, operator)
+        # 2項目以降は範囲をまとめた条件で絞り、項ごとの範囲は取り出した行で確かめる
+        filters = {
+            'operator': operator,
+            'term_count': settings['term_count'],
+            'rest_min': min(low for low, _ in ranges[1:]),
+            'rest_max': max(high for _, high in ranges[1:]),
+        }
+        # 余りなしのわり算は被除数を答えから決めるので、1項目の範囲は見ない
+        if not (operator == "/" and settings['div_limit'] == 1):
+            filters['first_min'], filters['first_max'] = ranges[0]
+
+        answer_min, answer_max = None, None
+        if operator == "+" and settings['add_limit'] == 1:
+            answer_max = 10
+        elif operator == "+" and settings['add_limit'] == 2:
+            answer_min, answer_max = 11, 20
+        elif operator == "-" and settings['sub_limit'] == 1:
+            answer_min = 1
+        elif operator == "*" and settings['mul_limit'] == 1:
+            answer_max = 100
+        elif operator == "/" and settings['div_limit'] == 1:
+            filters['has_remainder'] = 0
+
+        if settings['value_limit_enabled'] == 2:
+            # 余りありの答えは数値として扱えないので除外される
+            filters['has_remainder'] = 0
+            answer_min = settings['value_min'] if answer_min is None else max(answer_min, settings['value_min'])
+            answer_max = settings['value_max'] if answer_max is None else min(answer_max, settings['value_max'])
+
+        # 繰り上がり・繰り下がりの指定（足し算・引き算のみ）
+        carry_mode = settings.get('carry_mode', 1)
+        if operator in ("+", "-") and carry_mode == 2:
+            filters['carry_max'] = 0
+        elif operator in ("+", "-") and carry_mode == 3:
+            filters['carry_min'] = 1
+
+        if answer_min is not None:
+            filters['answer_min'] = answer_min
+        if answer_max is not None:
+            filters['answer_max'] = answer_max
+        return filters
+
+    def build_worksheet(self, generator) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+        """ジェネレーターの設定に合う問題を問題バンクから抽出してプリントを作る"""
+        settings = generator.settings
+        ids = []
+        for operator in generator.OPERATOR_MAP.get(settings['problem_type'], ["+"]):
+            ids.extend(self.query_ids(**self.settings_filters(settings, operator)))
+
+        generator.rng.seed()
+        picked = pick_rows(generator, len(ids), lambda positions: self.fetch([ids[p] for p in positions]))
+        return rows_to_worksheet(generator, picked)
+
+    def revision(self) -> Tuple[int, int]:
+        """内容が変わったかを判定するための値（件数, 最大ID）"""
+        with self._connect() as conn:
+            return tuple(conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM problems").fetchone())
+
+    def all_rows(self) -> Iterable[Dict[str, Any]]:
+        """すべての問題をID順に返す"""
+        with self._connect() as conn:
+            for row in conn.execute(
+                "SELECT operator, operands, answer, carry_count FROM problems ORDER BY id"
+            ):
+                yield {
+                    'operator': row[0],
+                    'operands': json.loads(row[1]),
+                    'answer': json.loads(row[2]),
+                    'carry_count': row[3],
+                }
+
+    def _where(self, filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for name, value in filters.items():
+            if name not in FILTERS:
+                raise ValueError(f"不明な抽出条件です: {name}")
+            if value is None:
+                continue
+            clauses.append(FILTERS[name])
+            params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def pick_rows(generator, candidate_count: int,
+              fetch: Callable[[List[int]], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """候補から問題数分をランダムに選ぶ（出題履歴があれば最近出題していない問題を優先）
+
+    fetchは候補の位置のリストを受け取り、その順に問題を返す関数。
+    3+5と5+3を同じ問題とみなす設定のときは、交換しただけの問題を除く。
+    自由入力のルールと項ごとの範囲はSQLの条件にできないので、取り出した行に対して判定する。
+    """
+    from candidates import operand_ranges
+
+    settings = generator.settings
+    count = min(settings['question_count'], candidate_count)
+    needs_check = bool(settings.get('custom_rules', '').strip()) or any(
+        len(set(operand_ranges(settings, operator)[1:])) > 1
+        for operator in generator.OPERATOR_MAP.get(settings['problem_type'], ["+"])
+    )
+    if needs_check:
+        fetch = row_filtered_fetch(settings, fetch)
+    if generator.history is None and not settings.get('dedup_commutative', False) and not needs_check:
+        return fetch(generator.rng.sample(range(candidate_count), count))
+
+    # ランダムな順に少しずつ取り出し、最近出題した問題は足りないときだけ使う
+    order = generator.rng.sample(range(candidate_count), candidate_count)
+    picked, recently_seen, used_keys = [], [], set()
+    chunk = max(count * 2, 100)
+    for start in range(0, candidate_count, chunk):
+        for row in fetch(order[start:start + chunk]):
+            key = generator.problem_key(row['operands'], row['operator'])
+            if key in used_keys:
+                continue
+            used_keys.add(key)
+            if generator.history is not None and generator.history.seen(key):
+                if len(recently_seen) < count:
+                    recently_seen.append(row)
+            else:
+                picked.append(row)
+                if len(picked) == count:
+                    return picked
+    return picked + recently_seen[:count - len(picked)]
+
+
+def row_filtered_fetch(
+        settings: Dict[str, Any],
+        fetch: Callable[[List[int]], List[Dict[str, Any]]]) -> Callable[[List[int]], List[Dict[str, Any]]]:
+    """取り出した行のうち、項ごとの範囲・設定の条件・ルールをすべて満たす行だけを返すfetch"""
+    import numpy as np
+    from candidates import CandidateBlock, operand_ranges
+
+    def filtered(positions: List[int]) -> List[Dict[str, Any]]:
+        rows = fetch(positions)
+        keep = [False] * len(rows)
+        groups: Dict[Tuple[str, int], List[int]] = {}
+        for i, row in enumerate(rows):
+            groups.setdefault((row['operator'], len(row['operands'])), []).append(i)
+        for (operator, _), indexes in groups.items():
+            # 蓄積済みの問題なので、わり算の被除数は作り直さない
+            operands = np.array([rows[i]['operands'] for i in indexes])
+            block = CandidateBlock(settings, operator, operands, adjust_division=False)
+            lows, highs = np.array(operand_ranges(settings, operator)[1:]).T
+            in_range = np.all((operands[:, 1:] >= lows) & (operands[:, 1:] <= highs), axis=1)
+            for i, valid in zip(indexes, (block.valid & in_range).tolist()):
+                keep[i] = valid
+        return [row for row, valid in zip(rows, keep) if valid]
+    return filtered
+
+
+def rows_to_worksheet(generator, rows: List[Dict[str, Any]]) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+    """問題バンクから取り出した問題をプリントの形にする"""
+    problems = []
+    generator.reset_generated()
+    for row in rows:
+        nums, operator = row['operands'], row['operator']
+        generator.append_problem(problems, nums, operator, row['answer'], generator.problem_key(nums, operator))
+    return generator.finalize_problems(problems)
+
+
+@st.cache_resource
+def get_problem_bank() -> ProblemBank:
+    """全セッション共通の問題バンク"""
+    return ProblemBank(BANK_PATH)
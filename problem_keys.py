@@ -0,0 +1,69 @@
+from typing import Hashable, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 演算子の番号（キーの下位ビットに入れる）
+OPERATOR_CODES = {"+": 0, "-": 1, "*": 2, "/": 3}
+
+# 交換法則が成り立つ演算子
+COMMUTATIVE_OPERATORS = ("+", "*")
+
+OPERATOR_BITS = 2
+TERM_COUNT_BITS = 3
+OPERAND_BITS = 20
+OPERAND_LIMIT = 1 << OPERAND_BITS
+
+
+def pack_problem_key(nums: List[int], operator: str, commutative: bool = False) -> Hashable:
+    """演算子とオペランドを1つの整数に詰めた問題のキー
+
+    下位から演算子（2ビット）、項数（3ビット）、各オペランド（20ビットずつ）の順に並べる。
+    commutativeがTrueなら足し算・かけ算のオペランドを並べ替え、3+5と5+3を同じキーにする。
+    範囲外のオペランド（負の数や20ビットを超える数）はタプルのキーにする。
+    """
+    if commutative and operator in COMMUTATIVE_OPERATORS:
+        nums = sorted(nums)
+    key = OPERATOR_CODES[operator] | (len(nums) << OPERATOR_BITS)
+    shift = OPERATOR_BITS + TERM_COUNT_BITS
+    for num in nums:
+        if not 0 <= num < OPERAND_LIMIT:
+            return (operator, *nums)
+        key |= num << shift
+        shift += OPERAND_BITS
+    return key
+
+
+def unique_problem_indexes(operands: "np.ndarray", operators: "np.ndarray", term_counts: "np.ndarray",
+                           commutative: bool = False) -> "np.ndarray":
+    """重複を除いた問題の行番号（最初に現れた行、昇順）
+
+    operandsは項数の上限まで0で埋めた行列、operatorsはOPERATOR_CODESの番号。
+    すべての行が64ビットに収まる場合は整数キーに詰めてnp.uniqueを使う。
+    """
+    import numpy as np
+
+    operands = np.asarray(operands, dtype=np.int64)
+    operators = np.asarray(operators, dtype=np.int64)
+    term_counts = np.asarray(term_counts, dtype=np.int64)
+    if len(operators) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if commutative:
+        # 0埋めの部分も含めて並べ替える（項数がキーに入るので同じ問題は同じ並びになる）
+        swap = np.isin(operators, [OPERATOR_CODES[op] for op in COMMUTATIVE_OPERATORS])
+        operands = operands.copy()
+        operands[swap] = np.sort(operands[swap], axis=1)
+
+    low, high = int(operands.min()), int(operands.max())
+    width = max(1, high.bit_length())
+    header_bits = OPERATOR_BITS + TERM_COUNT_BITS
+    if low >= 0 and header_bits + width * operands.shape[1] <= 63:
+        keys = operators | (term_counts << OPERATOR_BITS)
+        for column in range(operands.shape[1]):
+            keys = keys | (operands[:, column] << (header_bits + width * column))
+        _, indexes = np.unique(keys, return_index=True)
+    else:
+        rows = np.column_stack([operators, term_counts, operands])
+        _, indexes = np.unique(rows, axis=0, return_index=True)
+    return np.sort(indexes)
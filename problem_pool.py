@@ -0,0 +1,170 @@
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Tuple, TYPE_CHECKING
+import copy
+import hashlib
+import json
+import os
+import threading
+
+from session_store import estimate_size
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# 1つの設定あたりに作り置きしておく問題セットの数
+BLOCKS_PER_SETTINGS = 4
+
+# 作り置きの対象として追跡する設定の数（起動時に温める設定は除く）
+MAX_TRACKED_SETTINGS = 16
+
+# 作り置き全体のメモリ上限（環境変数で変更可能、単位MB）
+# 網羅モードの問題セットは1つで数MBになるため、個数だけでなくバイト数でも制限する
+POOL_MEMORY_BUDGET = int(os.environ.get('MATH_CREATOR_POOL_BUDGET_MB', 64)) * 1024 * 1024
+
+# 起動時に温めておく設定（デフォルト設定に上書きする項目）
+WARM_UP_PRESETS: List[Dict[str, Any]] = [
+    {},  # デフォルト（2項の足し算・10以下）
+    {'problem_type': 2},  # 引き算
+    {'problem_type': 4},  # かけ算（九九 1〜9）
+]
+
+# 問題の中身に影響しない設定（フィンガープリントから除く）
+DISPLAY_ONLY_KEYS = {
+    'answer_display', 'show_answer_column', 'font_size', 'header_text',
+}
+DISPLAY_ONLY_PREFIXES = ('print_',)
+
+ProblemBlock = Tuple["pd.DataFrame", "pd.DataFrame"]
+
+
+def block_size(block: ProblemBlock) -> int:
+    """問題セット（問題と解答のDataFrame）がメモリ上で占めるおおよそのバイト数"""
+    return sum(estimate_size(df) for df in block)
+
+
+def settings_fingerprint(settings: Dict[str, Any]) -> str:
+    """問題の生成結果に影響する設定だけから作るキー"""
+    relevant = {
+        key: value for key, value in settings.items()
+        if key not in DISPLAY_ONLY_KEYS and not key.startswith(DISPLAY_ONLY_PREFIXES)
+    }
+    encoded = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+class ProblemPool:
+    """設定ごとに生成済みの問題セットを作り置きし、リクエスト時に取り出すプール
+
+    よく使われる設定はバックグラウンドのスレッドが常に補充しておくため、
+    問題生成ボタンを押したときは作り置きを1つ取り出すだけで済む。
+    作り置きが無いときはその場で生成し、以後その設定も補充の対象にする。
+    作り置きの合計バイト数は memory_budget までに抑え、次の1つが収まらない間は補充しない。
+    """
+
+    def __init__(self, generate: Callable[[Dict[str, Any]], ProblemBlock], memory_budget: int = POOL_MEMORY_BUDGET):
+        self._generate = generate
+        self._memory_budget = memory_budget
+        self._cond = threading.Condition()
+        self._blocks: Dict[str, Deque[Tuple[ProblemBlock, int]]] = {}  # (問題セット, バイト数)
+        self._stock_bytes = 0
+        self._block_sizes: Dict[str, int] = {}  # 設定ごとの直近の問題セットのバイト数
+        self._pinned: Dict[str, Dict[str, Any]] = {}  # 起動時に温める設定
+        self._tracked: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # 古い順
+        self._worker = threading.Thread(target=self._run, name="problem-pool", daemon=True)
+        self._worker.start()
+
+    def warm_up(self, default_settings: Dict[str, Any]) -> None:
+        """よく使われる設定を補充の対象に登録する"""
+        with self._cond:
+            for overrides in WARM_UP_PRESETS:
+                settings = copy.deepcopy(default_settings)
+                settings.update(overrides)
+                key = settings_fingerprint(settings)
+                self._pinned[key] = settings
+                self._blocks.setdefault(key, deque())
+            self._cond.notify()
+
+    def take(self, settings: Dict[str, Any]) -> ProblemBlock:
+        """設定に合う問題セットを1つ取り出す（作り置きが無ければその場で生成）"""
+        key = settings_fingerprint(settings)
+        with self._cond:
+            self._track(key, settings)
+            blocks = self._blocks.get(key)
+            block = None
+            if blocks:
+                block, size = blocks.popleft()
+                self._stock_bytes -= size
+            self._cond.notify()
+        if block is None:
+            block = self._generate(copy.deepcopy(settings))
+        return block
+
+    def add(self, settings: Dict[str, Any], blocks: List[ProblemBlock]) -> None:
+        """生成済みの問題セットをプールに加える（プリセットの問題セットなど、予算を超える分は捨てる）"""
+        key = settings_fingerprint(settings)
+        sized = [(block, block_size(block)) for block in blocks]
+        with self._cond:
+            self._track(key, settings)
+            for block, size in sized:
+                self._append(key, block, size)
+            self._cond.notify()
+
+    def _append(self, key: str, block: ProblemBlock, size: int) -> bool:
+        """予算に収まれば作り置きに加える（加えたらTrue）"""
+        self._block_sizes[key] = size
+        if key not in self._blocks or self._stock_bytes + size > self._memory_budget:
+            return False
+        self._blocks[key].append((block, size))
+        self._stock_bytes += size
+        return True
+
+    def _drop(self, key: str) -> None:
+        for _, size in self._blocks.pop(key, ()):
+            self._stock_bytes -= size
+        self._block_sizes.pop(key, None)
+
+    def _track(self, key: str, settings: Dict[str, Any]) -> None:
+        if key in self._pinned:
+            return
+        if key in self._tracked:
+            self._tracked.move_to_end(key)
+            return
+        self._tracked[key] = copy.deepcopy(settings)
+        self._blocks.setdefault(key, deque())
+        while len(self._tracked) > MAX_TRACKED_SETTINGS:
+            old_key, _ = self._tracked.popitem(last=False)
+            self._drop(old_key)
+
+    def _next_refill(self):
+        """作り置きが足りず、次の1つが予算に収まる設定を1つ選ぶ（起動時に温める設定を優先）"""
+        for key, settings in list(self._pinned.items()) + list(reversed(self._tracked.items())):
+            if len(self._blocks.get(key, ())) >= BLOCKS_PER_SETTINGS:
+                continue
+            if self._stock_bytes + self._block_sizes.get(key, 0) > self._memory_budget:
+                continue
+            return key, copy.deepcopy(settings)
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                target = self._next_refill()
+                while target is None:
+                    self._cond.wait()
+                    target = self._next_refill()
+            key, settings = target
+
+            try:
+                block = self._generate(settings)
+            except Exception:
+                # 生成できない設定は以後補充しない
+                with self._cond:
+                    self._pinned.pop(key, None)
+                    self._tracked.pop(key, None)
+                    self._drop(key)
+                continue
+
+            size = block_size(block)
+            with self._cond:
+                # 補充中に追跡から外れた設定の分や、予算に収まらない分は捨てる
+                self._append(key, block, size)
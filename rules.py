@@ -0,0 +1,225 @@
+import ast
+import functools
+import re
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+# ルールで使えるオペランドの名前（左から1項目, 2項目, ...）
+OPERAND_NAMES = ('a', 'b', 'c', 'd', 'e')
+
+# ルールで使える値の名前と説明
+RULE_VARIABLES = {
+    'answer': "答え（余りありのわり算は商）",
+    'remainder': "わり算の余り",
+    'carries': "足し算の繰り上がりの回数",
+    'borrows': "引き算の繰り下がりの回数",
+    'regroups': "繰り上がり・繰り下がりの回数",
+    'steps': "かけ算の筆算の手数",
+}
+
+# 日本語で書いた名前の言い換え
+RULE_ALIASES = {
+    '答え': 'answer',
+    '余り': 'remainder',
+    '繰り上がり': 'carries',
+    '繰り下がり': 'borrows',
+}
+
+# ルールに書ける数の絶対値の上限（配列の計算で桁あふれしないように）
+MAX_RULE_LITERAL = 10 ** 12
+
+_SCOPE_PATTERN = re.compile(r'^\s*([+\-*/])\s*:\s*(.*)$')
+
+_BINARY_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Mod: np.mod,
+}
+
+_COMPARE_OPS = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+
+
+class RuleError(ValueError):
+    """ルールの書き方の誤り"""
+
+
+class RuleSet:
+    """複数のルールをまとめて、候補のブロック全体の真偽値配列に変換する
+
+    ルールの文字列は最初に1度だけ構文解析し、配列演算の関数の組み合わせにしておく。
+    候補ごとにPythonの条件式を評価することはない。
+    """
+
+    def __init__(self, rules: List[Tuple[Optional[str], Callable[[Dict[str, np.ndarray]], Any], FrozenSet[str]]],
+                 names: FrozenSet[str]):
+        self.rules = rules
+        self.names = names
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def mask(self, operator: str, variables: Dict[str, np.ndarray], size: int) -> np.ndarray:
+        """演算子が合うルールをすべて満たす行（項数が足りず使えないルールは満たさない扱い）"""
+        result = np.ones(size, dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for scope, rule, names in self.rules:
+                if scope is not None and scope != operator:
+                    continue
+                if not names <= variables.keys():
+                    return np.zeros(size, dtype=bool)
+                result &= np.broadcast_to(np.asarray(rule(variables), dtype=bool), (size,))
+        return result
+
+
+def _compile_node(node: ast.AST, names: set) -> Callable[[Dict[str, np.ndarray]], Any]:
+    """式の木を、変数の配列を受け取って値を返す関数に変換"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = node.value
+        if not abs(value) <= MAX_RULE_LITERAL:
+            raise RuleError(f"数が大きすぎます（{MAX_RULE_LITERAL:,}まで）: {value}")
+        return lambda variables: value
+
+    if isinstance(node, ast.Name):
+        name = RULE_ALIASES.get(node.id, node.id)
+        if name not in RULE_VARIABLES and name not in OPERAND_NAMES:
+            raise RuleError(f"「{node.id}」は使えない名前です")
+        names.add(name)
+        return lambda variables: variables[name]
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.Not)):
+        operand = _compile_node(node.operand, names)
+        if isinstance(node.op, ast.USub):
+            return lambda variables: -operand(variables)
+        return lambda variables: np.logical_not(operand(variables))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        op = _BINARY_OPS[type(node.op)]
+        left, right = _compile_node(node.left, names), _compile_node(node.right, names)
+        return lambda variables: op(left(variables), right(variables))
+
+    if isinstance(node, ast.BoolOp):
+        op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        parts = [_compile_node(value, names) for value in node.values]
+        return lambda variables: functools.reduce(op, (part(variables) for part in parts))
+
+    if isinstance(node, ast.Compare):
+        # 1 <= a <= 9 のような連続した比較は、隣り合う比較をすべて満たす行
+        parts = []
+        left = _compile_node(node.left, names)
+        for i, (op, comparator) in enumerate(zip(node.ops, node.comparators)):
+            parts.append(_compile_comparison(left, op, comparator, names))
+            if i + 1 < len(node.ops):
+                left = _compile_node(comparator, names)
+        return lambda variables: functools.reduce(np.logical_and, (part(variables) for part in parts))
+
+    raise RuleError("使えない書き方が含まれています")
+
+
+def _compile_comparison(left: Callable, op: ast.cmpop, comparator: ast.AST, names: set) -> Callable:
+    if isinstance(op, (ast.In, ast.NotIn)):
+        # answer in [11, 18] は11以上18以下
+        if not isinstance(comparator, (ast.List, ast.Tuple)) or len(comparator.elts) != 2:
+            raise RuleError("範囲は [最小, 最大] の形で書いてください")
+        low, high = (_compile_node(element, names) for element in comparator.elts)
+        negate = isinstance(op, ast.NotIn)
+
+        def between(variables):
+            value = left(variables)
+            inside = np.logical_and(value >= low(variables), value <= high(variables))
+            return np.logical_not(inside) if negate else inside
+        return between
+
+    if type(op) not in _COMPARE_OPS:
+        raise RuleError("使えない比較が含まれています")
+    compare = _COMPARE_OPS[type(op)]
+    right = _compile_node(comparator, names)
+    return lambda variables: compare(left(variables), right(variables))
+
+
+def parse_rule(line: str) -> Tuple[Optional[str], Callable, FrozenSet[str]]:
+    """1行のルールを (対象の演算子, 判定関数, 使う名前) にする
+
+    行頭に「+:」のように演算子を書くと、その演算子の問題だけに適用する。
+    """
+    scope = None
+    match = _SCOPE_PATTERN.match(line)
+    if match:
+        scope, line = match.group(1), match.group(2)
+    try:
+        tree = ast.parse(line.strip(), mode='eval')
+    except SyntaxError:
+        raise RuleError(f"ルールを読み取れません: {line.strip()}") from None
+    names: set = set()
+    return scope, _compile_node(tree.body, names), frozenset(names)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_rules(lines: Tuple[str, ...]) -> RuleSet:
+    """ルールの行をまとめて変換（同じルールは2回目以降キャッシュを使う）
+
+    空行と「#」で始まる行は無視する。
+    """
+    rules, names = [], set()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        scope, rule, rule_names = parse_rule(line)
+        rules.append((scope, rule, rule_names))
+        names |= rule_names
+    return RuleSet(rules, frozenset(names))
+
+
+def rule_lines(text: str) -> Tuple[str, ...]:
+    return tuple(text.splitlines())
+
+
+def settings_rules(settings: Dict[str, Any], operator: str) -> Tuple[str, ...]:
+    """設定画面の制限（足し算の合計・引き算の正負・かけ算の積・解の値）をルールで表したもの"""
+    rules = []
+    if operator == "+":
+        if settings['add_limit'] == 1:
+            rules.append("answer <= 10")
+        elif settings['add_limit'] == 2:
+            rules.append("10 < answer <= 20")
+    elif operator == "-":
+        if settings['sub_limit'] == 1:
+            rules.append("answer > 0")
+    elif operator == "*":
+        if settings['mul_limit'] == 1:
+            rules.append("answer <= 100")
+
+    if settings['value_limit_enabled'] == 2:
+        # 余りありの答えは数値として扱えないので対象外
+        rules.append(f"remainder == 0 and answer in [{settings['value_min']}, {settings['value_max']}]")
+    return tuple(rules)
+
+
+def operand_variables(operands: np.ndarray, names: FrozenSet[str]) -> Dict[str, np.ndarray]:
+    """ルールが使うオペランドの列（項数より後ろの名前は含めない）"""
+    return {
+        name: operands[:, column]
+        for column, name in enumerate(OPERAND_NAMES[:operands.shape[1]])
+        if name in names
+    }
+
+
+def check_rules(text: str, term_count: int) -> List[str]:
+    """設定画面で入力されたルールを確かめ、誤りのメッセージを返す"""
+    try:
+        rule_set = compile_rules(rule_lines(text))
+    except RuleError as e:
+        return [str(e)]
+    unknown = [name for name in OPERAND_NAMES[term_count:] if name in rule_set.names]
+    return [f"「{name}」は{term_count}項の問題にはありません" for name in unknown]
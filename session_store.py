@@ -0,0 +1,203 @@
+import streamlit as st
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+import atexit
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+# メモリ上に保持する生成物の上限（環境変数で変更可能、単位MB）
+SESSION_MEMORY_BUDGET = int(os.environ.get('MATH_CREATOR_SESSION_BUDGET_MB', 32)) * 1024 * 1024
+GLOBAL_MEMORY_BUDGET = int(os.environ.get('MATH_CREATOR_GLOBAL_BUDGET_MB', 256)) * 1024 * 1024
+
+# 退避先を作る親ディレクトリ（未指定ならOSの一時ディレクトリ）
+# 退避先はプロセスごとに新しく作る（他のユーザーが置いたファイルを読み込まないように）
+SPILL_PARENT_DIR = os.environ.get('MATH_CREATOR_SPILL_DIR') or None
+
+# この時間（秒）操作のないセッションは終了したものとみなし、生成物を破棄する
+SESSION_IDLE_TIMEOUT = int(os.environ.get('MATH_CREATOR_SESSION_TTL', 6 * 60 * 60))
+SESSION_SWEEP_INTERVAL = 5 * 60
+
+
+def estimate_size(value: Any) -> int:
+    """生成物がメモリ上で占めるおおよそのバイト数（辞書・リスト・タプルは中身も数える）"""
+    if hasattr(value, 'memory_usage'):
+        # DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, io.BytesIO):
+        return len(value.getbuffer())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class _Artifact:
+    """1つの生成物（メモリ上にあるか、ディスクに退避済みか）"""
+
+    def __init__(self, value: Any, size: int):
+        self.value = value
+        self.size = size
+        self.path: Optional[str] = None
+        self.in_memory = True  # 値がNoneの生成物もあるので、退避したかは別に持つ
+
+
+class ArtifactRegistry:
+    """全セッションの生成物をまとめて管理し、メモリ予算を超えた分をディスクへ退避する
+
+    生成物は最後に使われた順に並べ、予算を超えたら古いものから退避する。
+    退避したものは次に読み出されたときにディスクから読み戻す。
+    退避先はこのプロセスだけが読み書きできるディレクトリ（mkdtempで作成）で、終了時に削除する。
+    """
+
+    def __init__(self, session_budget: int, global_budget: int, spill_parent_dir: Optional[str] = None,
+                 idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.idle_timeout = idle_timeout
+        self.spill_dir = tempfile.mkdtemp(prefix='math_creator_', dir=spill_parent_dir)
+        atexit.register(shutil.rmtree, self.spill_dir, True)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], _Artifact]" = OrderedDict()  # 古い順
+        self._memory_bytes = 0
+        self._session_bytes: Dict[str, int] = defaultdict(int)
+        self._last_seen: Dict[str, float] = {}
+        self._last_sweep = time.time()
+
+    def put(self, session_id: str, name: str, value: Any) -> None:
+        """生成物を保存（同じ名前のものは置き換える）"""
+        key = (session_id, name)
+        size = estimate_size(value)
+        with self._lock:
+            self._touch(session_id)
+            self._discard(key)
+            self._entries[key] = _Artifact(value, size)
+            self._memory_bytes += size
+            self._session_bytes[session_id] += size
+            self._enforce_budgets(session_id, keep=key)
+
+    def get(self, session_id: str, name: str, default: Any = None) -> Any:
+        """生成物を取り出す（退避済みならディスクから読み戻す）"""
+        key = (session_id, name)
+        with self._lock:
+            self._touch(session_id)
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            if not entry.in_memory:
+                try:
+                    with open(entry.path, 'rb') as f:
+                        entry.value = pickle.load(f)
+                    entry.in_memory = True
+                except (OSError, pickle.UnpicklingError, EOFError):
+                    # 退避ファイルが消えている場合は無かったものとして扱う
+                    self._discard(key)
+                    return default
+                self._memory_bytes += entry.size
+                self._session_bytes[session_id] += entry.size
+                self._enforce_budgets(session_id, keep=key)
+            return entry.value
+
+    def contains(self, session_id: str, name: str) -> bool:
+        with self._lock:
+            return (session_id, name) in self._entries
+
+    def delete(self, session_id: str, name: str) -> None:
+        with self._lock:
+            self._discard((session_id, name))
+
+    def _touch(self, session_id: str) -> None:
+        """セッションの最終操作時刻を更新し、ときどき終了したセッションの生成物を破棄する"""
+        now = time.time()
+        self._last_seen[session_id] = now
+        if now - self._last_sweep > SESSION_SWEEP_INTERVAL:
+            self._last_sweep = now
+            self._evict_idle_sessions(now)
+
+    def _evict_idle_sessions(self, now: float) -> None:
+        idle = {session_id for session_id, seen in self._last_seen.items() if now - seen > self.idle_timeout}
+        if not idle:
+            return
+        for key in [key for key in self._entries if key[0] in idle]:
+            self._discard(key)
+        for session_id in idle:
+            del self._last_seen[session_id]
+            self._session_bytes.pop(session_id, None)
+
+    def _discard(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry.in_memory:
+            self._memory_bytes -= entry.size
+            self._session_bytes[key[0]] -= entry.size
+        if entry.path is not None and os.path.exists(entry.path):
+            os.remove(entry.path)
+
+    def _enforce_budgets(self, session_id: str, keep: Tuple[str, str]) -> None:
+        """セッション予算・全体予算を超えた分を古いものから退避する"""
+        for key, entry in list(self._entries.items()):
+            if self._session_bytes[session_id] <= self.session_budget:
+                break
+            if key[0] == session_id and key != keep and entry.in_memory:
+                self._spill(key, entry)
+
+        for key, entry in list(self._entries.items()):
+            if self._memory_bytes <= self.global_budget:
+                break
+            if key != keep and entry.in_memory:
+                self._spill(key, entry)
+
+    def _spill(self, key: Tuple[str, str], entry: _Artifact) -> None:
+        """生成物をディスクへ書き出してメモリから外す"""
+        if entry.path is None:
+            entry.path = os.path.join(self.spill_dir, f"{key[0]}_{key[1]}.pkl")
+        with open(entry.path, 'wb') as f:
+            pickle.dump(entry.value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        entry.value = None
+        entry.in_memory = False
+        self._memory_bytes -= entry.size
+        self._session_bytes[key[0]] -= entry.size
+
+
+@st.cache_resource
+def get_artifact_registry() -> ArtifactRegistry:
+    """全セッション共通の生成物レジストリ"""
+    return ArtifactRegistry(SESSION_MEMORY_BUDGET, GLOBAL_MEMORY_BUDGET, SPILL_PARENT_DIR)
+
+
+class SessionStore:
+    """現在のセッションの生成物（問題・解答・PDF）を読み書きする窓口"""
+
+    def __init__(self, registry: ArtifactRegistry, session_id: str):
+        self.registry = registry
+        self.session_id = session_id
+
+    def put(self, name: str, value: Any) -> None:
+        self.registry.put(self.session_id, name, value)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.registry.get(self.session_id, name, default)
+
+    def delete(self, name: str) -> None:
+        self.registry.delete(self.session_id, name)
+
+    def __contains__(self, name: str) -> bool:
+        return self.registry.contains(self.session_id, name)
+
+
+def get_session_store() -> SessionStore:
+    """現在のセッション用のストアを取得"""
+    if 'artifact_session_id' not in st.session_state:
+        st.session_state.artifact_session_id = uuid.uuid4().hex
+    return SessionStore(get_artifact_registry(), st.session_state.artifact_session_id)
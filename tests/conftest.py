@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+# テストはリポジトリ直下のモジュールをそのまま読み込む
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SessionState(dict):
+    """Streamlitの外で使う st.session_state の代わり（属性でも読み書きできる辞書）"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+@pytest.fixture
+def formatter(monkeypatch):
+    """描画用に固定したスタイルとフォントを持つ OutputFormatter"""
+    from output_formatter import OutputFormatter
+
+    monkeypatch.setattr(st, 'session_state', SessionState())
+    formatter = OutputFormatter()
+    formatter.prepare_fonts()
+    return formatter.snapshot()
@@ -0,0 +1,77 @@
+import zipfile
+
+import pytest
+from reportlab import rl_config
+
+import bundle
+from main import MathProblemGenerator
+
+BASE_SEED = 42
+STUDENT_COUNT = 3
+
+
+@pytest.fixture
+def settings():
+    return bundle.bundle_settings(MathProblemGenerator.default_settings())
+
+
+@pytest.fixture(autouse=True)
+def invariant_pdfs(monkeypatch):
+    """作成日時やIDを固定して、同じ内容のPDFが同じバイト列になるようにする"""
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    # 別プロセスには上の設定が届かないので、ZIPも同じプロセスで描画する
+    monkeypatch.setattr(bundle, 'BUNDLE_WORKER_COUNT', 1)
+
+
+def zip_entries(buffer):
+    with zipfile.ZipFile(buffer) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def test_variants_depend_only_on_seed_and_student(settings):
+    first = bundle.generate_variant(settings, BASE_SEED, 1)
+    assert bundle.generate_variant(settings, BASE_SEED, 1) == first
+    assert bundle.generate_variant(settings, BASE_SEED, 2) != first
+    assert bundle.generate_variant(settings, BASE_SEED + 1, 1) != first
+    assert bundle.variant_seed(BASE_SEED, 2) == "42:2"
+
+
+def test_pdf_bundle_is_deterministic(formatter, settings):
+    first = bundle.render_bundle_pdf(formatter, settings, STUDENT_COUNT, BASE_SEED).getvalue()
+    assert first.startswith(b'%PDF')
+    assert bundle.render_bundle_pdf(formatter, settings, STUDENT_COUNT, BASE_SEED).getvalue() == first
+    assert bundle.render_bundle_pdf(formatter, settings, STUDENT_COUNT, BASE_SEED + 1).getvalue() != first
+
+
+def test_zip_bundle_is_deterministic(formatter, settings):
+    progress = []
+    first = zip_entries(bundle.render_bundle_zip(formatter, settings, STUDENT_COUNT, BASE_SEED, progress.append))
+    assert progress == [1, 2, 3]
+    assert sorted(first) == [
+        "001_計算プリント（1番）.pdf", "002_計算プリント（2番）.pdf", "003_計算プリント（3番）.pdf",
+        bundle.ANSWER_KEY_FILE_NAME,
+    ]
+    assert zip_entries(bundle.render_bundle_zip(formatter, settings, STUDENT_COUNT, BASE_SEED)) == first
+
+    other = zip_entries(bundle.render_bundle_zip(formatter, settings, STUDENT_COUNT, BASE_SEED + 1))
+    assert all(other[name] != first[name] for name in first)
+
+
+def test_zip_student_pdf_matches_single_variant(formatter, settings):
+    entries = zip_entries(bundle.render_bundle_zip(formatter, settings, 2, BASE_SEED))
+    pdf_data, pairs = bundle._render_student(formatter, settings, BASE_SEED, 2)
+    assert entries["002_計算プリント（2番）.pdf"] == pdf_data
+    assert pairs == bundle.answer_pairs(bundle.generate_variant(settings, BASE_SEED, 2))
+
+
+def test_coverage_bundle_estimates_pages_from_first_variant(formatter):
+    settings = MathProblemGenerator.default_settings()
+    settings.update(problem_type=4, generation_mode=2, mul_coverage=2)
+    job = bundle.submit_bundle_job(formatter, settings, STUDENT_COUNT, BASE_SEED, bundle.BUNDLE_PDF)
+    job.result()
+
+    row_count = len(bundle.generate_variant(bundle.bundle_settings(settings), BASE_SEED, 1))
+    assert row_count == 81
+    expected = formatter.estimate_pages(row_count, True, bundle.bundle_settings(settings)) * STUDENT_COUNT
+    assert job.total_pages == expected
+    assert job.pages_rendered == job.total_pages
@@ -0,0 +1,129 @@
+from collections import Counter
+from itertools import product
+
+import numpy as np
+import pytest
+
+from candidates import (
+    BALANCE_ANSWER, BALANCE_FIRST_OPERAND, CandidateBlock, balanced_order, enumerate_operands, operand_ranges,
+    tighten_ranges,
+)
+from main import MathProblemGenerator
+
+
+def generator_for(**overrides):
+    settings = MathProblemGenerator.default_settings()
+    settings.update(overrides)
+    return MathProblemGenerator(settings)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_balanced_order_keeps_strata_even(seed):
+    sizes = {0: 10, 1: 3, 2: 5, 3: 1}
+    strata = np.array([stratum for stratum, size in sizes.items() for _ in range(size)], dtype=np.float64)
+    operators = np.zeros(len(strata), dtype=np.uint8)
+    order = balanced_order(operators, strata, np.random.default_rng(seed))
+    assert sorted(order.tolist()) == list(range(len(strata)))
+
+    # 先頭から何問取っても、残りのある層どうしの数の差は1以内
+    for k in range(1, len(order) + 1):
+        taken = Counter(strata[order[:k]].tolist())
+        remaining = [taken[stratum] for stratum, size in sizes.items() if taken[stratum] < size]
+        if remaining:
+            assert max(remaining) - min(remaining) <= 1
+
+
+def test_balanced_order_separates_operators():
+    operators = np.array([1, 1, 1, 1, 2, 2])
+    strata = np.zeros(6)
+    order = balanced_order(operators, strata, np.random.default_rng(0))
+    assert sorted(operators[order[:2]].tolist()) == [1, 2]
+
+
+def test_balanced_answers_in_one_pass():
+    generator = generator_for(question_count=10, balance_mode=BALANCE_ANSWER)
+    rows = generator.generate_problem_rows(seed='balance')
+    assert sorted(row['せいかい'] for row in rows) == list(range(1, 11))
+
+
+def test_balanced_first_operand():
+    generator = generator_for(problem_type=4, question_count=27, balance_mode=BALANCE_FIRST_OPERAND)
+    generator.generate_problem_rows(seed='balance')
+    firsts = Counter(nums[0] for nums, _ in generator.generated_terms)
+    assert firsts == {n: 3 for n in range(1, 10)}
+
+
+def valid_combinations(settings, operator, ranges):
+    """範囲内の全組み合わせのうち、条件を満たすもの（総当たり）"""
+    combinations = np.array(list(product(*[range(low, high + 1) for low, high in ranges])))
+    block = CandidateBlock(settings, operator, combinations, adjust_division=False)
+    return {tuple(row) for row in block.operands[block.valid].tolist()}
+
+
+def three_term_settings(**overrides):
+    settings = MathProblemGenerator.default_settings()
+    settings.update(term_count=3, **overrides)
+    return settings
+
+
+@pytest.mark.parametrize('operator, overrides, expected', [
+    ("+", {'add_min3': 5, 'add_max3': 10}, [(1, 5), (0, 4), (5, 9)]),
+    ("-", {'sub_max1': 10, 'sub_min3': 4, 'sub_max3': 6}, [(6, 10), (1, 5), (4, 6)]),
+    ("*", {'mul_min1': 1, 'mul_max1': 50, 'mul_min2': 5, 'mul_min3': 5}, [(1, 4), (5, 9), (5, 9)]),
+    ("/", {}, [(1, 81), (1, 9), (1, 9)]),
+])
+def test_tighten_ranges(operator, overrides, expected):
+    assert tighten_ranges(three_term_settings(**overrides), operator) == expected
+
+
+@pytest.mark.parametrize('operator, overrides', [
+    ("+", {'add_limit': 2, 'add_max1': 3, 'add_max2': 3, 'add_max3': 3}),
+    ("-", {'sub_max1': 5, 'sub_min2': 3, 'sub_min3': 3}),
+    ("*", {'mul_min1': 5, 'mul_min2': 5, 'mul_min3': 5}),
+])
+def test_tighten_ranges_detects_impossible_settings(operator, overrides):
+    settings = three_term_settings(**overrides)
+    assert tighten_ranges(settings, operator) is None
+    assert valid_combinations(settings, operator, operand_ranges(settings, operator)) == set()
+    assert len(enumerate_operands(settings, operator)) == 0
+
+
+@pytest.mark.parametrize('operator, overrides', [
+    ("+", {'add_min3': 2, 'add_max3': 6}),
+    ("+", {'add_limit': 2, 'add_max1': 12, 'add_max2': 8, 'carry_mode': 3}),
+    ("-", {'sub_max1': 20, 'sub_min2': 2, 'sub_max2': 6, 'sub_min3': 0, 'sub_max3': 3}),
+    ("-", {'sub_limit': 2, 'value_limit_enabled': 2, 'value_min': -4, 'value_max': 2}),
+    ("*", {'mul_max1': 12, 'mul_min3': 2, 'mul_max3': 3}),
+])
+def test_enumeration_matches_brute_force(operator, overrides):
+    settings = three_term_settings(**overrides)
+    # 範囲を狭めても、条件を満たす組み合わせは1つも失われない
+    brute_force = valid_combinations(settings, operator, operand_ranges(settings, operator))
+    assert valid_combinations(settings, operator, tighten_ranges(settings, operator)) == brute_force
+
+    # 途中までの組み合わせで除いても、条件を満たす組み合わせはすべて列挙される
+    combinations = enumerate_operands(settings, operator)
+    assert len({tuple(row) for row in combinations.tolist()}) == len(combinations)
+    block = CandidateBlock(settings, operator, combinations, adjust_division=False)
+    assert {tuple(row) for row in block.operands[block.valid].tolist()} == brute_force
+    for column, (low, high) in enumerate(operand_ranges(settings, operator)):
+        assert combinations[:, column].min() >= low and combinations[:, column].max() <= high
+
+
+def test_enumeration_limit_thins_prefixes():
+    settings = three_term_settings(add_limit=3, add_max1=99, add_max2=99, add_max3=99)
+    combinations = enumerate_operands(settings, "+", limit=5000, rng=np.random.default_rng(0))
+    assert 0 < len(combinations) <= 5000
+    assert len({tuple(row) for row in combinations.tolist()}) == len(combinations)
+
+
+def test_coverage_mode_uses_each_term_range():
+    generator = generator_for(
+        term_count=3, generation_mode=2, add_coverage=2, question_count=1000,
+        add_min1=1, add_max1=4, add_min2=0, add_max2=3, add_min3=2, add_max3=5,
+    )
+    generator.generate_problem_rows(seed='coverage')
+    terms = {tuple(nums) for nums, _ in generator.generated_terms}
+    expected = valid_combinations(generator.settings, "+", operand_ranges(generator.settings, "+"))
+    assert terms == expected
+    assert len(generator.generated_terms) == len(expected)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from candidates import CandidateBlock
+from difficulty import (
+    CARRY_ANY, CARRY_NONE, CARRY_REQUIRED, borrow_counts, carry_counts, carry_mask, difficulty_features,
+    difficulty_scores, multiplication_steps, remainder_flags,
+)
+from main import MathProblemGenerator
+
+
+def counts(function, *rows):
+    return function(np.array(rows)).tolist()
+
+
+def test_carry_counts():
+    assert counts(carry_counts, [3, 5], [7, 5], [95, 5], [999, 1], [45, 55]) == [0, 1, 2, 3, 2]
+    # 3項以上は同じ桁をまとめて足す
+    assert counts(carry_counts, [1, 2, 3], [4, 4, 4], [9, 9, 9]) == [0, 1, 1]
+
+
+def test_borrow_counts():
+    assert counts(borrow_counts, [8, 5], [12, 5], [100, 1], [52, 27]) == [0, 1, 2, 1]
+    assert counts(borrow_counts, [20, 3, 4]) == [1]
+    # 答えが負になる問題は数えない
+    assert counts(borrow_counts, [3, 5]) == [0]
+
+
+def test_multiplication_steps_and_remainders():
+    assert counts(multiplication_steps, [3, 4], [12, 4], [12, 34], [100, 9]) == [1, 2, 4, 3]
+    assert counts(remainder_flags, [8, 2, 1], [9, 2, 1], [24, 4, 3], [25, 5, 2]) == [False, True, False, True]
+
+
+def test_features_only_for_their_operator():
+    operands = np.array([[95, 5], [12, 34]])
+    features = difficulty_features(operands, "+")
+    assert features['carries'].tolist() == [2, 0]
+    assert features['borrows'].tolist() == [0, 0]
+    assert features['mul_steps'].tolist() == [0, 0]
+    assert difficulty_scores(features).tolist() == [2, 0]
+    assert difficulty_scores(difficulty_features(operands, "*")).tolist() == [1, 3]
+
+
+@pytest.mark.parametrize('carry_mode, expected', [
+    (CARRY_ANY, [True, True, True]),
+    (CARRY_NONE, [True, False, False]),
+    (CARRY_REQUIRED, [False, True, True]),
+])
+def test_carry_mask(carry_mode, expected):
+    features = difficulty_features(np.array([[3, 5], [7, 5], [95, 5]]), "+")
+    assert carry_mask(features, "+", carry_mode).tolist() == expected
+    assert carry_mask(features, "*", carry_mode).tolist() == [True] * 3
+
+
+def division_settings(**overrides):
+    settings = MathProblemGenerator.default_settings()
+    settings.update(problem_type=5, div_limit=2, term_count=3, **overrides)
+    return settings
+
+
+def test_multi_term_division_with_remainder():
+    operands = np.array([[24, 4, 3], [25, 5, 2], [25, 2, 5], [7, 7, 1]])
+    block = CandidateBlock(division_settings(), "/", operands, adjust_division=False)
+    # 余りは最後の割り算でだけ出せる（途中で割り切れない行は候補にしない）
+    assert block.computable.tolist() == [True, True, False, True]
+    assert block.valid.tolist() == [True, True, False, True]
+    assert [block.answer(i) for i in (0, 1, 3)] == [2, "2 余り 1", 1]
+
+
+def test_multi_term_division_rules_use_remainder_mask():
+    settings = division_settings(custom_rules="remainder > 0")
+    block = CandidateBlock(settings, "/", np.array([[24, 4, 3], [25, 5, 2], [25, 2, 5]]), adjust_division=False)
+    assert block.valid.tolist() == [False, True, False]
+
+
+def test_multi_term_division_generates_problems():
+    generator = MathProblemGenerator(division_settings(question_count=20, div_max1=200))
+    rows = generator.generate_problem_rows(seed='division')
+    assert len(rows) == 20
+    for nums, operator in generator.generated_terms:
+        assert len(nums) == 3 and nums[0] % nums[1] == 0
+        block = CandidateBlock(generator.settings, operator, [nums], adjust_division=False)
+        assert block.valid.tolist() == [True]
+    answers = {row['せいかい'] for row in rows}
+    assert any(isinstance(answer, str) and " 余り " in answer for answer in answers)
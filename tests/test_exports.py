@@ -0,0 +1,162 @@
+import io
+import json
+import xml.etree.ElementTree as ET
+import zipfile
+
+import pandas as pd
+import pytest
+
+from exports import EXPORT_CHUNK_ROWS, export_tables, write_csv, write_export, write_jsonl, write_xlsx
+from main import MathProblemGenerator
+
+SHEET_NS = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+CONTENT_TYPES_NS = {'ct': 'http://schemas.openxmlformats.org/package/2006/content-types'}
+
+
+def sample_tables():
+    problems_df = pd.DataFrame({
+        'ばんごう': [1, 2, 3, 4],
+        'もんだい': ['3 + 5', '7 ÷ 2', '1 < 2 & 3 > 2', '  先頭と末尾の空白  '],
+        'こたえ': ['', '', '', ''],
+        'せいかい': [8, '3 余り 1', 2.5, -4],
+    })
+    answers_df = pd.DataFrame({
+        'もんだいばんごう': [1, 2, 3, 4],
+        'せいかい': [8, '3 余り 1', 2.5, -4],
+    })
+    return problems_df, answers_df
+
+
+def read_sheet(archive, path):
+    """シートのXMLを行ごとの値のリストにする（数値のセルは数値、文字列のセルは文字列）"""
+    root = ET.fromstring(archive.read(path))
+    rows = []
+    for row in root.find('s:sheetData', SHEET_NS).findall('s:row', SHEET_NS):
+        values = []
+        for cell in row.findall('s:c', SHEET_NS):
+            if cell.get('t') == 'inlineStr':
+                values.append(cell.find('s:is/s:t', SHEET_NS).text or '')
+            else:
+                number = float(cell.find('s:v', SHEET_NS).text)
+                values.append(int(number) if number.is_integer() else number)
+        rows.append(values)
+    return rows
+
+
+def xlsx_archive(tables):
+    output = io.BytesIO()
+    write_xlsx(tables, output)
+    output.seek(0)
+    return zipfile.ZipFile(output)
+
+
+def test_xlsx_package_parts():
+    archive = xlsx_archive(export_tables(*sample_tables()))
+    assert archive.testzip() is None
+    assert set(archive.namelist()) == {
+        '[Content_Types].xml', '_rels/.rels', 'xl/workbook.xml', 'xl/_rels/workbook.xml.rels',
+        'xl/worksheets/sheet1.xml', 'xl/worksheets/sheet2.xml',
+    }
+
+    content_types = ET.fromstring(archive.read('[Content_Types].xml'))
+    overrides = {
+        override.get('PartName'): override.get('ContentType')
+        for override in content_types.findall('ct:Override', CONTENT_TYPES_NS)
+    }
+    assert overrides['/xl/workbook.xml'].endswith('spreadsheetml.sheet.main+xml')
+    for i in (1, 2):
+        assert overrides[f'/xl/worksheets/sheet{i}.xml'].endswith('spreadsheetml.worksheet+xml')
+    defaults = {default.get('Extension') for default in content_types.findall('ct:Default', CONTENT_TYPES_NS)}
+    assert defaults == {'rels', 'xml'}
+
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    assert [sheet.get('name') for sheet in workbook.iter(f"{{{SHEET_NS['s']}}}sheet")] == ['もんだい', '解答']
+    relationships = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    assert sorted(relationship.get('Target') for relationship in relationships) == [
+        'worksheets/sheet1.xml', 'worksheets/sheet2.xml'
+    ]
+
+
+def test_xlsx_cell_values_round_trip():
+    problems_df, answers_df = sample_tables()
+    archive = xlsx_archive(export_tables(problems_df, answers_df))
+
+    problems = read_sheet(archive, 'xl/worksheets/sheet1.xml')
+    # 生徒が記入する空の答え欄は書き出さない
+    assert problems[0] == ['ばんごう', 'もんだい', 'せいかい']
+    assert problems[1:] == [
+        [1, '3 + 5', 8],
+        [2, '7 ÷ 2', '3 余り 1'],
+        [3, '1 < 2 & 3 > 2', 2.5],
+        [4, '  先頭と末尾の空白  ', -4],
+    ]
+    answers = read_sheet(archive, 'xl/worksheets/sheet2.xml')
+    assert answers == [['もんだいばんごう', 'せいかい']] + answers_df.values.tolist()
+
+
+def test_xlsx_spans_several_chunks():
+    df = pd.DataFrame({'ばんごう': range(1, EXPORT_CHUNK_ROWS * 2 + 2), 'もんだい': 'x'})
+    archive = xlsx_archive([("もんだい", df)])
+    rows = read_sheet(archive, 'xl/worksheets/sheet1.xml')
+    assert len(rows) == len(df) + 1
+    assert [row[0] for row in rows[1:]] == df['ばんごう'].tolist()
+
+
+def test_csv_has_bom_and_single_header():
+    df = pd.DataFrame({'ばんごう': range(1, EXPORT_CHUNK_ROWS + 3), 'せいかい': '3 余り 1'})
+    output = io.BytesIO()
+    write_csv(df, output)
+    data = output.getvalue()
+    assert data.startswith(b'\xef\xbb\xbf')
+
+    read_back = pd.read_csv(io.BytesIO(data), encoding='utf-8-sig', dtype=str)
+    assert read_back.columns.tolist() == ['ばんごう', 'せいかい']
+    assert len(read_back) == len(df)
+    assert read_back['ばんごう'].tolist() == [str(number) for number in df['ばんごう']]
+
+
+def test_empty_csv_writes_header_only():
+    output = io.BytesIO()
+    write_csv(pd.DataFrame(columns=['ばんごう', 'せいかい']), output)
+    assert output.getvalue().decode('utf-8-sig').splitlines() == ['ばんごう,せいかい']
+
+
+def test_jsonl_one_record_per_line():
+    problems_df, _ = sample_tables()
+    output = io.BytesIO()
+    write_jsonl(problems_df, output)
+    text = output.getvalue().decode('utf-8')
+    assert '余り' in text  # 日本語はエスケープしない
+    lines = text.splitlines()
+    assert len(lines) == len(problems_df)
+    assert [json.loads(line) for line in lines] == problems_df.to_dict(orient='records')
+
+
+@pytest.mark.parametrize('answers_only', [False, True])
+def test_write_export_csv_selects_table(answers_only):
+    problems_df, answers_df = sample_tables()
+    output = io.BytesIO()
+    write_export('csv', problems_df, answers_df, output, answers_only=answers_only)
+    header = output.getvalue().decode('utf-8-sig').splitlines()[0]
+    assert header == ('もんだいばんごう,せいかい' if answers_only else 'ばんごう,もんだい,せいかい')
+
+
+def test_write_export_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        write_export('pdf', *sample_tables(), io.BytesIO())
+
+
+def test_generated_problems_round_trip():
+    settings = MathProblemGenerator.default_settings()
+    settings.update(problem_type=5, div_limit=2)
+    generator = MathProblemGenerator(settings)
+    problems_df, answers_df = generator.problem_dataframes(generator.generate_problem_rows(seed='export'))
+
+    output = io.BytesIO()
+    write_export('jsonl', problems_df, answers_df, output)
+    records = [json.loads(line) for line in output.getvalue().decode('utf-8').splitlines()]
+    assert [record['せいかい'] for record in records] == problems_df['せいかい'].tolist()
+
+    archive = xlsx_archive(export_tables(problems_df, answers_df))
+    answers = read_sheet(archive, 'xl/worksheets/sheet2.xml')
+    assert answers[1:] == answers_df.values.tolist()
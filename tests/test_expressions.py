@@ -0,0 +1,101 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+import expressions
+from expressions import ExpressionEngine, ExpressionShape, evaluate_expression, format_expression
+from main import MathProblemGenerator
+
+
+def expression_settings(**overrides):
+    settings = MathProblemGenerator.default_settings()
+    settings.update(problem_type=MathProblemGenerator.EXPRESSION_TYPE, term_count=3)
+    settings.update(overrides)
+    return settings
+
+
+def brute_force_answers(operators, factors, low, high):
+    """すべての数の並びを計算して、答えの範囲に入る答えの集合を求める"""
+    answers = set()
+    for nums in product(factors.tolist(), repeat=len(operators) + 1):
+        answer = evaluate_expression(list(nums), list(operators))
+        if answer is not None and low <= answer <= high:
+            answers.add(answer)
+    return answers
+
+
+def test_format_and_evaluate_with_precedence():
+    assert format_expression([12, 3, 2, 4], ["-", "*", "+"]) == "12 - 3 × 2 + 4"
+    assert evaluate_expression([12, 3, 2, 4], ["-", "*", "+"]) == 10
+    assert evaluate_expression([8, 4, 2], ["/", "*"]) == 4
+    assert evaluate_expression([2, 3, 4], ["+", "*"]) == 14
+    # 割り切れない・途中や答えが負になる式は作らない
+    assert evaluate_expression([7, 2], ["/"]) is None
+    assert evaluate_expression([5, 0], ["/"]) is None
+    assert evaluate_expression([3, 5, 4], ["-", "+"]) is None
+
+
+@pytest.mark.parametrize('operators', [
+    ("+", "*"), ("-", "*"), ("*", "-"), ("/", "+"), ("-", "/"), ("*", "/"), ("-", "-"), ("*", "*", "-"),
+])
+@pytest.mark.parametrize('low, high', [(0, 20), (15, 15), (40, 60), (200, 300)])
+def test_feasibility_matches_brute_force(operators, low, high):
+    factors = np.arange(0, 7)
+    shape = ExpressionShape(operators, factors, low, high)
+    expected = brute_force_answers(operators, factors, low, high)
+    assert shape.feasible == bool(expected)
+
+    if shape.feasible:
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            nums, answer = shape.sample(rng)
+            assert all(0 <= num <= 6 for num in nums)
+            # 作った式は必ず条件を満たす（選び直しはしない）
+            assert evaluate_expression(nums, list(operators)) == answer
+            assert answer in expected
+
+
+def test_infeasible_settings_give_no_problems():
+    engine = ExpressionEngine(1, 2, 100, 200, ("+", "-", "*"))
+    assert engine.sample(2, np.random.default_rng(0)) is None
+
+    generator = MathProblemGenerator(expression_settings(expr_max=2, expr_answer_min=100, expr_answer_max=200))
+    assert generator.generate_problem_rows(seed='none') == []
+
+
+def test_random_operators_mix_both_kinds():
+    engine = ExpressionEngine(1, 10, 0, 50, expressions.EXPR_OPERATORS[2])
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        operators = engine.random_operators(4, rng)
+        assert len(operators) == 3
+        assert any(op in expressions.ADDITIVE for op in operators)
+        assert any(op not in expressions.ADDITIVE for op in operators)
+
+
+def test_generated_problems_are_correct_and_unique():
+    generator = MathProblemGenerator(expression_settings(question_count=40))
+    rows = generator.generate_problem_rows(seed='expr')
+    assert len(rows) == 40
+    assert len({row['もんだい'] for row in rows}) == 40
+    for row in rows:
+        assert 0 <= row['せいかい'] <= 50
+
+
+def test_duplicate_retries_are_capped(monkeypatch):
+    calls = []
+    sample = ExpressionEngine.sample
+
+    def counting_sample(self, *args, **kwargs):
+        calls.append(1)
+        return sample(self, *args, **kwargs)
+
+    monkeypatch.setattr(ExpressionEngine, 'sample', counting_sample)
+    # 1と2だけの2項の式は数種類しかないので、問題数に届かないまま打ち切る
+    settings = expression_settings(term_count=2, expr_min=1, expr_max=2, question_count=30)
+    generator = MathProblemGenerator(settings)
+    rows = generator.generate_problem_rows(seed='few')
+    assert 0 < len(rows) < 30
+    assert len({row['もんだい'] for row in rows}) == len(rows)
+    assert len(calls) == 30 * 20
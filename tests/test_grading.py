@@ -0,0 +1,193 @@
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+from reportlab import rl_config
+
+import bundle
+import grading
+from grading import GradingError, grade_submissions, parse_answers, read_submissions
+from main import MathProblemGenerator
+
+BASE_SEED = 42
+
+
+def parsed(*values):
+    quotients, remainders, readable = parse_answers(pd.Series(values))
+    return [(q, r) if ok else None for q, r, ok in zip(quotients.tolist(), remainders.tolist(), readable.tolist())]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("12", (12, 0)),
+    ("３．５", (3.5, 0)),
+    ("１２", (12, 0)),
+    ("7余り2", (7, 2)),
+    ("7 余り 2", (7, 2)),
+    ("７あまり２", (7, 2)),
+    ("7r2", (7, 2)),
+    ("7R2", (7, 2)),
+    ("7...2", (7, 2)),
+    ("７…２", (7, 2)),
+    ("-3", (-3, 0)),
+    ("−3", (-3, 0)),
+    ("－3", (-3, 0)),
+])
+def test_parse_answers_accepts_written_forms(text, expected):
+    assert parsed(text) == [expected]
+
+
+@pytest.mark.parametrize('text', ["", "abc", "7余り", "余り2", "7..2", "1/2", "3-"])
+def test_parse_answers_rejects_unreadable_text(text):
+    assert parsed(text) == [None]
+
+
+def variant_settings(**overrides):
+    settings = MathProblemGenerator.default_settings()
+    settings.update(overrides)
+    return settings
+
+
+def submission_rows(settings, students, answer=lambda row: str(row['せいかい'])):
+    """まとめて作成したプリントの正解（または answer で変えた答え）を書いた提出の表"""
+    rows = []
+    for student in students:
+        record = {'番号': str(student), '名前': f"生徒{student}"}
+        for row in bundle.generate_variant(bundle.bundle_settings(settings), BASE_SEED, student):
+            record[str(row['ばんごう'])] = answer(row)
+        rows.append(record)
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize('overrides', [{}, {'problem_type': 5, 'div_limit': 2}, {'problem_type': 4}])
+def test_generated_answer_key_grades_all_correct(overrides):
+    settings = variant_settings(**overrides)
+    submissions = submission_rows(settings, range(1, 6))
+    student_stats, problem_stats, details = grade_submissions(settings, BASE_SEED, submissions)
+
+    assert (student_stats['正解数'] == student_stats['問題数']).all()
+    assert (student_stats['正答率(%)'] == 100.0).all()
+    assert (student_stats['無回答'] == 0).all()
+    assert (details['判定'] == '○').all()
+    assert len(details) == student_stats['問題数'].sum()
+
+
+def test_remainder_answers_in_other_forms_are_correct():
+    settings = variant_settings(problem_type=5, div_limit=2)
+    forms = ['余り', 'あまり', 'r', '...']
+
+    def rewrite(row):
+        answer = str(row['せいかい'])
+        form = forms[row['ばんごう'] % len(forms)]
+        answer = answer.replace(' 余り ', form)
+        return answer.translate(str.maketrans('0123456789', '０１２３４５６７８９'))
+
+    submissions = submission_rows(settings, [1, 2], rewrite)
+    student_stats, _, _ = grade_submissions(settings, BASE_SEED, submissions)
+    assert (student_stats['正解数'] == student_stats['問題数']).all()
+
+
+def test_wrong_and_blank_answers_are_counted():
+    settings = variant_settings()
+    submissions = submission_rows(settings, [1])
+    submissions['1'] = ''
+    submissions['2'] = '-1'
+    student_stats, problem_stats, details = grade_submissions(settings, BASE_SEED, submissions)
+
+    count = student_stats.loc[0, '問題数']
+    assert student_stats.loc[0, '正解数'] == count - 2
+    assert student_stats.loc[0, '無回答'] == 1
+    assert problem_stats.loc[0, '無回答'] == 1
+    assert details.loc[details['ばんごう'].isin([1, 2]), '判定'].tolist() == ['×', '×']
+
+
+def test_cp932_csv_round_trip():
+    settings = variant_settings(problem_type=5, div_limit=2)
+    submissions = submission_rows(settings, [3, 4])
+    data = submissions.to_csv(index=False).encode('cp932')
+    with pytest.raises(UnicodeDecodeError):
+        data.decode('utf-8')
+
+    uploaded = read_submissions(data)
+    assert uploaded['名前'].tolist() == ['生徒3', '生徒4']
+    student_stats, _, _ = grade_submissions(settings, BASE_SEED, uploaded)
+    assert student_stats['番号'].tolist() == [3, 4]
+    assert (student_stats['正解数'] == student_stats['問題数']).all()
+
+
+def test_utf8_csv_with_bom_is_read():
+    uploaded = read_submissions("番号,1\n1,７あまり２\n".encode('utf-8-sig'))
+    assert uploaded.columns.tolist() == ['番号', '1']
+    assert parsed(*uploaded['1']) == [(7, 2)]
+
+
+def test_unreadable_encoding_is_grading_error():
+    with pytest.raises(GradingError):
+        read_submissions(b'\x81\x00\xff\xfe,1\n')
+
+
+def test_invalid_student_numbers_are_rejected():
+    submissions = pd.DataFrame({'番号': ['1', 'x'], '1': ['3', '4']})
+    with pytest.raises(GradingError):
+        grade_submissions(variant_settings(), BASE_SEED, submissions)
+
+
+def test_answers_without_numbered_columns_are_taken_in_order():
+    settings = variant_settings()
+    numbered = submission_rows(settings, [1])
+    unnamed = numbered.rename(columns={column: f"問{column}" for column in numbered.columns if column.isdigit()})
+    student_stats, _, _ = grade_submissions(settings, BASE_SEED, unnamed.drop(columns='名前'))
+    assert student_stats.loc[0, '正解数'] == student_stats.loc[0, '問題数']
+    assert np.array_equal(student_stats.columns, ['番号', '正解数', '問題数', '無回答', '正答率(%)'])
+
+
+@pytest.fixture
+def fresh_answer_keys(monkeypatch):
+    """採点のたびに正解を作り直す（キャッシュを空にする）"""
+    monkeypatch.setattr(grading, 'get_answer_key_cache', lambda: grading.AnswerKeyCache())
+
+
+def test_grading_a_rendered_zip_bundle(formatter, monkeypatch, fresh_answer_keys):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    monkeypatch.setattr(bundle, 'BUNDLE_WORKER_COUNT', 1)
+    settings = bundle.bundle_settings(variant_settings(problem_type=5, div_limit=2))
+    answer_keys = []
+    create_answer_key_pdf = formatter.create_answer_key_pdf
+
+    def record_answer_keys(keys, output):
+        answer_keys.extend(keys)
+        create_answer_key_pdf(keys, output)
+
+    monkeypatch.setattr(formatter, 'create_answer_key_pdf', record_answer_keys)
+    with zipfile.ZipFile(bundle.render_bundle_zip(formatter, settings, 4, BASE_SEED)) as archive:
+        answer_key_pdf = archive.read(bundle.ANSWER_KEY_FILE_NAME)
+
+    # 解答のPDFに書いた正解をそのまま提出すると全問正解になる
+    submissions = pd.DataFrame([
+        dict({'番号': str(student)}, **dict(pairs)) for student, (_, pairs) in enumerate(answer_keys, start=1)
+    ])
+    student_stats, _, details = grade_submissions(settings, BASE_SEED, submissions)
+    assert student_stats['番号'].tolist() == [1, 2, 3, 4]
+    assert (student_stats['正解数'] == student_stats['問題数']).all()
+
+    # 採点で作り直した正解から、ZIPと同じ解答のPDFができる
+    regenerated = [
+        (title, list(zip(group['ばんごう'].astype(str), group['せいかい'])))
+        for (title, _), (_, group) in zip(answer_keys, details.groupby('番号'))
+    ]
+    output = io.BytesIO()
+    create_answer_key_pdf(regenerated, output)
+    assert output.getvalue() == answer_key_pdf
+
+
+def test_answer_keys_from_process_pool_match_serial(monkeypatch, fresh_answer_keys):
+    settings = bundle.bundle_settings(variant_settings(problem_type=4))
+    students = [3, 1, 2, 3]
+    serial = grading.AnswerKeyCache().get_many('serial', settings, BASE_SEED, students)
+    assert serial[0] == serial[3]
+
+    monkeypatch.setattr(grading, 'BUNDLE_WORKER_COUNT', 2)
+    cache = grading.AnswerKeyCache()
+    assert cache.get_many('pool', settings, BASE_SEED, students) == serial
+    assert cache.get('pool', settings, BASE_SEED, 2) == serial[2]
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from history import MAX_HISTORY_STEM_LENGTH, HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path))
+
+
+def test_names_that_sanitise_alike_have_separate_histories(store, tmp_path):
+    histories = [store.get(name) for name in ("a b", "a_b", "a/b")]
+    assert len({history.path for history in histories}) == 3
+
+    histories[0].record([1, 2, 3])
+    store.flush()
+    assert store.get("a b").seen(1) and not store.get("a_b").seen(1)
+    assert len(os.listdir(tmp_path)) == 1
+    assert os.path.dirname(histories[2].path) == str(tmp_path)
+
+
+def test_long_names_are_truncated(store):
+    prefix = "あ" * (MAX_HISTORY_STEM_LENGTH * 2)
+    first, second = store.get(prefix + "1"), store.get(prefix + "2")
+    assert first is not second
+    assert len(os.path.basename(first.path).encode('utf-8')) < 255
+
+    first.record(['key'])
+    first.flush()
+    assert os.path.exists(first.path)
+    assert not second.seen("key")
+
+
+def test_history_survives_reload(tmp_path):
+    history = HistoryStore(str(tmp_path)).get("3年1組")
+    history.record(range(100))
+    history.flush()
+
+    reloaded = HistoryStore(str(tmp_path)).get("3年1組")
+    assert len(reloaded) == 100
+    assert all(reloaded.seen(key) for key in range(100))
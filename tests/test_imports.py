@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 最初の問題生成・PDF描画まで読み込まないモジュール
+HEAVY_MODULES = ('pandas', 'numpy', 'reportlab.platypus')
+
+
+def loaded_modules(statement):
+    """新しいプロセスで statement を実行したあとに読み込まれている重いモジュール"""
+    code = f"import sys; {statement}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def test_import_main_does_not_load_heavy_modules():
+    # Streamlitの版によってはStreamlit自身がpandas・numpyを読み込むので、その分は除く
+    by_streamlit = loaded_modules("import streamlit")
+    assert loaded_modules("import main") - by_streamlit == set()
@@ -0,0 +1,118 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from main import MathProblemGenerator
+from mmap_bank import MMAP_BANK_VERSION, MmapProblemBank, export_problem_bank
+from problem_bank import ProblemBank
+
+FILTER_CASES = [
+    {'operator': "+"},
+    {'operator': "+", 'answer_max': 10, 'carry_max': 0},
+    {'operator': "+", 'term_count': 2, 'carry_min': 1},
+    {'operator': "-", 'answer_min': 1, 'first_min': 5, 'first_max': 9},
+    {'operator': "/", 'has_remainder': 1, 'rest_min': 2, 'rest_max': 4},
+    {'operator': "/", 'has_remainder': 0, 'answer_min': 2.5},
+    {'has_remainder': None},
+]
+
+
+def entry(nums, operator, answer):
+    return nums, operator, answer, f" {operator} ".join(map(str, nums))
+
+
+@pytest.fixture
+def bank(tmp_path):
+    bank = ProblemBank(str(tmp_path / 'bank.sqlite3'))
+    for overrides in ({'add_limit': 3}, {'problem_type': 2}, {'problem_type': 5, 'div_limit': 2}):
+        settings = MathProblemGenerator.default_settings()
+        settings.update(overrides)
+        bank.fill(MathProblemGenerator(settings), tries=2000)
+    bank.add([entry([7, 2], "/", 3.5), entry([4, 5, 6], "+", 15)])
+    return bank
+
+
+@pytest.fixture
+def mmap_dir(tmp_path):
+    directory = tmp_path / 'mmap'
+    directory.mkdir()
+    return str(directory)
+
+
+def snapshot_dirs(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith('snapshot-'))
+
+
+def test_not_exported_yet(mmap_dir):
+    mmap_bank = MmapProblemBank(mmap_dir)
+    assert not mmap_bank.available()
+    assert mmap_bank.revision() is None
+    assert mmap_bank.count(operator="+") == 0
+
+
+@pytest.mark.parametrize('filters', FILTER_CASES)
+def test_masks_match_sqlite_filters(bank, mmap_dir, filters):
+    assert export_problem_bank(bank, mmap_dir) == bank.count()
+    mmap_bank = MmapProblemBank(mmap_dir)
+    assert mmap_bank.count(**filters) == bank.count(**filters)
+
+
+def test_unknown_filter_is_rejected(bank, mmap_dir):
+    export_problem_bank(bank, mmap_dir)
+    with pytest.raises(ValueError):
+        MmapProblemBank(mmap_dir).mask(operand="+")
+
+
+def test_rows_round_trip(bank, mmap_dir):
+    export_problem_bank(bank, mmap_dir)
+    mmap_bank = MmapProblemBank(mmap_dir)
+    indexes = np.arange(bank.count())
+    assert mmap_bank.fetch(indexes) == list(bank.all_rows())
+    answers = {type(row['answer']) for row in mmap_bank.fetch(indexes)}
+    assert answers == {int, float, str}
+
+
+def test_new_export_switches_snapshot(bank, mmap_dir):
+    export_problem_bank(bank, mmap_dir)
+    mmap_bank = MmapProblemBank(mmap_dir)
+    assert mmap_bank.revision() == bank.revision()
+    old_meta, old_arrays = mmap_bank._current()
+    old_count = len(old_arrays['operators'])
+
+    # 書き出し後に追加された問題は、次の書き出しまで見えない
+    bank.add([entry([98, 1], "+", 99)])
+    assert mmap_bank.revision() != bank.revision()
+    assert mmap_bank.count(answer_min=99) == 0
+
+    export_problem_bank(bank, mmap_dir)
+    assert mmap_bank.revision() == bank.revision()
+    assert mmap_bank.count(answer_min=99) == 1
+    assert snapshot_dirs(mmap_dir) == [mmap_bank._current()[0]['snapshot']]
+
+    # 切り替え前に取得した配列は、ファイルが消えても最後まで使える
+    assert old_meta['snapshot'] not in snapshot_dirs(mmap_dir)
+    assert len(old_arrays['operators']) == old_count
+    assert len(MmapProblemBank._fetch(old_arrays, np.arange(old_count))) == old_count
+
+
+def test_other_version_is_ignored(bank, mmap_dir):
+    export_problem_bank(bank, mmap_dir)
+    meta_path = os.path.join(mmap_dir, 'meta.json')
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, version=MMAP_BANK_VERSION + 1), f)
+    assert not MmapProblemBank(mmap_dir).available()
+
+
+def test_worksheet_from_snapshot(bank, mmap_dir):
+    export_problem_bank(bank, mmap_dir)
+    settings = MathProblemGenerator.default_settings()
+    settings.update(problem_type=5, div_limit=2, question_count=15, dedup_commutative=True)
+    generator = MathProblemGenerator(settings)
+    problems_df, answers_df = MmapProblemBank(mmap_dir).build_worksheet(generator)
+    assert len(problems_df) == len(answers_df) == 15
+    assert all(operator == "/" for _, operator in generator.generated_terms)
+    assert len({tuple(nums) for nums, _ in generator.generated_terms}) == 15
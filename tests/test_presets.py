@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import main
+from main import MAX_REGISTERED_PLANS, MathProblemGenerator
+from presets import PresetStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PresetStore(str(tmp_path))
+
+
+def test_save_and_load(store):
+    store.save("九九", {'problem_type': 4}, {'key': 'k', 'coverage': {'*': [[[2, 3], 6]]}})
+    preset = store.load("九九")
+    assert preset['name'] == "九九"
+    assert preset['settings'] == {'problem_type': 4}
+    assert preset['plan']['coverage'] == {'*': [[[2, 3], 6]]}
+    assert store.load("ない") is None
+
+
+def test_list_names_reads_only_metadata(store, tmp_path):
+    store.save("古い", {}, {})
+    store.save("新しい", {}, {})
+    assert store.list_names() == ["新しい", "古い"]
+
+    # 本体（設定と生成プラン）が読めなくても一覧には影響しない
+    for file_name in os.listdir(tmp_path):
+        if file_name.endswith('.json') and not file_name.endswith('.meta.json'):
+            with open(tmp_path / file_name, 'w', encoding='utf-8') as f:
+                f.write('{' * 1000)
+    assert store.list_names() == ["新しい", "古い"]
+    assert store.load("古い") is None
+
+
+def test_names_that_sanitise_alike_do_not_collide(store):
+    store.save("a b", {'x': 1}, {})
+    store.save("a_b", {'x': 2}, {})
+    store.save("a/b", {'x': 3}, {})
+    assert sorted(store.list_names()) == ["a b", "a/b", "a_b"]
+    assert [store.load(name)['settings']['x'] for name in ("a b", "a_b", "a/b")] == [1, 2, 3]
+
+    store.delete("a b")
+    assert sorted(store.list_names()) == ["a/b", "a_b"]
+
+
+def test_bank_is_handed_over_once(store):
+    store.save("セット", {}, {}, bank=[('problems', 'answers')])
+    assert store.take_bank("セット") == [('problems', 'answers')]
+    assert store.take_bank("セット") is None
+    assert store.load("セット") is not None
+
+    # 問題セットなしで保存し直すと、残っていた問題セットは消える
+    store.save("セット2", {}, {}, bank=[1])
+    store.save("セット2", {}, {})
+    assert store.take_bank("セット2") is None
+
+
+def test_registered_plans_are_capped(monkeypatch):
+    monkeypatch.setattr(MathProblemGenerator, '_plans', main.OrderedDict())
+    settings = MathProblemGenerator.default_settings()
+    keys = []
+    for i in range(MAX_REGISTERED_PLANS + 3):
+        generator = MathProblemGenerator(dict(settings, add_max1=10 + i))
+        keys.append(generator.plan_key())
+        MathProblemGenerator.register_plan({'key': keys[-1], 'coverage': {}})
+        # 最初の設定のプランは使われ続けるので残る
+        assert MathProblemGenerator(dict(settings, add_max1=10)).get_plan() is not None
+
+    assert len(MathProblemGenerator._plans) == MAX_REGISTERED_PLANS
+    assert keys[0] in MathProblemGenerator._plans
+    assert keys[1] not in MathProblemGenerator._plans
+    assert keys[-1] in MathProblemGenerator._plans
+
+
+def test_long_names_are_saved(store):
+    prefix = "あ" * 200
+    store.save(prefix + "1", {'x': 1}, {}, bank=[1])
+    store.save(prefix + "2", {'x': 2}, {})
+    assert sorted(store.list_names()) == [prefix + "1", prefix + "2"]
+    assert store.load(prefix + "2")['settings'] == {'x': 2}
+    assert store.take_bank(prefix + "1") == [1]
@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from main import MathProblemGenerator
+from problem_bank import ProblemBank, answer_value
+
+
+def generator_for(**overrides):
+    settings = MathProblemGenerator.default_settings()
+    settings.update(overrides)
+    return MathProblemGenerator(settings)
+
+
+def entry(nums, operator, answer):
+    return nums, operator, answer, f" {operator} ".join(map(str, nums))
+
+
+@pytest.fixture
+def bank(tmp_path):
+    return ProblemBank(str(tmp_path / 'bank.sqlite3'))
+
+
+@pytest.fixture(scope='module')
+def filled_bank(tmp_path_factory):
+    bank = ProblemBank(str(tmp_path_factory.mktemp('bank') / 'bank.sqlite3'))
+    bank.fill(generator_for(add_limit=3, add_max1=20, add_max2=20))
+    bank.fill(generator_for(problem_type=2, sub_limit=2, sub_max1=20, sub_max2=20))
+    bank.fill(generator_for(problem_type=5, div_limit=2, div_coverage=2))
+    return bank
+
+
+def test_answer_value():
+    assert answer_value(7) == 7.0
+    assert answer_value(2.5) == 2.5
+    assert answer_value("7 余り 2") == 7.0
+
+
+def test_add_ignores_duplicate_questions(bank):
+    assert bank.add([entry([3, 5], "+", 8), entry([5, 3], "+", 8)]) == 2
+    assert bank.add([entry([3, 5], "+", 8), entry([9, 2], "/", "4 余り 1")]) == 1
+    assert bank.count() == 3
+    assert bank.revision() == (3, 3)
+
+
+def test_filters_select_rows(bank):
+    bank.add([
+        entry([3, 5], "+", 8),
+        entry([8, 5], "+", 13),
+        entry([12, 3, 9], "+", 24),
+        entry([9, 2], "/", "4 余り 1"),
+        entry([8, 2], "/", 4),
+    ])
+    assert bank.count(operator="+") == 3
+    assert bank.count(operator="+", term_count=2, answer_max=10) == 1
+    assert bank.count(operator="+", carry_min=1) == 2
+    assert bank.count(operator="+", carry_max=0) == 1
+    assert bank.count(operator="+", first_min=8, rest_max=5) == 1
+    assert bank.count(operator="+", rest_min=3, rest_max=5) == 2
+    assert bank.count(operator="+", rest_min=3, rest_max=9) == 3
+    assert bank.count(operator="/", has_remainder=1) == 1
+    assert bank.count(operator="/", answer_min=4, answer_max=4) == 2
+    # Noneの条件は使わない
+    assert bank.count(operator="/", has_remainder=None) == 2
+
+
+def test_unknown_filter_is_rejected(bank):
+    with pytest.raises(ValueError):
+        bank.count(operand="+")
+
+
+def test_fetch_and_sample(bank):
+    bank.add([entry([n, 1], "+", n + 1) for n in range(1, 21)])
+    rows = bank.fetch([3, 1, 99])
+    assert [row['operands'] for row in rows] == [[3, 1], [1, 1]]
+    assert rows[0] == {'operator': "+", 'operands': [3, 1], 'answer': 4, 'carry_count': 0}
+
+    sample = bank.sample(5, random.Random(1), operator="+", answer_max=10)
+    assert len(sample) == 5
+    assert len({tuple(row['operands']) for row in sample}) == 5
+    assert all(row['answer'] <= 10 for row in sample)
+    assert len(bank.sample(100, operator="+", answer_max=10)) == 9
+
+
+@pytest.mark.parametrize('overrides', [
+    {},
+    {'add_limit': 2, 'add_max1': 20, 'add_max2': 20},
+    {'add_limit': 3, 'add_max1': 20, 'add_max2': 20, 'carry_mode': 2},
+    {'add_limit': 3, 'add_max1': 20, 'add_max2': 20, 'carry_mode': 3},
+    {'problem_type': 2, 'sub_limit': 2, 'sub_max1': 20, 'sub_max2': 20, 'value_limit_enabled': 2, 'value_min': -3,
+     'value_max': 5},
+    {'problem_type': 3, 'sub_limit': 1},
+    {'problem_type': 5, 'div_limit': 2},
+    {'problem_type': 5, 'div_limit': 2, 'value_limit_enabled': 2, 'value_min': 2, 'value_max': 6},
+])
+def test_worksheet_matches_generator_conditions(filled_bank, overrides):
+    from candidates import CandidateBlock
+
+    generator = generator_for(question_count=20, **overrides)
+    problems_df, answers_df = filled_bank.build_worksheet(generator)
+    assert 0 < len(problems_df) <= 20
+    assert len(answers_df) == len(problems_df)
+
+    # 抽出した問題は、その場で生成するときの条件もすべて満たす
+    for nums, operator in generator.generated_terms:
+        block = CandidateBlock(generator.settings, operator, [nums], adjust_division=False)
+        assert block.valid.tolist() == [True], (nums, operator)
+    if overrides.get('carry_mode') == 2:
+        assert all(a % 10 + b % 10 < 10 for (a, b), _ in generator.generated_terms)
+
+
+def test_worksheet_without_duplicates_when_commutative(filled_bank):
+    generator = generator_for(question_count=200, dedup_commutative=True)
+    filled_bank.build_worksheet(generator)
+    pairs = [tuple(sorted(nums)) for nums, _ in generator.generated_terms]
+    assert len(pairs) == len(set(pairs)) > 0
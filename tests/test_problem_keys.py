@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from problem_keys import OPERAND_LIMIT, OPERATOR_CODES, pack_problem_key, unique_problem_indexes
+
+
+def unique_rows(problems, commutative):
+    """(オペランド, 演算子) の一覧を unique_problem_indexes の入力にして呼ぶ"""
+    width = max(len(nums) for nums, _ in problems)
+    operands = np.zeros((len(problems), width), dtype=np.int64)
+    for i, (nums, _) in enumerate(problems):
+        operands[i, :len(nums)] = nums
+    operators = [OPERATOR_CODES[operator] for _, operator in problems]
+    term_counts = [len(nums) for nums, _ in problems]
+    return unique_problem_indexes(operands, operators, term_counts, commutative=commutative).tolist()
+
+
+@pytest.mark.parametrize('operator', ['+', '*'])
+def test_commutative_operators_collapse_only_when_requested(operator):
+    assert pack_problem_key([3, 5], operator) != pack_problem_key([5, 3], operator)
+    assert pack_problem_key([3, 5], operator, commutative=True) == pack_problem_key([5, 3], operator, commutative=True)
+
+    problems = [([3, 5], operator), ([5, 3], operator)]
+    assert unique_rows(problems, commutative=False) == [0, 1]
+    assert unique_rows(problems, commutative=True) == [0]
+
+
+@pytest.mark.parametrize('operator', ['-', '/'])
+def test_non_commutative_operators_never_collapse(operator):
+    assert pack_problem_key([8, 2], operator, commutative=True) != pack_problem_key([2, 8], operator, commutative=True)
+
+    problems = [([8, 2], operator), ([2, 8], operator)]
+    assert unique_rows(problems, commutative=True) == [0, 1]
+
+
+def test_different_operators_never_collapse():
+    keys = {pack_problem_key([6, 3], operator, commutative=True) for operator in OPERATOR_CODES}
+    assert len(keys) == len(OPERATOR_CODES)
+
+    problems = [([6, 3], operator) for operator in OPERATOR_CODES]
+    assert unique_rows(problems, commutative=True) == [0, 1, 2, 3]
+
+
+def test_packed_key_is_unique_across_term_counts():
+    # 0のオペランドを足しても、項数が違えば別のキーになる
+    problems = [[3], [3, 0], [3, 0, 0], [0, 3], [0, 0, 3], [3, 0, 0, 0, 0]]
+    keys = {pack_problem_key(nums, '+') for nums in problems}
+    assert len(keys) == len(problems)
+    # 並べ替えで同じになるのは項数が同じもの同士（[3, 0] と [0, 3]、[3, 0, 0] と [0, 0, 3]）だけ
+    assert len({pack_problem_key(nums, '+', commutative=True) for nums in problems}) == 4
+
+    assert unique_rows([(nums, '+') for nums in problems], commutative=False) == list(range(len(problems)))
+    assert unique_rows([(nums, '+') for nums in problems], commutative=True) == [0, 1, 2, 5]
+
+
+def test_repeated_problems_keep_first_row():
+    problems = [([1, 2], '+'), ([4, 4], '-'), ([1, 2], '+'), ([2, 1], '+'), ([4, 4], '-')]
+    assert unique_rows(problems, commutative=False) == [0, 1, 3]
+    assert unique_rows(problems, commutative=True) == [0, 1]
+
+
+def test_out_of_range_operands_fall_back_to_tuple_keys():
+    assert pack_problem_key([OPERAND_LIMIT, 1], '+') == ('+', OPERAND_LIMIT, 1)
+    assert pack_problem_key([-1, 1], '-') == ('-', -1, 1)
+
+    # 64ビットに詰められない大きさでも行単位で重複を除く
+    problems = [([OPERAND_LIMIT * 4, 1], '+'), ([1, OPERAND_LIMIT * 4], '+'), ([OPERAND_LIMIT * 4, 1], '+')]
+    assert unique_rows(problems, commutative=False) == [0, 1]
+    assert unique_rows(problems, commutative=True) == [0]
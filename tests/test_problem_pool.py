@@ -0,0 +1,124 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import problem_pool
+from main import MathProblemGenerator
+from problem_pool import ProblemPool, block_size, settings_fingerprint
+
+ROWS = 10000
+
+
+def make_block(rows=ROWS):
+    return pd.DataFrame({'a': np.zeros(rows)}), pd.DataFrame({'b': np.zeros(rows)})
+
+
+BLOCK_BYTES = block_size(make_block())
+
+
+class RecordingGenerator:
+    def __init__(self):
+        self.blocks = []
+        self._lock = threading.Lock()
+
+    def __call__(self, settings):
+        block = make_block()
+        with self._lock:
+            self.blocks.append(block)
+        return block
+
+
+def stock(pool, settings):
+    return len(pool._blocks.get(settings_fingerprint(settings), ()))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "時間内に条件を満たさなかった"
+        time.sleep(0.01)
+    # 補充が止まったことを確かめるため、少し待ってからもう一度見る
+    time.sleep(0.05)
+    assert condition()
+
+
+@pytest.fixture
+def settings():
+    return MathProblemGenerator.default_settings()
+
+
+def test_fingerprint_ignores_display_settings(settings):
+    fingerprint = settings_fingerprint(settings)
+    assert settings_fingerprint(dict(settings, header_text="小テスト", font_size=20)) == fingerprint
+    assert settings_fingerprint(dict(settings, print_columns=3, print_show_grid=True)) == fingerprint
+    assert settings_fingerprint(dict(reversed(list(settings.items())))) == fingerprint
+
+    assert settings_fingerprint(dict(settings, add_max1=20)) != fingerprint
+    assert settings_fingerprint(dict(settings, question_count=40)) != fingerprint
+
+
+def test_take_generates_then_refills_in_background(settings):
+    generate = RecordingGenerator()
+    pool = ProblemPool(generate)
+    block = pool.take(settings)
+    assert block_size(block) == BLOCK_BYTES
+
+    wait_for(lambda: stock(pool, settings) == problem_pool.BLOCKS_PER_SETTINGS)
+    assert len(generate.blocks) == 1 + problem_pool.BLOCKS_PER_SETTINGS
+
+    # 表示だけが違う設定は、その場で生成せずに作り置きを取り出す
+    stocked = [stocked_block for stocked_block in generate.blocks if stocked_block is not block]
+    taken = pool.take(dict(settings, header_text="別のタイトル"))
+    assert any(taken is stocked_block for stocked_block in stocked)
+    wait_for(lambda: stock(pool, settings) == problem_pool.BLOCKS_PER_SETTINGS)
+
+
+def test_refill_stops_at_memory_budget(settings):
+    budget = int(BLOCK_BYTES * 2.5)
+    pool = ProblemPool(RecordingGenerator(), memory_budget=budget)
+    pool.take(settings)
+    wait_for(lambda: stock(pool, settings) == 2)
+    assert pool._stock_bytes == 2 * BLOCK_BYTES <= budget
+
+    # 取り出して空きができた分だけ補充する
+    pool.take(settings)
+    wait_for(lambda: stock(pool, settings) == 2)
+    assert pool._stock_bytes <= budget
+
+
+def test_added_blocks_beyond_budget_are_dropped(settings):
+    budget = int(BLOCK_BYTES * 1.5)
+    pool = ProblemPool(RecordingGenerator(), memory_budget=budget)
+    pool.add(settings, [make_block() for _ in range(3)])
+    assert stock(pool, settings) == 1
+    assert pool._stock_bytes == BLOCK_BYTES
+
+
+def test_settings_beyond_tracking_limit_lose_their_stock(settings, monkeypatch):
+    monkeypatch.setattr(problem_pool, 'MAX_TRACKED_SETTINGS', 2)
+    pool = ProblemPool(RecordingGenerator(), memory_budget=BLOCK_BYTES * 100)
+    variants = [dict(settings, add_max1=10 + i) for i in range(3)]
+    for variant in variants:
+        pool.add(variant, [make_block()])
+    assert stock(pool, variants[0]) == 0
+    assert settings_fingerprint(variants[0]) not in pool._blocks
+    wait_for(lambda: pool._stock_bytes == 2 * problem_pool.BLOCKS_PER_SETTINGS * BLOCK_BYTES)
+
+
+def test_failing_settings_are_not_refilled(settings):
+    calls = []
+
+    def generate(settings):
+        calls.append(settings)
+        raise ValueError("生成できない設定")
+
+    pool = ProblemPool(generate)
+    with pytest.raises(ValueError):
+        pool.take(settings)
+    wait_for(lambda: settings_fingerprint(settings) not in pool._blocks)
+    count = len(calls)
+    time.sleep(0.05)
+    assert len(calls) == count
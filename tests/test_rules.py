@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from rules import MAX_RULE_LITERAL, RuleError, compile_rules, parse_rule
+
+VARIABLES = {
+    'a': np.array([3, 8, 12, 15]),
+    'b': np.array([5, 2, 4, 15]),
+    'answer': np.array([8, 10, 16, 30]),
+    'remainder': np.array([0, 0, 1, 0]),
+}
+
+
+def evaluate(line):
+    _, rule, _ = parse_rule(line)
+    return np.broadcast_to(np.asarray(rule(VARIABLES), dtype=bool), (4,)).tolist()
+
+
+@pytest.mark.parametrize('line, expected', [
+    ("answer <= 10", [True, True, False, False]),
+    ("10 < answer <= 20", [False, False, True, False]),
+    ("1 <= a <= 9", [True, True, False, False]),
+    ("a != b", [True, True, True, False]),
+    ("a % 2 == 0 or b == 15", [False, True, True, True]),
+    ("not remainder == 0", [False, False, True, False]),
+    ("answer in [10, 16]", [False, True, True, False]),
+    ("answer not in [10, 16]", [True, False, False, True]),
+    ("a * b > 50 and a // b == 3", [False, False, False, False]),
+    ("-a < -10", [False, False, True, True]),
+    ("答え == 30", [False, False, False, True]),
+    ("余り > 0", [False, False, True, False]),
+    ("answer == 10.0", [False, True, False, False]),
+])
+def test_accepted_rules(line, expected):
+    assert evaluate(line) == expected
+
+
+def test_parse_rule_scope_and_names():
+    scope, _, names = parse_rule("+: answer <= a + 余り")
+    assert scope == "+"
+    assert names == {'answer', 'a', 'remainder'}
+
+    scope, _, names = parse_rule("b > 1")
+    assert scope is None
+    assert names == {'b'}
+
+
+@pytest.mark.parametrize('line', [
+    "a.real > 1",                  # 属性
+    "answer.__class__ == 1",
+    "abs(a) > 1",                  # 関数呼び出し
+    "__import__('os').system('x')",
+    "x > 1",                       # 使えない名前
+    "f > 1",                       # 項の名前の範囲外
+    "answer == 'a'",               # 文字列
+    "a == True",                   # 真偽値
+    "a ** 2 > 10",                 # べき乗
+    "[a for a in b]",
+    "lambda: 1",
+    "a if b else 1",
+    "a[0] > 1",
+    "a is b",
+    "answer in [1, 2, 3]",         # 範囲は2要素
+    "answer in b",
+])
+def test_rejected_unsafe_rules(line):
+    with pytest.raises(RuleError):
+        parse_rule(line)
+
+
+def test_syntax_error_is_rule_error():
+    with pytest.raises(RuleError):
+        parse_rule("answer <=")
+
+
+@pytest.mark.parametrize('line', [
+    "answer == 99999999999999999999",
+    f"answer < {MAX_RULE_LITERAL + 1}",
+    f"a > -{MAX_RULE_LITERAL + 1}",
+    "answer in [0, 1e400]",
+    "answer < 1e13",
+])
+def test_large_literals_are_rejected_at_parse_time(line):
+    with pytest.raises(RuleError):
+        parse_rule(line)
+
+
+def test_largest_literal_is_accepted():
+    assert evaluate(f"answer < {MAX_RULE_LITERAL}") == [True] * 4
+    assert evaluate(f"a * {MAX_RULE_LITERAL} > 0") == [True] * 4
+
+
+def test_compile_rules_combines_lines():
+    rule_set = compile_rules(("", "# コメント", "+: answer <= 10", "-: a > b", "remainder == 0"))
+    assert len(rule_set.rules) == 3
+    assert rule_set.names == {'answer', 'a', 'b', 'remainder'}
+    assert rule_set.mask("+", VARIABLES, 4).tolist() == [True, True, False, False]
+    assert rule_set.mask("-", VARIABLES, 4).tolist() == [False, True, False, False]
+    assert rule_set.mask("*", VARIABLES, 4).tolist() == [True, True, False, True]
+
+
+def test_rules_using_missing_names_match_nothing():
+    rule_set = compile_rules(("c > 0",))
+    assert rule_set.mask("+", VARIABLES, 4).tolist() == [False] * 4
+
+
+def test_compile_rules_rejects_any_bad_line():
+    assert not compile_rules(())
+    with pytest.raises(RuleError):
+        compile_rules(("answer <= 10", "open('x')"))
@@ -0,0 +1,125 @@
+import io
+import os
+import stat
+
+import pandas as pd
+import pytest
+
+from session_store import ArtifactRegistry, estimate_size
+
+KB = 1024
+
+
+def make_registry(tmp_path, session_budget=100 * KB, global_budget=1000 * KB, **options):
+    return ArtifactRegistry(session_budget, global_budget, spill_parent_dir=str(tmp_path), **options)
+
+
+def spilled_files(registry):
+    return sorted(os.listdir(registry.spill_dir))
+
+
+def test_estimate_size_of_plain_values():
+    assert estimate_size(b'x' * 5000) == 5000
+    assert estimate_size(io.BytesIO(b'x' * 7000)) == 7000
+    assert estimate_size('あ' * 10000) >= 20000
+    df = pd.DataFrame({'もんだい': ['1 + 2'] * 1000})
+    assert estimate_size(df) == int(df.memory_usage(deep=True).sum())
+
+
+def test_estimate_size_counts_nested_contents():
+    data = b'x' * 50 * KB
+    artifact = {'key': ('a', 1), 'data': data, 'file_name': "計算プリント.xlsx"}
+    assert estimate_size(artifact) > len(data)
+    assert estimate_size([data, [data]]) > 2 * len(data)
+    assert estimate_size({'html': 'x' * 50 * KB}) > 50 * KB
+    assert estimate_size({'df': pd.DataFrame({'a': range(10000)})}) > 80000
+
+
+def test_spill_dir_is_private(tmp_path):
+    registry = make_registry(tmp_path)
+    assert os.path.dirname(registry.spill_dir) == str(tmp_path)
+    assert stat.S_IMODE(os.stat(registry.spill_dir).st_mode) == 0o700
+
+
+def test_values_within_budget_stay_in_memory(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.put('s1', 'pdf', io.BytesIO(b'x' * 30 * KB))
+    registry.put('s1', 'export', {'data': b'y' * 30 * KB})
+    assert spilled_files(registry) == []
+    assert registry.get('s1', 'export')['data'] == b'y' * 30 * KB
+
+
+def test_dict_artifact_counts_against_session_budget(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.put('s1', 'problems_df', pd.DataFrame({'a': range(1000)}))
+    # 辞書の中の大きなバイト列も数えるので、予算を超えて古い生成物が退避される
+    registry.put('s1', 'export', {'data': b'x' * 120 * KB, 'file_name': 'a.xlsx'})
+    registry.put('s1', 'print_html', {'key': (), 'data': b'y' * 60 * KB})
+    assert len(spilled_files(registry)) == 2
+    assert registry.get('s1', 'export')['data'] == b'x' * 120 * KB
+
+
+def test_oldest_artifacts_spill_first_and_read_back(tmp_path):
+    registry = make_registry(tmp_path)
+    for name in ('a', 'b', 'c'):
+        registry.put('s1', name, b'x' * 40 * KB)
+    assert spilled_files(registry) == ['s1_a.pkl']
+
+    # 退避したものは読み出すとメモリに戻り、代わりに最も古いものが退避される
+    assert registry.get('s1', 'a') == b'x' * 40 * KB
+    assert spilled_files(registry) == ['s1_a.pkl', 's1_b.pkl']
+    assert registry.get('s1', 'missing', 'default') == 'default'
+
+
+def test_sessions_have_separate_budgets(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.put('s1', 'pdf', b'x' * 90 * KB)
+    registry.put('s2', 'pdf', b'y' * 90 * KB)
+    assert spilled_files(registry) == []
+    registry.put('s2', 'export', {'data': b'z' * 20 * KB})
+    assert spilled_files(registry) == ['s2_pdf.pkl']
+    assert registry.get('s1', 'pdf') == b'x' * 90 * KB
+
+
+def test_global_budget_spills_other_sessions(tmp_path):
+    registry = make_registry(tmp_path, global_budget=150 * KB)
+    registry.put('s1', 'pdf', b'x' * 80 * KB)
+    registry.put('s2', 'pdf', b'y' * 80 * KB)
+    assert spilled_files(registry) == ['s1_pdf.pkl']
+    assert registry.get('s2', 'pdf') == b'y' * 80 * KB
+
+
+def test_replace_and_delete_release_memory(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.put('s1', 'pdf', b'x' * 80 * KB)
+    registry.put('s1', 'pdf', b'y' * 80 * KB)
+    assert spilled_files(registry) == []
+    registry.put('s1', 'old', b'z' * 40 * KB)
+    assert spilled_files(registry) == ['s1_pdf.pkl']
+    registry.delete('s1', 'pdf')
+    assert spilled_files(registry) == []
+    assert not registry.contains('s1', 'pdf')
+
+
+def test_idle_sessions_are_evicted(tmp_path, monkeypatch):
+    import session_store
+
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, 'time', lambda: now[0])
+    registry = make_registry(tmp_path, idle_timeout=600)
+    registry.put('idle', 'pdf', b'x' * 120 * KB)
+    registry.put('idle', 'small', b'y')
+    assert spilled_files(registry) == ['idle_pdf.pkl']
+
+    now[0] += session_store.SESSION_SWEEP_INTERVAL + 601
+    registry.put('active', 'pdf', b'z')
+    assert not registry.contains('idle', 'small')
+    assert spilled_files(registry) == []
+    assert registry.contains('active', 'pdf')
+
+
+@pytest.mark.parametrize('value', [b'', {}, [], None])
+def test_small_values_round_trip(tmp_path, value):
+    registry = make_registry(tmp_path)
+    registry.put('s1', 'v', value)
+    assert registry.get('s1', 'v') == value
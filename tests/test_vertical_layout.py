@@ -0,0 +1,108 @@
+import io
+import re
+
+import pytest
+
+from main import MathProblemGenerator
+from output_formatter import LAYOUT_VERTICAL
+from vertical_layout import VERTICAL_MAX_COLUMNS, parse_question, vertical_layout
+
+
+@pytest.mark.parametrize('question, expected', [
+    ("12 + 34", ([12, 34], "+")),
+    ("20 - 3 - 4", ([20, 3, 4], "-")),
+    ("12 × 3", ([12, 3], "*")),
+    ("17 ÷ 5", ([17, 5], "/")),
+    ("12 - 3 × 2", None),
+    ("12 +", None),
+    ("1.5 + 2", None),
+    ("-3 + 5", None),
+])
+def test_parse_question(question, expected):
+    assert parse_question(question) == expected
+
+
+def test_addition_layout():
+    layout = vertical_layout("95 + 7")
+    assert (layout.columns, layout.rows) == (3, 3)
+    assert layout.runs == [(0, 1, "95"), (1, 2, "7")]
+    assert layout.symbols == [(1, 0, "+")]
+    assert layout.rules == [(1, 0, 3)]
+    # 繰り上がって増えた桁は記号の列に書き、マス目の大きさは変えない
+    assert layout.answer_runs == [(2, 0, "102")]
+    assert layout.shape == vertical_layout("12 + 3").shape
+
+
+def test_subtraction_with_several_terms():
+    layout = vertical_layout("50 - 12 - 3")
+    assert layout.rows == 4
+    assert layout.symbols == [(1, 0, "−"), (2, 0, "−")]
+    assert layout.answer_runs == [(3, 1, "35")]
+    assert vertical_layout("3 - 5") is None
+
+
+def test_multiplication_layout():
+    layout = vertical_layout("23 × 4")
+    assert (layout.columns, layout.rows) == (3, 3)
+    assert layout.answer_runs == [(2, 1, "92")]
+
+    # かける数が2けたなら部分積の行と2本目の線
+    layout = vertical_layout("23 × 45")
+    assert layout.rows == 5
+    assert layout.rules == [(1, 0, 5), (3, 0, 5)]
+    assert layout.answer_runs == [(2, 2, "115"), (3, 2, "92"), (4, 1, "1035")]
+
+
+def test_division_layout():
+    layout = vertical_layout("17 ÷ 5")
+    assert layout.bracket == (1, 1)
+    assert layout.runs == [(1, 0, "5"), (1, 2, "17")]
+    assert layout.answer_runs == [(0, 3, "3"), (3, 3, "2")]
+    assert vertical_layout("17 ÷ 0") is None
+
+
+@pytest.mark.parametrize('question', [
+    "1 + 2 + 3 + 4 + 5 + 6",   # 項が多すぎる
+    "2 × 3 × 4",                # かけ算は2項だけ
+    "1" * VERTICAL_MAX_COLUMNS + " + 1",
+    "12 - 3 × 2",
+])
+def test_questions_without_vertical_layout(question):
+    assert vertical_layout(question) is None
+
+
+def form_names(data):
+    return set(re.findall(rb'/FormXob\.([A-Za-z0-9_.]+)', data))
+
+
+@pytest.mark.parametrize('answer_display', [1, 2])
+def test_vertical_pdf_reuses_forms(formatter, answer_display):
+    formatter.styles['problem_layout'] = LAYOUT_VERTICAL
+    settings = MathProblemGenerator.default_settings()
+    settings.update(question_count=100, answer_display=answer_display)
+    rows = MathProblemGenerator(settings).generate_problem_rows(seed='vertical')
+
+    output = io.BytesIO()
+    formatter.create_pdf_stream([("筆算", rows)], settings, output)
+    data = output.getvalue()
+    assert data.startswith(b'%PDF')
+    assert data.count(b'/Type /Page\n') == formatter.estimate_pages(len(rows), True, settings)
+
+    # 同じマス目の形・同じ数字の並びは1つのフォームを使い回す
+    names = form_names(data)
+    grids = [name for name in names if name.startswith(b'vgrid_')]
+    answer_runs = [name for name in names if name.startswith(b'vrun_a_')]
+    assert 0 < len(grids) <= 2
+    assert len(names) < len(rows)
+    assert bool(answer_runs) == (answer_display == 1)
+
+
+def test_vertical_pdf_writes_other_problems_across(formatter):
+    formatter.styles['problem_layout'] = LAYOUT_VERTICAL
+    settings = MathProblemGenerator.default_settings()
+    settings.update(problem_type=MathProblemGenerator.EXPRESSION_TYPE, term_count=3, question_count=12)
+    rows = MathProblemGenerator(settings).generate_problem_rows(seed='expr')
+
+    output = io.BytesIO()
+    formatter.create_pdf_stream([("計算の順序", rows)], settings, output)
+    assert not [name for name in form_names(output.getvalue()) if name.startswith(b'vgrid_')]
@@ -0,0 +1,139 @@
+import functools
+from typing import List, Optional, Tuple
+
+# 問題文の演算子の記号 → 演算子
+QUESTION_OPERATORS = {"+": "+", "-": "-", "×": "*", "÷": "/"}
+
+# 筆算で書く演算子の記号
+VERTICAL_SYMBOLS = {"+": "+", "-": "−", "*": "×"}
+
+# 1つの筆算に使えるマス目の数（これに収まらない問題は横書きで描く）
+VERTICAL_MAX_COLUMNS = 8
+VERTICAL_MAX_ROWS = 8
+
+# 筆算を書く問題の最大の項数（足し算・引き算だけ3項以上を縦に並べる）
+VERTICAL_MAX_TERMS = 5
+
+
+class VerticalLayout:
+    """1問分の筆算のマス目の配置（行は上から、列は左から数える）
+
+    runs は問題の数字の並び (行, 左端の列, 文字列)、answer_runs は答え（解答を
+    表示するときだけ描く）、symbols は演算子の記号 (行, 列, 記号)、rules は行の下に
+    引く線 (行, 左端の列, 右端の列)、bracket はわり算の「)」を書くマス (行, 列)。
+    マス目・記号・線の形が同じ問題は shape が等しくなり、描画済みの図形を使い回せる。
+    """
+
+    def __init__(self, columns: int, rows: int):
+        self.columns = columns
+        self.rows = rows
+        self.runs: List[Tuple[int, int, str]] = []
+        self.answer_runs: List[Tuple[int, int, str]] = []
+        self.symbols: List[Tuple[int, int, str]] = []
+        self.rules: List[Tuple[int, int, int]] = []
+        self.bracket: Optional[Tuple[int, int]] = None
+
+    def put(self, row: int, right: int, text: str, answer: bool = False) -> None:
+        """文字列を右端の列をそろえて置く（1文字1マス）"""
+        (self.answer_runs if answer else self.runs).append((row, right - len(text), text))
+
+    @property
+    def shape(self) -> Tuple:
+        return self.columns, self.rows, tuple(self.symbols), tuple(self.rules), self.bracket
+
+    def fits(self) -> bool:
+        return self.columns <= VERTICAL_MAX_COLUMNS and self.rows <= VERTICAL_MAX_ROWS
+
+
+def parse_question(question: str) -> Optional[Tuple[List[int], str]]:
+    """「12 + 34」の形の問題文を (数, 演算子) にする（演算子が混ざる式などはNone）"""
+    tokens = str(question).split()
+    if len(tokens) < 3 or len(tokens) % 2 == 0:
+        return None
+    symbols = set(tokens[1::2])
+    if len(symbols) != 1 or not symbols <= QUESTION_OPERATORS.keys():
+        return None
+    if not all(token.isdigit() for token in tokens[0::2]):
+        return None
+    return [int(token) for token in tokens[0::2]], QUESTION_OPERATORS[symbols.pop()]
+
+
+def _stacked_layout(nums: List[int], operator: str) -> Optional[VerticalLayout]:
+    """足し算・引き算: 数を縦に並べ、線の下に答え
+
+    マス目の幅は数の桁数で決め、繰り上がって1桁増えた答えは記号の列にはみ出して書く
+    （答えの桁数でマス目が変わって、繰り上がりがあることが分からないように）。
+    """
+    answer = nums[0] + sum(nums[1:]) if operator == "+" else nums[0] - sum(nums[1:])
+    if answer < 0:
+        return None
+    width = max(len(str(num)) for num in nums) + 1
+    layout = VerticalLayout(width, len(nums) + 1)
+    layout.put(0, width, str(nums[0]))
+    for row, num in enumerate(nums[1:], start=1):
+        layout.symbols.append((row, 0, VERTICAL_SYMBOLS[operator]))
+        layout.put(row, width, str(num))
+    layout.rules.append((len(nums) - 1, 0, width))
+    layout.put(len(nums), width, str(answer), answer=True)
+    return layout
+
+
+def _multiplication_layout(a: int, b: int) -> VerticalLayout:
+    """かけ算: かける数が2けた以上なら、部分積を書く行と2本目の線を用意する"""
+    product = a * b
+    width = max(len(str(a)), len(str(b)), len(str(product))) + 1
+    partial_rows = len(str(b)) if b >= 10 else 0
+    layout = VerticalLayout(width, 3 + partial_rows)
+    layout.put(0, width, str(a))
+    layout.symbols.append((1, 0, VERTICAL_SYMBOLS["*"]))
+    layout.put(1, width, str(b))
+    layout.rules.append((1, 0, width))
+    if partial_rows:
+        for i, digit in enumerate(reversed(str(b))):
+            layout.put(2 + i, width - i, str(a * int(digit)), answer=True)
+        layout.rules.append((1 + partial_rows, 0, width))
+    layout.put(layout.rows - 1, width, str(product), answer=True)
+    return layout
+
+
+def _division_layout(a: int, b: int) -> Optional[VerticalLayout]:
+    """わり算: 1行目に商、2行目に「わる数 ) わられる数」、その下に引き算の行"""
+    if b == 0:
+        return None
+    divisor, dividend = str(b), str(a)
+    quotient, remainder = divmod(a, b)
+    width = len(divisor) + 1 + len(dividend)
+    # 商のけたごとに「かけた数」と「ひいた残り」の2行（マス目に収まる分だけ）
+    steps = len(str(quotient))
+    layout = VerticalLayout(width, min(2 + 2 * steps, VERTICAL_MAX_ROWS))
+    layout.bracket = (1, len(divisor))
+    layout.put(1, len(divisor), divisor)
+    layout.put(1, width, dividend)
+    layout.rules.append((0, len(divisor), width))
+    for row in range(2, layout.rows - 1, 2):
+        layout.rules.append((row, len(divisor) + 1, width))
+    layout.put(0, width, str(quotient), answer=True)
+    layout.put(layout.rows - 1, width, str(remainder), answer=True)
+    return layout
+
+
+@functools.lru_cache(maxsize=4096)
+def vertical_layout(question: str) -> Optional[VerticalLayout]:
+    """問題文から筆算の配置を作る（筆算にできない・マス目に収まらない問題はNone）
+
+    足し算・引き算は項をすべて縦に並べ、かけ算・わり算は2項の問題だけを筆算にする。
+    同じ問題文は2回目以降キャッシュを使う。
+    """
+    parsed = parse_question(question)
+    if parsed is None:
+        return None
+    nums, operator = parsed
+    if operator in ("+", "-"):
+        layout = _stacked_layout(nums, operator) if len(nums) <= VERTICAL_MAX_TERMS else None
+    elif len(nums) != 2:
+        layout = None
+    elif operator == "*":
+        layout = _multiplication_layout(*nums)
+    else:
+        layout = _division_layout(*nums)
+    return layout if layout is not None and layout.fits() else None